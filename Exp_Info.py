@@ -2,10 +2,16 @@
 FIle containing the Exp_Info class and all its methods.
 This class is used to merge the settings of the experiment with the data from Flydra
 """
+import os
+import types
 import numpy as np
 import matplotlib.pyplot as plt
 import logging
 import yaml
+from trajectories import TrajectoryIndex
+from kinematics import compute_kinematics, UPWIND_DIR, KIN_RANGES
+from heatmaps import compute_heatmap, compute_all_heatmaps, compute_mean_heatmap, compute_heatmap_series, get_window_edges, get_stim_name, HM_SERIES_WINDOW
+from hm_render import plot_heatmap, save_heatmap, render_heatmap, get_heatmap_info, save_heatmap_data, save_heatmap_series_data, render_heatmap_series
 
 
 #Pick logger
@@ -13,21 +19,66 @@ logger= logging.getLogger(__name__)
 
 
 
+# Narrow dtypes used for the columns of the experiment (the coordinates dtype can be changed with COORD_DTYPE)
+ID_DTYPE= np.uint32
+FR_DTYPE= np.uint32
+TS_DTYPE= np.float64
+COORD_DTYPE= np.float32
+
+
+# Data columns of the experiment saved/exported and the dtype used to save them (None == keep the dtype of the column)
+DATA_COLUMNS= {'ID_List': None, 'FR_List': None, 'TS_List': None, 'X_List': None, 'Y_List': None, 'Z_List': None, 'stim_List': np.uint8}
+# Settings of the experiment (from the exp .yaml file)
+SETTINGS_FIELDS= ('expDate', 'fileName', 'type', 'gender', 'lux', 'clrBASE', 'clrTEST', 'posOdor', 'posClrBASE', 'posClrTEST',
+				'ts_1_StartExp', 'ts_2_CO2', 'ts_3_PostCO2', 'ts_4_EndExp')
+# Version of the files written by Exp_Info.create_yaml_file
+EXPORT_VERSION= 1
+
+
+def get_wt_mask(xList, yList, zList, metaData, keep=None):
+	""" Boolean mask of the (x,y,z) positions inside the WT 3d space (and in keep if given, as the rows recorded during the experiment).
+	Return the mask and the number of points (of keep) outside the limits for each axis
+	"""
+	if keep is None:
+		keep= np.ones(len(xList), bool)
+	inX= (xList >= -metaData['LIM_X']) & (xList <= metaData['LIM_X'])
+	inY= (yList >= -metaData['LIM_Y']) & (yList <= metaData['LIM_Y'])
+	inZ= (zList >= 0) & (zList <= metaData['LIM_Z'])
+	removed= {axis: np.count_nonzero(keep & ~inAxis) for axis, inAxis in (('X', inX), ('Y', inY), ('Z', inZ))}
+	inX&= inY
+	inX&= inZ
+	inX&= keep
+	return inX, removed
+
+
+def parse_position(pos):
+	""" Cue/odor position from the settings file (list of strings) as an array of floats
+	"""
+	return np.array([float(p) for p in pos], dtype=float)
+
+
 class Exp_Info:
-	def __init__(self, obj):
+	__slots__= ('expDate', 'fileName', 'type', 'gender', 'lux', 'clrBASE', 'clrTEST', 'posOdor', 'posClrBASE', 'posClrTEST',
+				'ts_1_StartExp', 'ts_2_CO2', 'ts_3_PostCO2', 'ts_4_EndExp', 'coordDtype', 'ySign',
+				'ID_List', 'FR_List', 'X_List', 'Y_List', 'Z_List', 'TS_List', 'stim_List', 'stimRanges', 'heatmaps', 'trajIndex', 'kinematics', 'spatialIndex', 'cuePosToAlign', 'cueConfidence')
+
+	def __init__(self, obj, coordDtype=COORD_DTYPE):
 		self.expDate=obj.expDate
 		self.fileName= obj.fileName
 		self.type=obj.type
 		self.gender= obj.gender
+		self.lux= getattr(obj, 'lux', None)
 		self.clrBASE= obj.clrBASE
 		self.clrTEST= obj.clrTEST
-		self.posOdor= obj.posOdor
-		self.posClrBASE=obj.posClrBASE
-		self.posClrTEST=obj.posClrTEST
+		self.posOdor= parse_position(obj.posOdor)
+		self.posClrBASE=parse_position(obj.posClrBASE)
+		self.posClrTEST=parse_position(obj.posClrTEST)
 		self.ts_1_StartExp=obj.ts_1_StartExp
 		self.ts_2_CO2= obj.ts_2_CO2
 		self.ts_3_PostCO2=obj.ts_3_PostCO2
 		self.ts_4_EndExp=obj.ts_4_EndExp
+		self.coordDtype= np.dtype(coordDtype)	# dtype of X_List, Y_List and Z_List
+		self.ySign= 1			# -1 if the Y positions were mirrored
 		self.ID_List=[]			# List with the OBJ_IDs from H% file
 		self.FR_List=[]			# List with the FRAME number from H5 file
 		self.X_List=[]			# List with the X positions from H% file
@@ -35,7 +86,13 @@ class Exp_Info:
 		self.Z_List=[]			# List with the Z positions from H% file
 		self.TS_List=[]			# List with the TIMESTAMPS values from H% file
 		self.stim_List=[]		# List with the STIM used at that moment (1=='AIR', 2=='CO2' or 3=='PostCO2')
+		self.stimRanges={}		# Rows [start, end) of each STIM (the data is sorted by timestamp)
+		self.heatmaps={}		# Heatmaps (in the fixed WT grid) already computed for each STIM
+		self.trajIndex=None		# Index of the rows by OBJ_ID (TrajectoryIndex), built when it is needed
+		self.kinematics=None	# Speed, heading... of each row (kinematics.compute_kinematics), computed when it is needed
+		self.spatialIndex=None	# Points bucketed in cells (spatial_index.SpatialIndex), built or loaded from the cache when it is needed
 		self.cuePosToAlign=[]
+		self.cueConfidence=None	# Confidence of the test cue position found automatically (cue_detection.detect_cue)
 
 
 	# def __init__(self, d, t, g, baseC):
@@ -65,11 +122,11 @@ class Exp_Info:
 		self.clrTEST= c
 
 	def set_odorPos(self, odor):
-		self.posOdor= odor
+		self.posOdor= parse_position(odor)
 	
 	def set_vCuesPos(self, tc, bc):
-		self.posClrTEST=tc
-		self.posClrBASE=bc
+		self.posClrTEST=parse_position(tc)
+		self.posClrBASE=parse_position(bc)
 
 	def set_ts(self, tsStart, tsCO2, tsPostCO2, tsEnd):
 		self.ts_1_StartExp=tsStart
@@ -78,122 +135,288 @@ class Exp_Info:
 		self.ts_4_EndExp= tsEnd
 
 	def set_h5_information(self, idList, frList, tsList, xList, yList, zList):
-		self.ID_List=idList
-		self.FR_List=frList
-		self.TS_List=tsList
-		self.X_List=xList
-		self.Y_List=yList
-		self.Z_List=zList
+		""" Set the columns with narrow dtypes (no copy if they already have them)
+		"""
+		self.ID_List=np.asarray(idList, dtype=ID_DTYPE)
+		self.FR_List=np.asarray(frList, dtype=FR_DTYPE)
+		self.TS_List=np.asarray(tsList, dtype=TS_DTYPE)
+		self.X_List=np.asarray(xList, dtype=self.coordDtype)
+		self.Y_List=np.asarray(yList, dtype=self.coordDtype)
+		self.Z_List=np.asarray(zList, dtype=self.coordDtype)
+		self.trajIndex=None
+		self.kinematics=None
+		self.spatialIndex=None
+
+	def compact_rows(self, keep):
+		""" Keep only the rows where the boolean mask keep is True (each column is compacted once)
+		"""
+		trajIndex= self.trajIndex
+		self.set_h5_information(self.ID_List[keep], self.FR_List[keep], self.TS_List[keep], self.X_List[keep], self.Y_List[keep], self.Z_List[keep] )
+		if trajIndex is not None:
+			trajIndex.compact(keep, self.ID_List)
+			self.trajIndex= trajIndex
+
+	def mirror_y(self):
+		""" Mirror the Y positions in place (the heatmaps already computed are not valid anymore)
+		"""
+		#The columns loaded from the cache are read-only memory maps: they are copied once
+		if not isinstance(self.Y_List, np.ndarray) or not self.Y_List.flags.writeable:
+			self.Y_List= np.array(self.Y_List, dtype=self.coordDtype)
+		np.negative(self.Y_List, out=self.Y_List)
+		self.ySign= -self.ySign
+		self.heatmaps={}
+		self.kinematics=None
+		if self.trajIndex is not None:
+			self.trajIndex.drop_column('Y_List')
+
+	def get_traj_index(self):
+		""" Index of the rows by OBJ_ID. It is built the first time it is needed
+		"""
+		if self.trajIndex is None:
+			self.trajIndex= TrajectoryIndex(self.ID_List)
+		return self.trajIndex
+
+	def get_trajectory(self, objId, cols=('TS_List', 'X_List', 'Y_List', 'Z_List')):
+		""" Dict {column name: values} with the rows of the trajectory objId (views, no copy). None if objId is not in the exp
+		"""
+		trajIndex= self.get_traj_index()
+		slot= trajIndex.get_slot(objId)
+		if slot < 0:
+			return None
+		rows= trajIndex.get_rows(slot)
+		return {col: trajIndex.get_column(col, getattr(self, col))[rows] for col in cols}
+
+	def iter_trajectories(self, cols=('TS_List', 'X_List', 'Y_List', 'Z_List')):
+		""" Iterate over the trajectories of the exp: (objId, dict {column name: values}) with views of the rows of each one
+		"""
+		trajIndex= self.get_traj_index()
+		columns= {col: trajIndex.get_column(col, getattr(self, col)) for col in cols}
+		for slot, objId in enumerate(trajIndex.ids):
+			rows= trajIndex.get_rows(slot)
+			yield objId, {col: columns[col][rows] for col in cols}
+
+	def get_ts_mask(self, tsList=None):
+		""" Boolean mask of the rows recorded between the start and the end of the experiment (for self.TS_List or tsList)
+		"""
+		if tsList is None:
+			tsList= self.TS_List
+		keep= tsList >= self.ts_1_StartExp
+		keep&= tsList <= self.ts_4_EndExp
+		return keep
+
+	def get_wt_mask(self, metaData, keep=None):
+		""" Boolean mask of the rows with the (x,y,z) position inside the WT 3d space (and in keep if given).
+		Return the mask and the number of points (of keep) outside the limits for each axis
+		"""
+		return get_wt_mask(self.X_List, self.Y_List, self.Z_List, metaData, keep)
 
 	def apply_start_end_ts(self):
 		"""Chop off data recorded from Flydra before and after the experiment duration
 		"""
-		expIdxs= np.where((self.TS_List >= self.ts_1_StartExp) & (self.TS_List <= self.ts_4_EndExp))
-		self.set_h5_information(self.ID_List[expIdxs], self.FR_List[expIdxs], self.TS_List[expIdxs], self.X_List[expIdxs], self.Y_List[expIdxs], self.Z_List[expIdxs] )
+		self.compact_rows(self.get_ts_mask())
 		
 	def erase_pos_outside_wt(self, metaData):
 		"""Delete noisy data recorded outside the wind tunnel test section
 		"""		
-		#Find the indexes for the values inside the limits of the WT (for each axis X,Y,Z)
-		idx= np.where((self.X_List >= -metaData['LIM_X']) & (self.X_List <= metaData['LIM_X']))
-		idy= np.where((self.Y_List >= -metaData['LIM_Y']) & (self.Y_List <= metaData['LIM_Y']))
-		idz= np.where((self.Z_List >= 0) & (self.Z_List <= metaData['LIM_X']))
-		#Intersect these indexes to find the indexes where the (x,y,z) position was inside the WT 
-		tmpXY= np.intersect1d(idx, idy, 1)
-		idXYZinWT= np.intersect1d(tmpXY, idz,1)
+		keep, removed= self.get_wt_mask(metaData)
+		print('  -Points outside the WT for exp %s: X= %s, Y= %s, Z= %s'%(self.expDate, removed['X'], removed['Y'], removed['Z']))
 		#the analysis are done only in the (x,y,z) positions inside the WT 3d space
-		self.set_h5_information(self.ID_List[idXYZinWT], self.FR_List[idXYZinWT], self.TS_List[idXYZinWT], self.X_List[idXYZinWT], self.Y_List[idXYZinWT], self.Z_List[idXYZinWT] )
+		self.compact_rows(keep)
+		return removed
+
+	def clean_data(self, metaData):
+		"""Chop off the data recorded before and after the experiment and outside the wind tunnel test section in one pass
+		"""
+		#The points outside the WT are counted only for the rows recorded during the experiment
+		keep, removed= self.get_wt_mask(metaData, self.get_ts_mask())
+		print('  -Points outside the WT for exp %s: X= %s, Y= %s, Z= %s'%(self.expDate, removed['X'], removed['Y'], removed['Z']))
+		self.compact_rows(keep)
+		return removed
+
+	def sort_by_ts(self):
+		""" Sort the rows by timestamp (Flydra writes them when each trajectory finishes, so they are not always in order)
+		"""
+		if np.all(self.TS_List[1:] >= self.TS_List[:-1]):
+			return
+		order= np.argsort(self.TS_List, kind='stable')
+		self.set_h5_information(self.ID_List[order], self.FR_List[order], self.TS_List[order], self.X_List[order], self.Y_List[order], self.Z_List[order] )
 
 	def set_odor_stim(self):
 		""" Function to fill self.stim_List with the odor used in each frame (1=='AIR', 2=='CO2' or 3=='PostCO2')
+		and self.stimRanges with the rows of each odor. The rows are sorted by timestamp first, so each odor is a contiguous block
+		"""
+		self.sort_by_ts()
+		limits= np.searchsorted(self.TS_List, [self.ts_1_StartExp, self.ts_2_CO2, self.ts_3_PostCO2])
+		limits= np.append(limits, np.searchsorted(self.TS_List, self.ts_4_EndExp, side='right'))
+		self.stim_List= np.zeros(len(self.TS_List), dtype=np.uint8)
+		for option in range(1,4):
+			self.stimRanges[option]= (int(limits[option-1]), int(limits[option]))
+			self.stim_List[limits[option-1]:limits[option]]= option
+		if limits[0] != 0 or limits[-1] != len(self.TS_List):
+			logger.error('ERROR! indexes sizes pero each odor stim do not match the stim_list size')
+
+	def label_stim(self, tsList):
+		""" Odor stim (1=='AIR', 2=='CO2' or 3=='PostCO2') of each timestamp in tsList (already trimmed to the experiment duration).
+		tsList doesn't need to be sorted, so it can be used on chunks of data
+		"""
+		return (np.searchsorted([self.ts_2_CO2, self.ts_3_PostCO2], tsList, side='right') + 1).astype(np.uint8)
+
+	def set_stim_ranges(self):
+		""" Fill self.stimRanges from self.stim_List (used when stim_List was loaded already set, as from the cache)
+		"""
+		limits= np.searchsorted(self.stim_List, [1, 2, 3, 4])
+		for option in range(1,4):
+			self.stimRanges[option]= (int(limits[option-1]), int(limits[option]))
+
+	def get_stim_rows(self, option):
+		""" Slice with the rows for the odor stim option. Indexing the columns with it returns views (no copy)
+		"""
+		start, end= self.stimRanges.get(option, (0,0))
+		return slice(start, end)
+
+	def save_columns(self, dirPath):
+		""" Save each data column as a .npy file in dirPath (they can be loaded back as memory maps)
+		"""
+		os.makedirs(dirPath, exist_ok=True)
+		for col, dtype in DATA_COLUMNS.items():
+			np.save(os.path.join(dirPath, col+'.npy'), np.asarray(getattr(self, col), dtype=dtype))
+
+	def load_columns(self, dirPath, mmapMode='r'):
+		""" Load the data columns saved with save_columns (as read-only memory maps by default, so nothing is copied)
+		"""
+		self.set_columns({col: np.load(os.path.join(dirPath, col+'.npy'), mmap_mode=mmapMode) for col in DATA_COLUMNS})
+
+	def set_columns(self, columns):
+		""" Set the data columns already preprocessed (dict {column: array}, used as they are: memory maps or slices are not copied)
 		"""
+		for col in DATA_COLUMNS:
+			setattr(self, col, columns[col])
+		self.trajIndex=None
+		self.kinematics=None
+		self.spatialIndex=None
+		self.set_stim_ranges()
 
-		self.stim_List= np.empty(len(self.ID_List), dtype=object)
-		tmpAir= np.where((self.TS_List >= self.ts_1_StartExp) & (self.TS_List < self.ts_2_CO2))
-		tmpCo2= np.where((self.TS_List >= self.ts_2_CO2) & (self.TS_List < self.ts_3_PostCO2))
-		tmpPost= np.where((self.TS_List >= self.ts_3_PostCO2) & (self.TS_List <= self.ts_4_EndExp))
-		if len(tmpAir[0]) + len(tmpCo2[0]) + len(tmpPost[0]) == len(self.stim_List):
-			self.stim_List[tmpAir[0]]= 1
-			self.stim_List[tmpCo2[0]]= 2
-			self.stim_List[tmpPost[0]]= 3
-		else:
-			logger.ERROR('ERROR! indexes sizes pero each odor stim do not match the stim_list size')
-
-	def create_yaml_file(self):
-		""" Create a yaml file containing the data of the current experiment object
+	def get_header(self):
+		""" Settings of the experiment and description of its columns as plain types (to be saved as yaml)
+		"""
+		header= {field: getattr(self, field) for field in SETTINGS_FIELDS}
+		for field in ('posOdor', 'posClrBASE', 'posClrTEST'):
+			header[field]= [float(p) for p in header[field]]
+		header['ySign']= self.ySign
+		header['nRows']= len(self.TS_List)
+		header['columns']= {col: str(np.asarray(getattr(self, col)).dtype) for col in DATA_COLUMNS}
+		header['version']= EXPORT_VERSION
+		return header
+
+	def create_yaml_file(self, outPath=''):
+		""" Export the preprocessed experiment: a small yaml file with the settings (header) and a folder
+		with one .npy file per column, named clrTEST_type_expDate_data(.yaml). It can be loaded back with load_exp_file
 		"""
 		try: 
-			fileName= self.clrTEST+'_'+self.type+'_'+self.expDate+'_data.yaml'
+			fileName= outPath+self.clrTEST+'_'+self.type+'_'+self.expDate+'_data.yaml'
+			self.save_columns(fileName[:-len('.yaml')])
+			#The header is written last, so a file with header always has all its columns
 			with open(fileName, 'w') as f:
-				#write the exp object  data in the file as yaml. the [34:] index is to avoid writing int he file the line !!python/object:__main__.Exp_Info\n generated by the yam.dump
-				yaml.dump(self, f, default_flow_style= False)
+				yaml.safe_dump(self.get_header(), f, default_flow_style= False)
 			print('Object data for exp %s saved in object: %s'%(self.expDate, fileName))
 		except Exception as e:
 			print('ERROR while saving data preprocessed in: %s --> %s'%(fileName, e))
 			
 
-	def generate_heatmap(self, option, metaData):
-		# create heatmap
-		if (option == 1): stim= 'AIR'
-		elif (option == 2): stim='CO2'
-		else: stim= 'PostCO2'
-	
-		i= np.where(self.stim_List == option)
-		nbins= (600,200)
-		heatmapXY, xedges, yedges= np.histogram2d(self.X_List[i], self.Y_List[i], bins=nbins)
-		extentXY= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-		heatmapXZ,xedges, yedges = np.histogram2d(self.X_List[i], self.Z_List[i], bins=nbins)
-		extentXZ= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-		
-		# The height of each bar is the relative number of observations, 
-		# (Number of observations in bin / Total number of observations). The sum of the bar heights is 1.
+	def get_heatmap(self, option, metaData):
+		""" Heatmaps of the odor stim option in the fixed WT grid. They are computed once and stored in self.heatmaps
+		"""
+		if option not in self.heatmaps:
+			i= self.get_stim_rows(option)
+			self.heatmaps[option]= compute_heatmap(self.X_List[i], self.Y_List[i], self.Z_List[i], metaData)
+		return self.heatmaps[option]
+
+	def get_kinematics(self, metaData):
+		""" Kinematics of each row ({name: array}, see kinematics.KINEMATICS). They are computed once for all the rows
+		"""
+		if self.kinematics is None:
+			self.kinematics= compute_kinematics(self.get_traj_index(), self.ID_List, self.FR_List, self.TS_List, self.X_List, self.Y_List,
+												self.Z_List, metaData.get('UPWIND_DIR', UPWIND_DIR))
+		return self.kinematics
+
+	def get_kinematics_heatmap(self, name, option, metaData):
+		""" Heatmaps of the mean kinematic value name (speed, heading...) per bin for the odor stim option. They are stored in
+		self.heatmaps with the key (option, name)
+		"""
+		if (option, name) not in self.heatmaps:
+			i= self.get_stim_rows(option)
+			values= self.get_kinematics(metaData)[name][i]
+			self.heatmaps[(option, name)]= compute_mean_heatmap(self.X_List[i], self.Y_List[i], self.Z_List[i], values, metaData)
+		return self.heatmaps[(option, name)]
+
+	def generate_kinematics_heatmap(self, name, option, metaData):
+		""" Save the heatmap of the mean kinematic value name for the odor stim option (never shown)
+		"""
+		stim= get_stim_name(option)
+		hmResult= self.get_kinematics_heatmap(name, option, metaData)
+		vmin, vmax= metaData.get('KIN_RANGES', {}).get(name, KIN_RANGES[name])
+		fig= plot_heatmap(hmResult, self.clrTEST, self.clrBASE, stim+' '+name, vmax, useFigManager=False, vmin=vmin)
+		figName= 'hm_%s_%s_vs_%s_%s_%s_%s.png'%(self.expDate, self.clrBASE,self.clrTEST, option, stim, name)
+		save_heatmap(fig, figName, metaData)
+
+	def get_stim_limits(self, option):
+		""" Timestamps of the start and the end of the odor stim option
+		"""
+		limits= (self.ts_1_StartExp, self.ts_2_CO2, self.ts_3_PostCO2, self.ts_4_EndExp)
+		return limits[option-1], limits[option]
+
+	def get_heatmap_series(self, option, metaData):
+		""" Heatmaps of the consecutive time windows (HM_SERIES_WINDOW s) of the odor stim option, computed in one pass over
+		its rows. They are stored in self.heatmaps with the key (option, 'series')
+		"""
+		if (option, 'series') not in self.heatmaps:
+			i= self.get_stim_rows(option)
+			windowEdges= get_window_edges(*self.get_stim_limits(option), metaData.get('HM_SERIES_WINDOW', HM_SERIES_WINDOW))
+			self.heatmaps[(option, 'series')]= compute_heatmap_series(self.TS_List[i], self.X_List[i], self.Y_List[i], self.Z_List[i], windowEdges, metaData)
+		return self.heatmaps[(option, 'series')]
+
+	def generate_heatmap_series(self, option, metaData):
+		""" Save the heatmap series of the odor stim option (.npz) and its animation if HM_SERIES_VIDEO is set (never shown)
+		"""
+		stim= get_stim_name(option)
+		series= self.get_heatmap_series(option, metaData)
 		topValNorm=0.0001
-		normHeatmXY= np.empty(nbins, float)
-		normHeatmXZ= np.empty(nbins, float)
-		countsSumXY= np.sum(heatmapXY)
-		countsSumXZ= np.sum(heatmapXZ)
-		for i in range(nbins[0]):
-			for j in range(nbins[1]):
-#				print('i: %s - j:%s'%(i,j))
-				normHeatmXY[i][j] = float(heatmapXY[i][j]) / countsSumXY 
-				normHeatmXZ[i][j] = float(heatmapXZ[i][j]) / countsSumXZ 
-		normHeatmXY= np.transpose(normHeatmXY)
-		normHeatmXZ= np.transpose(normHeatmXZ)
+		fileName= 'hm_%s_%s_vs_%s_%s_%s_series.npz'%(self.expDate, self.clrBASE,self.clrTEST, option, stim)
+		info= self.get_heatmap_info(option, topValNorm)
+		info['windowSize']= metaData.get('HM_SERIES_WINDOW', HM_SERIES_WINDOW)
+		save_heatmap_series_data(series, fileName, metaData, info)
+		if metaData.get('HM_SERIES_VIDEO'):
+			render_heatmap_series(series, self.clrTEST, self.clrBASE, stim, topValNorm, fileName, metaData, metaData.get('HM_SERIES_CUMULATIVE', False))
+
+	def compute_all_heatmaps(self, metaData):
+		""" Compute the XY, XZ and YZ heatmaps of the 3 odor stim in one pass over the data and store them in self.heatmaps
+		"""
+		self.heatmaps.update(compute_all_heatmaps(self.X_List, self.Y_List, self.Z_List, self.stim_List, metaData))
+
+	def get_heatmap_info(self, option, topValNorm):
+		""" Info saved with the heatmap arrays of the odor stim option (see hm_render.save_heatmap_data)
+		"""
+		return get_heatmap_info(option, self.clrTEST, self.clrBASE, topValNorm, expDate=self.expDate, type=self.type,
+							fileName=self.fileName, ySign=self.ySign)
+
+	def generate_heatmap(self, option, metaData, writer=None):
+		""" Plot (with a figure template, never shown) and save the heatmap of the odor stim option. If writer
+		(io_pipeline.FigureWriter) is given, the figure is plotted and saved in the background
+		"""
+		# create heatmap
+		stim= get_stim_name(option)
+		hmResult= self.get_heatmap(option, metaData)
 		
 		#plot heatmap
-		fig, hm= plt.subplots(nrows=2,ncols=1)
-		hm[0].set_title('heatmap %s vs %s x-y axis with stim= %s'%(self.clrTEST, self.clrBASE, stim))
-		hm[0].set_xlabel('X axis')
-		hm[0].set_ylabel('Y axis')
-		val= hm[0].imshow(normHeatmXY, vmin=0, vmax=topValNorm, extent= extentXY, cmap='jet')
-		hm[0].invert_yaxis()
-		fig.colorbar(val, ax=hm[0])
-
-		hm[1].set_title('heatmap %s vs %s x-z axis with stim= %s'%(self.clrTEST, self.clrBASE, stim))
-		hm[1].set_xlabel('X axis')
-		hm[1].set_ylabel('Z axis')
-		val2= hm[1].imshow(normHeatmXZ, vmin=0, vmax=topValNorm,  extent= extentXZ, cmap='jet')
-		hm[1].invert_yaxis()
-		hm[1].set_ylim([0,0.6])		
-		fig.colorbar(val2, ax=hm[1])
-
-		#If you want to show the image uncomment this line
-		plt.show()
-
-		#Save figure
+		topValNorm=0.0001
 		#heatmaps file naming format: 'hm_date_bc_tc_{1-3}_od
-		try:
-			figName= 'hm_%s_%s_vs_%s_%s_%s.png'%(self.expDate, self.clrBASE,self.clrTEST, option, stim)
-			outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
-			fig.savefig(outputPath+figName, dpi= 600)
-		#	logger.info('  -Heatmap: %s saved in path: %s'%(figName,outputPath))
-			print('img %s savd in: %s'%(figName,outputPath))
-		except:
-		#	logger.exception('  -ERROR! while saving img: %s in path: %s'%(figName,outputPath))
-			print('ERROR saving ing')
-
-		#CLose figure
-		plt.close(fig)
+		figName= 'hm_%s_%s_vs_%s_%s_%s.png'%(self.expDate, self.clrBASE,self.clrTEST, option, stim)
+		info= self.get_heatmap_info(option, topValNorm)
+		if writer is not None:
+			writer.submit_heatmap(hmResult, self.clrTEST, self.clrBASE, stim, topValNorm, figName, metaData, info)
+			return
+		#Save figure and heatmap arrays
+		render_heatmap(hmResult, self.clrTEST, self.clrBASE, stim, topValNorm, figName, metaData, info)
 
 
 	def onclick(self, event):
@@ -203,48 +426,12 @@ class Exp_Info:
 	def generate_heatmap_with_UI(self, option, metaData, posToAlign):
 		""" Create a heatmap and allow user to select point in the plot"""
 		# create heatmap
-		if (option == 1): stim= 'AIR'
-		elif (option == 2): stim='CO2'
-		else: stim= 'PostCO2'
-	
-		i= np.where(self.stim_List == option)
-		nbins= (600,200)
-		heatmapXY, xedges, yedges= np.histogram2d(self.X_List[i], self.Y_List[i], bins=nbins)
-		extentXY= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-		heatmapXZ,xedges, yedges = np.histogram2d(self.X_List[i], self.Z_List[i], bins=nbins)
-		extentXZ= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-		
-		# The height of each bar is the relative number of observations, 
-		# (Number of observations in bin / Total number of observations). The sum of the bar heights is 1.
-		topValNorm=0.0001
-		normHeatmXY= np.empty(nbins, float)
-		normHeatmXZ= np.empty(nbins, float)
-		countsSumXY= np.sum(heatmapXY)
-		countsSumXZ= np.sum(heatmapXZ)
-		for i in range(nbins[0]):
-			for j in range(nbins[1]):
-#				print('i: %s - j:%s'%(i,j))
-				normHeatmXY[i][j] = float(heatmapXY[i][j]) / countsSumXY 
-				normHeatmXZ[i][j] = float(heatmapXZ[i][j]) / countsSumXZ 
-		normHeatmXY= np.transpose(normHeatmXY)
-		normHeatmXZ= np.transpose(normHeatmXZ)
+		stim= get_stim_name(option)
+		hmResult= self.get_heatmap(option, metaData)
 		
 		#plot heatmap
-		fig, hm= plt.subplots(nrows=2,ncols=1)
-		hm[0].set_title('heatmap %s vs %s x-y axis with stim= %s'%(self.clrTEST, self.clrBASE, stim))
-		hm[0].set_xlabel('X axis')
-		hm[0].set_ylabel('Y axis')
-		val= hm[0].imshow(normHeatmXY, vmin=0, vmax=topValNorm, extent= extentXY, cmap='jet')
-		hm[0].invert_yaxis()
-		fig.colorbar(val, ax=hm[0])
-
-		hm[1].set_title('heatmap %s vs %s x-z axis with stim= %s'%(self.clrTEST, self.clrBASE, stim))
-		hm[1].set_xlabel('X axis')
-		hm[1].set_ylabel('Z axis')
-		val2= hm[1].imshow(normHeatmXZ, vmin=0, vmax=topValNorm,  extent= extentXZ, cmap='jet')
-		hm[1].invert_yaxis()
-		hm[1].set_ylim([0,0.6])
-		fig.colorbar(val2, ax=hm[1])
+		topValNorm=0.0001
+		fig= plot_heatmap(hmResult, self.clrTEST, self.clrBASE, stim, topValNorm)
 
 		fig.canvas.mpl_connect('button_press_event', self.onclick)
 		fig.show()
@@ -253,14 +440,22 @@ class Exp_Info:
 
 		#Save figure
 		#heatmaps file naming format: 'hm_date_bc_tc_{1-3}_od
-		try:
-			figName= 'hm_%s_%s_%s_vs_%s_%s_%s.png'%(self.type, self.expDate, self.clrBASE,self.clrTEST, option, stim)
-			outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
-			fig.savefig(outputPath+figName, dpi= 600)
-			#logger.info('  -Heatmap: %s saved in path: %s'%(figName,outputPath))
-		except Exception as e:
-			#logger.exception('  -ERROR! while saving img: %s in path: %s'%(figName,outputPath))
-			print('Exp_Info: %s'%e)
+		figName= 'hm_%s_%s_%s_vs_%s_%s_%s.png'%(self.type, self.expDate, self.clrBASE,self.clrTEST, option, stim)
+		save_heatmap(fig, figName, metaData)
+		save_heatmap_data(hmResult, figName, metaData, self.get_heatmap_info(option, topValNorm))
 
 		#CLose figure
-		plt.close(fig)
\ No newline at end of file
+		plt.close(fig)
+
+
+def load_exp_file(fileName, mmapMode='r'):
+	""" Load an experiment exported with Exp_Info.create_yaml_file. The columns are memory maps of the .npy files (no copy)
+	"""
+	with open(fileName, 'r') as f:
+		header= yaml.safe_load(f)
+	exp= Exp_Info(types.SimpleNamespace(**header), header['columns']['X_List'])
+	exp.ySign= header['ySign']
+	exp.load_columns(fileName[:-len('.yaml')], mmapMode)
+	if len(exp.TS_List) != header['nRows']:
+		logger.error('ERROR! %s has %s rows but its header says %s'%(fileName, len(exp.TS_List), header['nRows']))
+	return exp
@@ -2,12 +2,16 @@
 Script to open different heatmaps and align them in funciton of the point selected on the image
 """
 import sys
-import glob
 import yaml
-from Exp_Info import Exp_Info
+from exp_loader import load_expConfig_only, load_exp_data, mirror_exp_for_group
+from exp_cache import clear_cache
+from exp_catalog import select_exp_files
+from heatmaps import sum_heatmaps, shift_heatmap
+from hm_render import render_group_heatmap
+from cue_detection import get_nominal_cue_pos, detect_cue, CUE_MIN_CONFIDENCE
+from cue_review import CueReviewer, load_cue_positions, get_cue_position, set_cue_position
+from io_pipeline import iter_prefetched
 import numpy as np
-import h5py
-import matplotlib.pyplot as plt 
 
 
 
@@ -22,173 +26,138 @@ def load_metaData():
 	except:
 		sys.exit(1)
 
-def find_files_list(path, ext):
-	""" Find all exp configuration files (.yaml files) in folder. They are needed to load their corresponding h5 files later
-	"""
-	return glob.glob(path+'/*'+ext)
-
-def load_expConfig_only(fname, metaData):
-	""" Load the configuration settings of an experiment and its data from FLydra
-	"""
-	try: 
-		with open(fname, 'r') as f:
-			#dataMap= Exp_Info.Exp_Info(yaml.load(f))
-			dataMap= Exp_Info(yaml.load(f, Loader=yaml.FullLoader))
-			print(' Configuration settings for experiment on %s loaded sucessfuly'%dataMap.expDate)
-		return dataMap
-	except Exception as e: 
-		print(' ERROR while loading experiment configuration settings for file: %s'%fname)
-		print(e)
-
-def load_exp_data(exp, metaData):
-	""" Load the data from FLydra for a given experiment
-	"""
-	try:
-		hf=h5py.File(metaData['IN_PATH']+exp.fileName, 'r')
-		#print('file %s loaded'%fname )
-		dataset= hf.get(metaData['DATASET'])
-		dataset= np.array(dataset)
-		#Add the obj_ID, frame, x, y, z and ts to exp
-		exp.set_h5_information(dataset['obj_id'], dataset['frame'], dataset['timestamp'], dataset['x'], dataset['y'], dataset['z'])
-		#Clean the data outside the startExp and endExp
-		exp.apply_start_end_ts()
-		#Remove points outside volume
-		exp.erase_pos_outside_wt(metaData)
-		#set the odor stimulus used in each par of the experiment
-		exp.set_odor_stim()
-		print(' Experiment %s data loaded'%exp.fileName)
-	except:
-		print(' ERROR while loading data for file: %s'%exp.fileName)
-
-
 def align_data_for_heatmaps(expList):
-	tmpX= []
-	tmpY=[]
-	tmpZ=[]
-	tmpStim=[]
+	""" Move each exp heatmap (in whole bins or, with ALIGN_SUBBIN, in fractions of bin) so its test cue is in the position selected
+	by the user and add them in the group heatmap. Only the fixed grid counts of each exp are moved, never its points
+	"""
+	alignedHeatmaps= []
 
 	for exp in expList:
 		if ((exp.cuePosToAlign) and (None not in exp.cuePosToAlign)):
-			xPos= (expMetaData['LIM_X'] - float(exp.posClrTEST[0]))*(-1)
+			#Nominal test cue position in the heatmap coordinates (mirrored as the data)
+			xPos, yPos= get_nominal_cue_pos(exp, expMetaData)
 			deltaX= xPos  - exp.cuePosToAlign[0]
-			deltaY= float(exp.posClrTEST[1]) - exp.cuePosToAlign[1]
+			deltaY= yPos - exp.cuePosToAlign[1]
 		else:
 			deltaX= 0
 			deltaY=0
 
 		option= expMetaData['ODOR']	#option 2 == only CO2
-		odorIndex= np.where(exp.stim_List == option)
-		
-		xAligned= exp.X_List[odorIndex]+deltaX
-		yAligned= exp.Y_List[odorIndex]+deltaY
+		alignedHeatmaps.append(shift_heatmap(exp.get_heatmap(option, expMetaData), deltaX, deltaY, expMetaData.get('ALIGN_SUBBIN', False)))
 
-		tmpX= np.hstack((tmpX, xAligned))
-		tmpY= np.hstack((tmpY, yAligned))
-		tmpZ= np.hstack((tmpZ, exp.Z_List[odorIndex]))
-		tmpStim= np.hstack((tmpStim, exp.stim_List[odorIndex]))
+	return sum_heatmaps(alignedHeatmaps)
 
-	return tmpX, tmpY,tmpZ, tmpStim
 
+def load_align_exp(fname, metaData):
+	""" Load an experiment and mirror it if its TEST Cue is not in the Y axis side used to group (GRP_BY)
+	"""
+	exp= load_expConfig_only(fname, metaData)
+	if ('Pve' in metaData['GRP_BY']) or ('Nve' in metaData['GRP_BY']):
+		# Load the experiment and group it to the other exp with TEST Cue in similar position (the cue positions are mirrored too)
+		load_exp_data(exp, metaData)
+		mirror_exp_for_group(exp, metaData['GRP_BY'])
+	return exp
 
 
-def generate_grp_heatmap_for_dataAligned(xVal, yVal, zVal, stimVal, option, ct, cb, metaData, figName):
-	# create heatmap
-	if (option == 1): stim= 'AIR'
-	elif (option == 2): stim='CO2'
-	else: stim= 'PostCO2'
+def detect_cue_to_align(exp, option, metaData):
+	""" Search the test cue automatically (see cue_detection.detect_cue). exp.cuePosToAlign is set only if the confidence is at
+	least CUE_MIN_CONFIDENCE. Return the position found
+	"""
+	cuePos, exp.cueConfidence= detect_cue(exp.get_heatmap(option, metaData), get_nominal_cue_pos(exp, metaData), metaData)
+	exp.cuePosToAlign= cuePos if exp.cueConfidence >= metaData.get('CUE_MIN_CONFIDENCE', CUE_MIN_CONFIDENCE) else []
+	return cuePos
 
-	nbins= (600,200)
-	heatmapXY, xedges, yedges= np.histogram2d(xVal, yVal, bins=nbins)
-	extentXY= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-	heatmapXZ,xedges, yedges = np.histogram2d(xVal, zVal, bins=nbins)
-	extentXZ= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-	
-	# The height of each bar is the relative number of observations, 
-	# (Number of observations in bin / Total number of observations). The sum of the bar heights is 1.
-	topValNorm=  metaData['NORM'] #0.00008	#0.0001 #
-	normHeatmXY= np.empty(nbins, float)
-	normHeatmXZ= np.empty(nbins, float)
-	countsSumXY= np.sum(heatmapXY)
-	countsSumXZ= np.sum(heatmapXZ)
-	for i in range(nbins[0]):
-		for j in range(nbins[1]):
-#				print('i: %s - j:%s'%(i,j))
-			normHeatmXY[i][j] = float(heatmapXY[i][j]) / countsSumXY 
-			normHeatmXZ[i][j] = float(heatmapXZ[i][j]) / countsSumXZ 
-	normHeatmXY= np.transpose(normHeatmXY)
-	normHeatmXZ= np.transpose(normHeatmXZ)
-	
-	#plot heatmap
-	fig, hm= plt.subplots(nrows=2,ncols=1)
-	hm[0].set_title('heatmap %s vs %s x-y axis with stim= %s'%(ct, cb, stim))
-	hm[0].set_xlabel('X axis')
-	hm[0].set_ylabel('Y axis')
-	val= hm[0].imshow(normHeatmXY, vmin=0, vmax=topValNorm, extent= extentXY, cmap='jet')
-	hm[0].invert_yaxis()
-	#hm[0].set_xlim([-LIM_X, LIM_X])
-	#hm[0].set_ylim([-LIM_Y, LIM_Y])
-	fig.colorbar(val, ax=hm[0])
-
-	hm[1].set_title('heatmap %s vs %s x-z axis with stim= %s'%(ct, cb, stim))
-	hm[1].set_xlabel('X axis')
-	hm[1].set_ylabel('Z axis')
-	val2= hm[1].imshow(normHeatmXZ, vmin=0, vmax=topValNorm,  extent= extentXZ, cmap='jet')
-	hm[1].invert_yaxis()
-	hm[1].set_ylim([0,0.6])	
-	fig.colorbar(val2, ax=hm[1])
-
-	#Save figure
-	#heatmaps file naming format: 'hm_date_bc_tc_{1-3}_od
-	try:
-		figName= figName+'_'+stim+'_'+str(topValNorm)+'.png'
-		outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
-		fig.savefig(outputPath+figName, dpi=600)
-		print('  -Heatmap: %s saved in path: %s'%(figName,outputPath))
-	except:
-		print('  -ERROR! while saving img: %s in path: %s'%(figName,outputPath))
 
-	#CLose figure
-	plt.close(fig)
+def find_cue_to_align(exp, option, metaData, posToAlign, cuePositions):
+	""" Set exp.cuePosToAlign with the test cue selected in a previous run (sidecar file) or found automatically in the heatmap
+	of option. If the confidence is lower than CUE_MIN_CONFIDENCE the nominal position is kept (as clicking outside the heatmap),
+	or the heatmap is opened to select it if REVIEW_LOW_CONFIDENCE is True. AUTO_ALIGN: False opens the heatmap of every experiment.
+	The positions selected in the heatmaps are saved in the sidecar file
+	"""
+	found, cuePos= get_cue_position(cuePositions, exp, option)
+	if found:
+		exp.cuePosToAlign= cuePos or []
+		print(' Test cue of exp %s loaded from the sidecar file: %s'%(exp.expDate, cuePos or 'nominal position'))
+		exp.generate_heatmap(option, metaData)
+		return
+	if metaData.get('AUTO_ALIGN', True):
+		detect_cue_to_align(exp, option, metaData)
+		if exp.cuePosToAlign:
+			print(' Test cue of exp %s found in %s (confidence %.2f)'%(exp.expDate, np.round(exp.cuePosToAlign, 4), exp.cueConfidence))
+			exp.generate_heatmap(option, metaData)
+			return
+		if not metaData.get('REVIEW_LOW_CONFIDENCE', False):
+			print(' Test cue of exp %s not found (confidence %.2f): nominal position used'%(exp.expDate, exp.cueConfidence))
+			exp.generate_heatmap(option, metaData)
+			return
+		print(' Test cue of exp %s not found (confidence %.2f): select it in the heatmap'%(exp.expDate, exp.cueConfidence))
+	exp.generate_heatmap_with_UI(option, metaData, posToAlign)
+	set_cue_position(cuePositions, exp, option, exp.cuePosToAlign if (exp.cuePosToAlign and None not in exp.cuePosToAlign) else None, metaData)
+
+
+def precompute_align_exp(fname, metaData):
+	""" Review mode: load an experiment, compute and save its heatmap and search its test cue (run in background).
+	Only the settings and heatmaps are kept. Return the exp and the position found automatically (None if AUTO_ALIGN is False)
+	"""
+	exp= load_align_exp(fname, metaData)
+	option= metaData['ODOR']
+	autoPos= detect_cue_to_align(exp, option, metaData) if metaData.get('AUTO_ALIGN', True) else None
+	exp.generate_heatmap(option, metaData)
+	exp.set_h5_information([], [], [], [], [], [])
+	exp.stim_List=[]
+	exp.stimRanges={}
+	return exp, autoPos
+
+
+def review_cues_to_align(filesList, metaData, cuePositions):
+	""" Review mode: all the heatmaps are computed in background and reviewed in one window (see cue_review.CueReviewer).
+	The window is only opened if some experiment was not reviewed before. Return the list of experiments with their cuePosToAlign
+	"""
+	option= metaData['ODOR']
+	expIter= iter_prefetched(filesList, metaData, precompute_align_exp, len(filesList))
+	pending= [f for f in filesList if not get_cue_position(cuePositions, load_expConfig_only(f, metaData), option)[0]]
+	if pending or metaData.get('REVIEW_ALL', False):
+		print(' Reviewing %s experiments (%s not reviewed before)'%(len(filesList), len(pending)))
+		expList= CueReviewer(expIter, len(filesList), option, metaData, cuePositions).run()
+	else:
+		expList= [exp for exp, autoPos in expIter]
+	for exp in expList:
+		found, cuePos= get_cue_position(cuePositions, exp, option)
+		if found:
+			exp.cuePosToAlign= cuePos or []
+	return expList
 
 
 if __name__=='__main__':
 	expList=[]
 	#Load CONSTANTS related to the experiment
 	expMetaData= load_metaData()
-	#Find all the .yaml files (experiment cfg file) in folder
-	filesList= find_files_list(expMetaData['IN_PATH'], '.yaml')
+	if expMetaData.get('CLEAR_CACHE', False):
+		clear_cache(expMetaData)
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
 	#Var to keep track of the positions to be alligned
 	posToAlign=[]
+	#Test cue positions selected in previous runs
+	cuePositions= load_cue_positions(expMetaData)
+	if expMetaData.get('REVIEW_MODE', False) and filesList:
+		expList= review_cues_to_align(filesList, expMetaData, cuePositions)
 	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files
-	for i, fname in enumerate(filesList):
-		expList.append(load_expConfig_only(fname, expMetaData))
-
-		if ('Pve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-
-		elif ('Nve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' not in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-
-		expList[i].generate_heatmap_with_UI(expMetaData['ODOR'], expMetaData, posToAlign)
+	else:
+		for i, fname in enumerate(filesList):
+			expList.append(load_align_exp(fname, expMetaData))
+			find_cue_to_align(expList[i], expMetaData['ODOR'], expMetaData, posToAlign, cuePositions)
 
 		# if (('Pve' in expMetaData['GRP_BY']) and ('-' not in expList[i].posClrTEST[1])) or (('Nve' in expMetaData['GRP_BY']) and ('-' in expList[i].posClrTEST[1])):
 		# 	# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
 		# 	load_exp_data(expList[i], expMetaData)
 		# 	expList[i].generate_heatmap_with_UI(expMetaData['ODOR'], expMetaData, posToAlign)
 
-	#Once the the user has found the expList[X].cuePosToAlign, align each experiment XYZ to its corresponding new cue center
-	tmpX, tmpY, tmpZ, tmpStim= align_data_for_heatmaps(expList)
+	#Once the the user has found the expList[X].cuePosToAlign, align each experiment heatmap to its corresponding new cue center
+	grpHeatmap= align_data_for_heatmaps(expList)
 	# Generate the grouped heatmap
 	imgTitle= expMetaData['HM_GRP_NAME']
-	generate_grp_heatmap_for_dataAligned(tmpX, tmpY, tmpZ, tmpStim, expMetaData['ODOR'], 'black', 'white', expMetaData, imgTitle)
+	render_group_heatmap(grpHeatmap, expMetaData['ODOR'], 'black', 'white', expMetaData, imgTitle, [exp.expDate for exp in expList])
 
 	
 	print('end')
@@ -0,0 +1,57 @@
+"""
+This script writes the consolidated store of the experiments (see exp_store.py): every experiment of the catalog matching
+EXP_FILTER is loaded and preprocessed once (trimmed, filtered and with the odor stimulus set, not mirrored) and its columns
+are appended to one memory-mapped store in STORE_PATH. The other scripts then load these experiments as slices of the store.
+Run it again when experiments are added or changed: the experiments not found in the store are loaded from the h5 files
+"""
+import sys
+import yaml
+from exp_loader import load_expConfig_only, load_exp_data
+from io_pipeline import iter_prefetched, PREFETCH_SIZE
+from exp_catalog import select_exp_files
+from exp_store import write_store, get_store_path
+import pathlib
+
+
+def load_metaData():
+	""" Load constant values related to the experiment setup and workspaces
+	"""
+	try:
+		print(pathlib.Path().absolute())
+		metaFile= 'ExpMetaData.yaml'
+		with open(metaFile, 'r') as f:
+			metaData= yaml.load(f, Loader=yaml.FullLoader)
+		print(' Experiments metadata loaded sucessfuly')
+		return metaData
+	except Exception as e:
+		print(' ERROR while loading experiment metaData from: %s'%metaFile)
+		print(e)
+		sys.exit(1)
+
+
+def read_exp(fname, metaData):
+	""" Load and preprocess an experiment (not mirrored: GRP_BY is applied when the experiments are loaded from the store)
+	"""
+	exp= load_expConfig_only(fname, metaData)
+	load_exp_data(exp, metaData)
+	return fname, exp
+
+
+def iter_exps(filesList, metaData):
+	""" Experiments with data (the next ones are read in a background thread while the current one is written)
+	"""
+	for fname, exp in iter_prefetched(filesList, metaData, read_exp, metaData.get('PREFETCH_SIZE', PREFETCH_SIZE)):
+		if exp is None or len(exp.TS_List) == 0:
+			print(' ERROR no data for file: %s, it is not stored'%fname)
+			continue
+		yield fname, exp
+
+
+# == MAIN ==
+if __name__== '__main__':
+	#Load CONSTANTS related to the experiment
+	expMetaData= load_metaData()
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
+	nStored= write_store(iter_exps(filesList, expMetaData), expMetaData)
+	print(' %s of %s experiments stored in: %s'%(nStored, len(filesList), get_store_path(expMetaData)))
@@ -0,0 +1,92 @@
+"""
+File containing the automatic localization of the test cue in the XY heatmap of an experiment: the occupancy is smoothed
+and the density peak is searched in a window around the nominal test cue position (posClrTEST). The peak is scored with the
+significance of its points over the window background, so the experiments with a low confidence can be reviewed with the UI
+"""
+import numpy as np
+from heatmaps import get_grid_edges, get_bin_index
+
+
+# Default values of the detection (distances in m)
+CUE_SMOOTH_SIGMA= 0.01		# Sigma of the gaussian smoothing
+CUE_SEARCH_RADIUS= 0.1		# Half side of the search window around the nominal position
+CUE_MIN_CONFIDENCE= 6.0		# Detections with a lower confidence (standard deviations) fall back to the nominal position (or are reviewed)
+CUE_MIN_PEAK_COUNT= 20		# Min number of points around the peak (fewer points have confidence 0)
+CUE_PEAK_SIGMAS= 2			# Half side (in CUE_SMOOTH_SIGMA) of the peak region
+
+
+def get_nominal_cue_pos(exp, metaData):
+	""" Test cue position from the exp settings in the heatmap coordinates (X from the WT center). The cue positions are
+	mirrored with the data (exp_loader.mirror_exp_for_group)
+	"""
+	return [exp.posClrTEST[0] - metaData['LIM_X'], exp.posClrTEST[1]]
+
+
+def gaussian_kernel(sigmaBins):
+	""" Normalized 1d gaussian kernel (3 sigmas on each side)
+	"""
+	radius= max(int(np.ceil(3*sigmaBins)), 1)
+	kernel= np.exp(-0.5*(np.arange(-radius, radius+1)/max(sigmaBins, 1e-6))**2)
+	return kernel / kernel.sum()
+
+
+def smooth_counts(counts, sigmaBins):
+	""" Separable gaussian smoothing of a 2d grid of counts (zeros outside the grid). sigmaBins= (sigma axis 0, sigma axis 1) in bins
+	"""
+	smoothed= np.asarray(counts, float)
+	for axis, sigma in enumerate(sigmaBins):
+		kernel= gaussian_kernel(sigma)
+		pad= [(0, 0), (0, 0)]
+		pad[axis]= (len(kernel)//2, len(kernel)//2)
+		windows= np.lib.stride_tricks.sliding_window_view(np.pad(smoothed, pad), len(kernel), axis=axis)
+		smoothed= windows @ kernel
+	return smoothed
+
+
+def get_peak_significance(counts, iX, iY, halfSide, minCount):
+	""" Significance of the points of the region around bin (iX, iY) of counts (raw counts of the search window) over the
+	rest of the window: (n - expected) / sqrt(expected) as for Poisson counts, with the expected count of the region from
+	the mean count per bin of the rest of the window (at least 1, so a sparse window doesn't give a high score to a few
+	points). 0 if the region has less than minCount points
+	"""
+	region= (slice(max(iX-halfSide[0], 0), iX+halfSide[0]+1), slice(max(iY-halfSide[1], 0), iY+halfSide[1]+1))
+	nPeak= counts[region].sum()
+	regionBins= counts[region].size
+	if nPeak < minCount or regionBins >= counts.size:
+		return 0.0
+	expected= (counts.sum() - nPeak) / (counts.size - regionBins) * regionBins
+	return float(max(nPeak - expected, 0) / np.sqrt(max(expected, 1.0)))
+
+
+def detect_cue(hmResult, nominalPos, metaData):
+	""" Search the test cue in the XY heatmap: position of the smoothed occupancy peak inside the window around nominalPos.
+	Return the position found ([x, y], None if there is no data in the window) and its confidence: significance of the
+	points around the peak over the window background in standard deviations (see get_peak_significance), 0 if the peak
+	is on the window border (not a local peak) or has less than CUE_MIN_PEAK_COUNT points
+	"""
+	xEdges, yEdges, _= get_grid_edges(metaData, hmResult.countsXY.shape)
+	binX= xEdges[1] - xEdges[0]
+	binY= yEdges[1] - yEdges[0]
+	sigma= metaData.get('CUE_SMOOTH_SIGMA', CUE_SMOOTH_SIGMA)
+	radius= metaData.get('CUE_SEARCH_RADIUS', CUE_SEARCH_RADIUS)
+	smoothed= smooth_counts(hmResult.countsXY, (sigma/binX, sigma/binY))
+
+	#Window of bins around the nominal position (clipped to the grid)
+	center= [get_bin_index(np.array([np.clip(p, e[0], e[-1])]), e)[0] for p, e in zip(nominalPos, (xEdges, yEdges))]
+	rX= int(round(radius/binX))
+	rY= int(round(radius/binY))
+	x0, x1= max(center[0]-rX, 0), min(center[0]+rX+1, smoothed.shape[0])
+	y0, y1= max(center[1]-rY, 0), min(center[1]+rY+1, smoothed.shape[1])
+	window= smoothed[x0:x1, y0:y1]
+	peak= window.max()
+	if peak <= 0:
+		return None, 0.0
+	iX, iY= np.unravel_index(np.argmax(window), window.shape)
+	pos= [float(0.5*(xEdges[x0+iX] + xEdges[x0+iX+1])), float(0.5*(yEdges[y0+iY] + yEdges[y0+iY+1]))]
+	#A peak on the window border is only the slope of a density outside the window
+	onBorder= (iX in (0, window.shape[0]-1) and 0 < x0+iX < smoothed.shape[0]-1) or (iY in (0, window.shape[1]-1) and 0 < y0+iY < smoothed.shape[1]-1)
+	if onBorder:
+		return pos, 0.0
+	halfSide= [max(int(round(metaData.get('CUE_PEAK_SIGMAS', CUE_PEAK_SIGMAS)*sigma/b)), 0) for b in (binX, binY)]
+	return pos, get_peak_significance(np.asarray(hmResult.countsXY[x0:x1, y0:y1]), iX, iY, halfSide,
+									metaData.get('CUE_MIN_PEAK_COUNT', CUE_MIN_PEAK_COUNT))
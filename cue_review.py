@@ -0,0 +1,152 @@
+"""
+File containing the review mode of align_heatmaps.py: the heatmaps of all the experiments are computed in background while
+the user reviews them in one window (low resolution heatmaps, next/previous navigation). The test cue positions selected
+are saved in a sidecar file as soon as they are clicked, so an interrupted review can be resumed and later runs reuse them
+"""
+import os
+import yaml
+import numpy as np
+import matplotlib.pyplot as plt
+from heatmaps import get_stim_name, downsample_counts, normalize_counts
+from cue_detection import get_nominal_cue_pos
+
+
+# Number of bins added in each axis for the low resolution heatmaps shown
+REVIEW_BIN_FACTOR= 4
+# vmax of the heatmaps shown (as the single experiment heatmaps), scaled by the bins added
+REVIEW_NORM= 0.0001
+
+
+def get_cue_file(metaData):
+	""" Sidecar file with the test cue positions selected (CUE_POS_FILE or OUT_PATH+OUT_FOLDER+HM_GRP_NAME_cuePos.yaml)
+	"""
+	return metaData.get('CUE_POS_FILE', metaData['OUT_PATH']+metaData['OUT_FOLDER']+metaData['HM_GRP_NAME']+'_cuePos.yaml')
+
+
+def get_cue_key(exp, option):
+	return '%s_%s'%(exp.fileName, get_stim_name(option))
+
+
+def load_cue_positions(metaData):
+	""" Test cue positions saved in the sidecar file: {exp key: {'expDate', 'cuePos': [x, y] or None (nominal position)}}
+	"""
+	try:
+		with open(get_cue_file(metaData), 'r') as f:
+			return yaml.safe_load(f) or {}
+	except OSError:
+		return {}
+
+
+def save_cue_positions(cuePositions, metaData):
+	""" Write the sidecar file (a temporary file is renamed, so an interrupted write never leaves a broken file)
+	"""
+	cueFile= get_cue_file(metaData)
+	try:
+		with open(cueFile+'.tmp', 'w') as f:
+			yaml.safe_dump(cuePositions, f, default_flow_style=None)
+		os.replace(cueFile+'.tmp', cueFile)
+	except Exception as e:
+		print(' ERROR while saving test cue positions in: %s --> %s'%(cueFile, e))
+
+
+def set_cue_position(cuePositions, exp, option, cuePos, metaData):
+	""" Save the test cue position selected for exp (None== nominal position, as clicking outside the heatmap)
+	"""
+	cuePositions[get_cue_key(exp, option)]= {'expDate': exp.expDate, 'cuePos': None if cuePos is None else [float(p) for p in cuePos]}
+	save_cue_positions(cuePositions, metaData)
+
+
+def get_cue_position(cuePositions, exp, option):
+	""" (True, position) if the test cue of exp was already selected (position None== nominal), (False, None) otherwise
+	"""
+	entry= cuePositions.get(get_cue_key(exp, option))
+	if entry is None:
+		return False, None
+	return True, entry['cuePos']
+
+
+class CueReviewer:
+	""" Window to review the heatmaps of the experiments given by expIter (computed in background) and click their test cue.
+	Keys: right/n= next, left/p= previous, q= finish. A click outside the heatmap selects the nominal position.
+	The markers show the nominal position (white x), the position found automatically (cyan +) and the one selected (red o)
+	"""
+	def __init__(self, expIter, nExps, option, metaData, cuePositions):
+		self.expIter= expIter
+		self.nExps= nExps
+		self.option= option
+		self.metaData= metaData
+		self.cuePositions= cuePositions
+		self.factor= metaData.get('REVIEW_BIN_FACTOR', REVIEW_BIN_FACTOR)
+		self.exps= []
+		self.previews= []
+		self.autoPos= []
+		self.index= 0
+		self.fig, self.ax= plt.subplots()
+		self.ax.set_xlabel('X axis')
+		self.ax.set_ylabel('Y axis')
+		self.image= None
+		self.nominalMarker,= self.ax.plot([], [], 'wx', markersize=10)
+		self.autoMarker,= self.ax.plot([], [], 'c+', markersize=12)
+		self.cueMarker,= self.ax.plot([], [], 'ro', fillstyle='none', markersize=10)
+		self.fig.canvas.mpl_connect('button_press_event', self.on_click)
+		self.fig.canvas.mpl_connect('key_press_event', self.on_key)
+
+	def get_exp(self, index):
+		""" Experiment index, waiting for the background computation if it is not ready yet. The low resolution heatmap is created once
+		"""
+		while len(self.exps) <= index:
+			exp, autoPos= next(self.expIter)
+			hmResult= exp.get_heatmap(self.option, self.metaData)
+			self.exps.append(exp)
+			self.autoPos.append(autoPos)
+			self.previews.append((normalize_counts(downsample_counts(hmResult.countsXY, self.factor)), hmResult.extentXY))
+		return self.exps[index]
+
+	def show(self, index):
+		""" Redraw the window with the heatmap of the experiment index (only the image data and markers change)
+		"""
+		self.index= index
+		exp= self.get_exp(index)
+		preview, extent= self.previews[index]
+		if self.image is None:
+			self.image= self.ax.imshow(preview, vmin=0, vmax=REVIEW_NORM*self.factor**2, extent=extent, cmap='jet')
+			self.ax.invert_yaxis()
+			self.ax.set_autoscale_on(False)
+		else:
+			self.image.set_data(preview)
+		self.nominalMarker.set_data(*[[p] for p in get_nominal_cue_pos(exp, self.metaData)])
+		autoPos= self.autoPos[index]
+		self.autoMarker.set_data(*([[p] for p in autoPos] if autoPos else ([], [])))
+		found, cuePos= get_cue_position(self.cuePositions, exp, self.option)
+		self.cueMarker.set_data(*([[p] for p in cuePos] if cuePos else ([], [])))
+		state= ('selected' if cuePos else 'nominal') if found else 'not reviewed'
+		self.ax.set_title('%s/%s exp %s %s - confidence %.2f - %s'%(index+1, self.nExps, exp.type, exp.expDate,
+						exp.cueConfidence or 0.0, state), fontsize=9)
+		self.fig.canvas.draw_idle()
+
+	def on_click(self, event):
+		cuePos= [event.xdata, event.ydata] if event.inaxes is self.ax else None
+		exp= self.exps[self.index]
+		set_cue_position(self.cuePositions, exp, self.option, cuePos, self.metaData)
+		print(' Test cue of exp %s: %s'%(exp.expDate, 'nominal position' if cuePos is None else np.round(cuePos, 4)))
+		self.show(min(self.index+1, self.nExps-1))
+
+	def on_key(self, event):
+		if event.key in ('right', 'n'):
+			self.show(min(self.index+1, self.nExps-1))
+		elif event.key in ('left', 'p'):
+			self.show(max(self.index-1, 0))
+		elif event.key in ('q', 'escape'):
+			plt.close(self.fig)
+
+	def run(self):
+		""" Open the window in the first experiment not reviewed and wait until it is closed. Return all the experiments
+		"""
+		start= 0
+		while start < self.nExps-1 and get_cue_position(self.cuePositions, self.get_exp(start), self.option)[0]:
+			start+= 1
+		self.show(start)
+		plt.show()
+		plt.close(self.fig)
+		self.get_exp(self.nExps-1)
+		return self.exps
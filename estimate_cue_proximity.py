@@ -0,0 +1,103 @@
+"""
+This script works with a subset of experiments located in the IN_PATH folder of the ExpMetaData.yaml file.
+It measures the activity around the cues (odor, test and base) for each odor section (1=AIR, 2=CO2, 3=PostCO2):
+number of points, dwell time and number of trajectories within each radius of CUE_RADII.
+The spatial index of each experiment is saved in the cache, so the radii can be changed and the script run again in seconds.
+The results are saved in OUT_PATH+OUT_FOLDER+HM_GRP_NAME_cueProximity.csv
+"""
+import sys
+import csv
+import yaml
+from exp_loader import load_expConfig_only, load_exp_data, mirror_exp_for_group
+from parallel_pipeline import run_exp_pipeline
+from io_pipeline import run_exp_prefetch
+from spatial_index import query_cue_metrics, CUES
+from exp_cache import clear_cache
+from exp_catalog import select_exp_files
+import pathlib
+
+
+# Default radii (m) around each cue
+CUE_RADII= [0.02, 0.05, 0.1]
+# Columns of the results file
+CSV_COLUMNS= ('expDate', 'type', 'cue', 'stim', 'radius', 'nPoints', 'dwellTime', 'nTrajs')
+
+
+def load_metaData():
+	""" Load constant values related to the experiment setup and workspaces
+	"""
+	try:
+		print(pathlib.Path().absolute())
+		metaFile= 'ExpMetaData.yaml'
+		with open(metaFile, 'r') as f:
+			metaData= yaml.load(f, Loader=yaml.FullLoader)
+		print(' Experiments metadata loaded sucessfuly')
+		return metaData
+	except Exception as e:
+		print(' ERROR while loading experiment metaData from: %s'%metaFile)
+		print(e)
+		sys.exit(1)
+
+
+def read_exp(fname, metaData):
+	""" Load an experiment and mirror it to the GRP_BY side (the queries need the positions, so it is never streamed)
+	"""
+	exp= load_expConfig_only(fname, metaData)
+	load_exp_data(exp, metaData)
+	mirror_exp_for_group(exp, metaData['GRP_BY'])
+	return exp
+
+
+def compute_exp(exp, metaData, writer=None):
+	""" Cue proximity metrics of the exp loaded by read_exp. Return a list of rows (dicts with the CSV_COLUMNS)
+	"""
+	results= query_cue_metrics(exp, metaData, metaData.get('CUE_RADII', CUE_RADII), metaData.get('CUE_QUERY_CUES', list(CUES)),
+							metaData.get('CUE_QUERY_SHAPE', 'sphere'))
+	rows= []
+	for result in results:
+		row= {col: result[col] for col in CSV_COLUMNS if col in result}
+		row.update(expDate=exp.expDate, type=exp.type)
+		rows.append(row)
+	return rows
+
+
+def process_exp(fname, metaData):
+	""" Load an experiment and compute its cue proximity metrics
+	"""
+	return compute_exp(read_exp(fname, metaData), metaData)
+
+
+def save_results(rows, metaData):
+	""" Save the rows of all the experiments in OUT_PATH+OUT_FOLDER+HM_GRP_NAME_cueProximity.csv
+	"""
+	fileName= metaData['OUT_PATH']+metaData['OUT_FOLDER']+metaData['HM_GRP_NAME']+'_cueProximity.csv'
+	try:
+		with open(fileName, 'w', newline='') as f:
+			writer= csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+			writer.writeheader()
+			writer.writerows(rows)
+		print(' Cue proximity results saved in: %s'%fileName)
+	except Exception as e:
+		print(' ERROR while saving cue proximity results in: %s --> %s'%(fileName, e))
+
+
+# == MAIN ==
+if __name__== '__main__':
+	#Load CONSTANTS related to the experiment
+	expMetaData= load_metaData()
+	if expMetaData.get('CLEAR_CACHE', False):
+		clear_cache(expMetaData)
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
+
+	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files (in N_WORKERS processes)
+	if expMetaData.get('PIPELINE_MODE', False):
+		#The next experiments are read in a background thread while the current one is processed
+		results= run_exp_prefetch(filesList, expMetaData, read_exp, compute_exp)
+	else:
+		results= run_exp_pipeline(filesList, expMetaData, process_exp)
+	allRows= [row for rows in results for row in rows]
+	for row in allRows:
+		print("CUE PROXIMITY for %s - %s cue, %s, radius %s m:	points: %s	dwell time: %.2f s	trajectories: %s"%(row['expDate'], row['cue'],
+			row['stim'], row['radius'], row['nPoints'], row['dwellTime'], row['nTrajs']))
+	save_results(allRows, expMetaData)
@@ -4,23 +4,18 @@ It will check our initial filter condition (there must be an increase in the ins
 
 """
 import sys
-import glob
 import yaml
-from Exp_Info import Exp_Info
-import numpy as np
-import h5py
-import matplotlib.pyplot as plt 
-import time
+from exp_loader import load_expConfig_only, load_exp_data, mirror_exp_for_group
+from parallel_pipeline import run_exp_pipeline
+from io_pipeline import run_exp_prefetch
+from trajectories import compute_trajectories, get_stim_totals
+from exp_cache import clear_cache
+from exp_catalog import select_exp_files
+from stream_exp import stream_exp
 import pathlib
 
 
 
-def find_files_list(path, ext):
-	""" Find all exp configuration files (.yaml files) in folder. They are needed to load their corresponding h5 files later
-	"""
-	return glob.glob(path+'/*'+ext)
-
-
 def load_metaData():
 	""" Load constant values related to the experiment setup and workspaces
 	"""
@@ -37,113 +32,69 @@ def load_metaData():
 		sys.exit(1)
 
 
-def load_expConfig_only(fname, metaData):
-	""" Load the configuration settings of an experiment and its data from FLydra
+def estimate_flight_activity(exp, trajTimeFilter):
+	""" Estimate the flight activity when an odor is being released: number of trajectories lasting at least
+	trajTimeFilter and their total duration, for each of the 3 odor sections (1=AIR, 2=CO2, 3=PostCO2)
 	"""
-	try: 
-		with open(fname, 'r') as f:
-			#dataMap= Exp_Info.Exp_Info(yaml.load(f))
-			dataMap= Exp_Info(yaml.load(f, Loader=yaml.FullLoader))
-			print(' Configuration settings for experiment on %s loaded sucessfuly'%dataMap.expDate)
-		return dataMap
-	except: 
-		print(' ERROR while loading experiment configuration settings for file: %s'%fname)
+	trajTable= compute_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+	trajsCounted, trajsDuration= get_stim_totals(trajTable, trajTimeFilter)
+	return list(trajsCounted), list(trajsDuration)
 
 
-def load_exp_data(exp, metaData):
-	""" Load the data from FLydra for a given experiment
+def read_exp(fname, metaData):
+	""" Load an experiment and mirror it to the GRP_BY side. In streaming mode only its trajectory table is kept
+	Return the exp and its trajectory table (None if the exp data was loaded)
 	"""
-	try:
-		hf=h5py.File(metaData['IN_PATH']+exp.fileName, 'r')
-		#print('file %s loaded'%fname )
-		dataset= hf.get(metaData['DATASET'])
-		dataset= np.array(dataset)
-		#Add the obj_ID, frame, x, y, z and ts to exp
-		exp.set_h5_information(dataset['obj_id'], dataset['frame'], dataset['timestamp'], dataset['x'], dataset['y'], dataset['z'])
-		#Clean the data outside the startExp and endExp
-		exp.apply_start_end_ts()
-		#Remove points outside volume
-		exp.erase_pos_outside_wt(metaData)
-		#set the odor stimulus used in each par of the experiment
-		exp.set_odor_stim()
-		print(' Experiment %s data loaded'%exp.fileName)
-	except:
-		print(' ERROR while loading data for file: %s'%exp.fileName)
-
-
-def get_trajectory_duration(trajTime):
-	""" Calculate the time duration of the trajectory
+	exp= load_expConfig_only(fname, metaData)
+	if metaData.get('STREAM_MODE', False):
+		#The trajectories are accumulated reading the h5 file by chunks (the data is never fully loaded)
+		return exp, stream_exp(exp, metaData)
+	# Load the experiment and mirror it if the TEST Cue is not in the Y axis side used to group (GRP_BY)
+	load_exp_data(exp, metaData)
+	mirror_exp_for_group(exp, metaData['GRP_BY'])
+	return exp, None
+
+
+def compute_exp(data, metaData, writer=None):
+	""" Estimate the flight activity of the exp loaded by read_exp for each odor stimulus.
+	Return the h5 file name and the trajectories counted and their total duration per odor
 	"""
-	return np.max(trajTime) - np.min(trajTime)
+	exp, trajTable= data
+	if trajTable is not None:
+		trajsCounted, trajsDuration= get_stim_totals(trajTable, metaData['MIN_FLIGHT_TIME'])
+		return exp.fileName, list(trajsCounted), list(trajsDuration)
+	expTrajs, expTrajDur= estimate_flight_activity(exp, metaData['MIN_FLIGHT_TIME'])
+	return exp.fileName, expTrajs, expTrajDur
 
 
-def estimate_flight_activity(exp, trajTimeFilter):
-	""" Estimate the flight activity when an odor is being released
+def process_exp(fname, metaData):
+	""" Load an experiment and estimate its flight activity for each odor stimulus
 	"""
-	trajsDuration= []
-	trajsCounted= []
-	for odorValue in range(1,4):
-		totalDurationFlights= 0
-		totalTraj= 0
-		#Select indexes for each of the 3 odor sections (1=AIR, 2=CO2, 3=PostCO2)
-		odorIxs= np.where(exp.stim_List== odorValue)
-		for id in np.unique(exp.ID_List[odorIxs]):
-			#Find indexes related to this trajectory ID
-			idIxs= np.where(exp.ID_List[odorIxs])
-			#Get trajectory duration
-			duration= get_trajectory_duration(exp.TS_List[odorIxs][idIxs])
-			#Estimate overall activity for the given odor
-			if duration >= trajTimeFilter:
-				totalDurationFlights= totalDurationFlights + duration
-				totalTraj= totalTraj+1
-		trajsDuration.append(totalDurationFlights)
-		trajsCounted.append(totalTraj)
-	return trajsCounted, trajsDuration
-
-
-
-
-
-
+	return compute_exp(read_exp(fname, metaData), metaData)
 
 
 # == MAIN ==
 if __name__== '__main__':
-	expList=[]
 	#Load CONSTANTS related to the experiment
 	expMetaData= load_metaData()
-	#Find all the .yaml files (experiment cfg file) in folder
-	filesList= find_files_list(expMetaData['IN_PATH'], '.yaml')
+	if expMetaData.get('CLEAR_CACHE', False):
+		clear_cache(expMetaData)
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
 	
-	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files
-	tmpX=[]
-	tmpY= []
-	tmpZ=[]
-	tmpStim=[]
-	for i, fname in enumerate(filesList):
-		#t1=time.time()
-		expList.append(load_expConfig_only(fname, expMetaData))
-		if ('Pve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-
-		elif ('Nve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' not in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-		expTrajs, expTrajDur= estimate_flight_activity(expList[i], expMetaData['MIN_FLIGHT_TIME'])
-
-		# print("TRAJECTORY ACTIVITY ESTIMATION for %s"%expList[i].fileName)
+	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files (in N_WORKERS processes)
+	if expMetaData.get('PIPELINE_MODE', False):
+		#The next experiments are read in a background thread while the current one is processed
+		results= run_exp_prefetch(filesList, expMetaData, read_exp, compute_exp)
+	else:
+		results= run_exp_pipeline(filesList, expMetaData, process_exp)
+	for fileName, expTrajs, expTrajDur in results:
+		# print("TRAJECTORY ACTIVITY ESTIMATION for %s"%fileName)
 		# print("	- AIR: %s 	- CO2: %s	- PostCO2: %s"%(expTrajDur[0]/expTrajDur[0],expTrajDur[1]/expTrajDur[0], expTrajDur[2]/expTrajDur[1] ))
 		# print("	- Total traj counted for	- AIR: %s	- CO2:%s	- PostCO2:%s"%(expTrajs[0], expTrajs[1], expTrajs[2]))
 		# print("	- Total traj duration for	- AIR: %s 	- CO2: %s	- PostCO2: %s"%(expTrajDur[0],expTrajDur[1], expTrajDur[2]))
 
-		print("TRAJECTORY ACTIVITY ESTIMATION for %s"%expList[i].fileName)
+		print("TRAJECTORY ACTIVITY ESTIMATION for %s"%fileName)
 		print("	- AIR: %s 	- CO2: %s	- PostCO2: %s"%(expTrajDur[0]/expTrajDur[0],expTrajDur[1]/expTrajDur[0], expTrajDur[2]/expTrajDur[1] ))
 		print("	- Total traj counted for	- AIR: %s	- CO2:%s	- PostCO2:%s"%(expTrajs[0], expTrajs[1], expTrajs[2]))
 		print("	- Total traj duration for	- AIR: %s 	- CO2: %s	- PostCO2: %s"%(expTrajDur[0],expTrajDur[1], expTrajDur[2]))
@@ -0,0 +1,166 @@
+"""
+This script works with a subset of experiments located in the IN_PATH folder of the ExpMetaData.yaml file.
+It compares two odor sections (STATS_STIMS, by default AIR and CO2) over the group of experiments with bootstrap confidence
+intervals and permutation tests (see exp_stats.py):
+ - Flight activity ratio (total flight time of the second stim vs the first one), resampling experiments and trajectories
+ - Occupancy of the test cue region (STATS_CUE_RADIUS around the test cue, XY heatmap)
+ - Difference heatmap of the normalized XY occupancy, with the p-value of each bin
+The results are saved in OUT_PATH+OUT_FOLDER+HM_GRP_NAME_stats.yaml and the difference heatmap as a figure and a .npz file
+"""
+import sys
+import yaml
+import numpy as np
+from exp_loader import load_expConfig_only, load_exp_data, mirror_exp_for_group
+from parallel_pipeline import run_exp_pipeline
+from io_pipeline import run_exp_prefetch
+from trajectories import compute_trajectories
+from heatmaps import get_stim_name, get_grid_edges, get_region_fraction, downsample_counts, normalize_counts, HM_DIFF_KIND
+from hm_render import plot_difference_heatmap, save_heatmap, set_batch_backend
+from cue_detection import get_nominal_cue_pos
+from exp_stats import ratio_stats, paired_difference_stats, difference_heatmap_stats, CI_LEVEL
+from exp_cache import clear_cache
+from exp_catalog import select_exp_files
+from stream_exp import stream_exp
+import pathlib
+
+
+# Default odor stim compared (the second one vs the first one)
+STATS_STIMS= [1, 2]
+# Default radius (m) of the test cue region
+STATS_CUE_RADIUS= 0.05
+# Default bins added in each axis for the difference heatmap
+STATS_BIN_FACTOR= 10
+# Default significance level of the difference heatmap bins shown
+STATS_ALPHA= 0.05
+
+
+def load_metaData():
+	""" Load constant values related to the experiment setup and workspaces
+	"""
+	try:
+		print(pathlib.Path().absolute())
+		metaFile= 'ExpMetaData.yaml'
+		with open(metaFile, 'r') as f:
+			metaData= yaml.load(f, Loader=yaml.FullLoader)
+		print(' Experiments metadata loaded sucessfuly')
+		return metaData
+	except Exception as e:
+		print(' ERROR while loading experiment metaData from: %s'%metaFile)
+		print(e)
+		sys.exit(1)
+
+
+def read_exp(fname, metaData):
+	""" Load an experiment and mirror it to the GRP_BY side. In streaming mode only its heatmaps and trajectory table are kept.
+	Return the exp (with the heatmaps of the 3 odor stim) and its trajectory table
+	"""
+	exp= load_expConfig_only(fname, metaData)
+	if metaData.get('STREAM_MODE', False):
+		mirror_exp_for_group(exp, metaData['GRP_BY'])
+		return exp, stream_exp(exp, metaData)
+	load_exp_data(exp, metaData)
+	mirror_exp_for_group(exp, metaData['GRP_BY'])
+	exp.compute_all_heatmaps(metaData)
+	return exp, compute_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+
+
+def compute_exp(data, metaData, writer=None):
+	""" Compact values of the exp needed by the statistics, for each odor stim compared: total flight time, duration of each
+	trajectory (at least MIN_FLIGHT_TIME), occupancy of the test cue region and normalized XY occupancy (low resolution)
+	"""
+	exp, trajTable= data
+	keep= trajTable.duration >= metaData['MIN_FLIGHT_TIME']
+	cuePos= get_nominal_cue_pos(exp, metaData)
+	values= {'expDate': exp.expDate, 'flightTime': {}, 'trajDurations': {}, 'cueOccupancy': {}, 'grids': {}}
+	for option in metaData.get('STATS_STIMS', STATS_STIMS):
+		durations= trajTable.duration[keep & (trajTable.stim == option)]
+		countsXY= exp.heatmaps[option].countsXY
+		values['flightTime'][option]= float(durations.sum())
+		values['trajDurations'][option]= durations
+		values['cueOccupancy'][option]= get_region_fraction(countsXY, metaData, cuePos, metaData.get('STATS_CUE_RADIUS', STATS_CUE_RADIUS))
+		values['grids'][option]= normalize_counts(downsample_counts(countsXY, metaData.get('STATS_BIN_FACTOR', STATS_BIN_FACTOR))).astype(np.float32)
+	return values
+
+
+def process_exp(fname, metaData):
+	""" Load an experiment and compute the values needed by the statistics
+	"""
+	return compute_exp(read_exp(fname, metaData), metaData)
+
+
+def print_stats(name, stats, level):
+	print("%s:	%.4f	%s%% CI [%.4f, %.4f]	p= %.4f	(n= %s)"%(name, stats['value'], int(round(100*level)), stats['ci'][0], stats['ci'][1],
+		stats['pValue'], stats['nUnits']))
+
+
+def generate_difference_heatmap(results, stimA, stimB, metaData):
+	""" Compute and save the difference heatmap (stimB - stimA normalized XY occupancy, mean over the experiments) with the
+	bootstrap standard error and permutation p-value of each bin
+	"""
+	diff, se, pValues= difference_heatmap_stats([r['grids'][stimA] for r in results], [r['grids'][stimB] for r in results], metaData)
+	factor= metaData.get('STATS_BIN_FACTOR', STATS_BIN_FACTOR)
+	xEdges, yEdges, _= get_grid_edges(metaData)
+	nx, ny= (len(xEdges)-1)//factor, (len(yEdges)-1)//factor
+	extent= [xEdges[0], xEdges[nx*factor], yEdges[ny*factor], yEdges[0]]
+	figName= metaData['HM_GRP_NAME']+'_'+get_stim_name(stimB)+'_vs_'+get_stim_name(stimA)+'_diff'
+	title= 'occupancy %s - %s (%s exps)'%(get_stim_name(stimB), get_stim_name(stimA), len(results))
+	save_heatmap(plot_difference_heatmap(diff, pValues, extent, title, metaData.get('STATS_ALPHA', STATS_ALPHA)), figName+'.png', metaData)
+	try:
+		np.savez_compressed(metaData['OUT_PATH']+metaData['OUT_FOLDER']+figName+'.npz', kind=np.array(HM_DIFF_KIND), diff=diff, se=se, pValues=pValues, extent=extent,
+							expDates=np.array([r['expDate'] for r in results]))
+	except Exception as e:
+		print('  -ERROR! while saving difference heatmap data: %s --> %s'%(figName, e))
+	return int(np.count_nonzero(pValues < metaData.get('STATS_ALPHA', STATS_ALPHA)))
+
+
+def save_stats(stats, metaData):
+	""" Save the statistics in OUT_PATH+OUT_FOLDER+HM_GRP_NAME_stats.yaml
+	"""
+	fileName= metaData['OUT_PATH']+metaData['OUT_FOLDER']+metaData['HM_GRP_NAME']+'_stats.yaml'
+	try:
+		with open(fileName, 'w') as f:
+			yaml.safe_dump(stats, f, default_flow_style=None, sort_keys=False)
+		print(' Statistics saved in: %s'%fileName)
+	except Exception as e:
+		print(' ERROR while saving statistics in: %s --> %s'%(fileName, e))
+
+
+# == MAIN ==
+if __name__== '__main__':
+	#Load CONSTANTS related to the experiment
+	expMetaData= load_metaData()
+	set_batch_backend(expMetaData)
+	if expMetaData.get('CLEAR_CACHE', False):
+		clear_cache(expMetaData)
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
+
+	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files (in N_WORKERS processes)
+	if expMetaData.get('PIPELINE_MODE', False):
+		#The next experiments are read in a background thread while the current one is processed
+		results= run_exp_prefetch(filesList, expMetaData, read_exp, compute_exp)
+	else:
+		results= run_exp_pipeline(filesList, expMetaData, process_exp)
+	results= list(results)
+	if not results:
+		print(' No experiments found')
+		sys.exit(0)
+
+	stimA, stimB= expMetaData.get('STATS_STIMS', STATS_STIMS)
+	level= expMetaData.get('CI_LEVEL', CI_LEVEL)
+	nameB= get_stim_name(stimB)+' vs '+get_stim_name(stimA)
+	stats= {'stims': [get_stim_name(stimA), get_stim_name(stimB)], 'expDates': [r['expDate'] for r in results], 'ciLevel': level}
+	#Flight activity ratio resampling the experiments (paired) and the trajectories of each stim
+	stats['activityRatioExps']= ratio_stats([r['flightTime'][stimB] for r in results], [r['flightTime'][stimA] for r in results], expMetaData)
+	stats['activityRatioTrajs']= ratio_stats(np.concatenate([r['trajDurations'][stimB] for r in results]),
+											np.concatenate([r['trajDurations'][stimA] for r in results]), expMetaData, paired=False)
+	#Occupancy of the test cue region (difference between the stims, paired by experiment)
+	stats['cueOccupancyDiff']= paired_difference_stats([r['cueOccupancy'][stimA] for r in results], [r['cueOccupancy'][stimB] for r in results], expMetaData)
+	stats['diffHeatmapSignificantBins']= generate_difference_heatmap(results, stimA, stimB, expMetaData)
+
+	print("GROUP STATISTICS %s for %s experiments"%(nameB, len(results)))
+	print_stats('	- Flight time ratio (experiments)', stats['activityRatioExps'], level)
+	print_stats('	- Flight time ratio (trajectories)', stats['activityRatioTrajs'], level)
+	print_stats('	- Test cue region occupancy difference', stats['cueOccupancyDiff'], level)
+	print('	- Difference heatmap bins with p < %s: %s'%(expMetaData.get('STATS_ALPHA', STATS_ALPHA), stats['diffHeatmapSignificantBins']))
+	save_stats(stats, expMetaData)
@@ -0,0 +1,132 @@
+"""
+File containing the functions to keep an on-disk cache of the preprocessed experiments.
+Each experiment is stored as one .npy file per column (trimmed, filtered and with the odor stimulus already set)
+so it can be loaded back as memory-mapped arrays instead of reading and cleaning the h5 file again
+"""
+import os
+import re
+import shutil
+import hashlib
+import numpy as np
+from Exp_Info import SETTINGS_FIELDS
+from h5_loader import TS_MAX_DELAY
+
+
+# Version of the preprocessing. Change it when the preprocessing changes to invalidate the old entries
+CACHE_VERSION= 4
+# Default max size of the cache in MB
+CACHE_MAX_SIZE_MB= 20000
+# Name of the cache entries (expDate_ + hash of get_cache_key): other files or folders in the cache path are never evicted
+ENTRY_NAME= re.compile(r'^.+_[0-9a-f]{16}$')
+# Settings positions mirrored with the Y positions, and the sign that undoes the mirroring
+MIRRORED_FIELDS= ('posOdor', 'posClrBASE', 'posClrTEST')
+MIRROR_SIGNS= np.array([1.0, -1.0, 1.0])
+
+
+def get_cache_path(metaData):
+	""" Folder where the cache entries are stored (CACHE_PATH or OUT_PATH/exp_cache/ if not defined)
+	"""
+	return metaData.get('CACHE_PATH', metaData['OUT_PATH']+'exp_cache/')
+
+
+def get_cache_key(exp, metaData):
+	""" Fingerprint of the experiment: h5 path, size and mtime, settings, wind tunnel limits and rows searched (H5_MAX_DELAY)
+	"""
+	h5Name= os.path.abspath(metaData['IN_PATH']+exp.fileName)
+	h5Stat= os.stat(h5Name)
+	fingerprint= [CACHE_VERSION, h5Name, h5Stat.st_size, h5Stat.st_mtime_ns, metaData['DATASET'],
+				metaData['LIM_X'], metaData['LIM_Y'], metaData['LIM_Z'], str(exp.coordDtype),
+				metaData.get('H5_MAX_DELAY', TS_MAX_DELAY)]
+	for field in SETTINGS_FIELDS:
+		value= getattr(exp, field)
+		if field in MIRRORED_FIELDS and exp.ySign < 0:
+			#The cues are mirrored with the data (exp_loader.mirror_exp_for_group): the key is the one of the exp not mirrored
+			value= value*MIRROR_SIGNS
+		fingerprint.append(value.tolist() if isinstance(value, np.ndarray) else value)
+	return exp.expDate+'_'+hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()[:16]
+
+
+def get_entry_path(exp, metaData):
+	""" Folder of the cache entry of exp, to keep other data computed from the preprocessed columns (as the spatial index).
+	None if the cache is disabled or exp is not in the cache
+	"""
+	if not metaData.get('USE_CACHE', True):
+		return None
+	try:
+		entryPath= os.path.join(get_cache_path(metaData), get_cache_key(exp, metaData))
+	except OSError:
+		return None
+	return entryPath if os.path.isdir(entryPath) else None
+
+
+def load_cached_exp(exp, metaData):
+	""" Load the preprocessed columns of exp from the cache as read-only memory-mapped arrays.
+	Return False if the experiment is not in the cache (or the cache is disabled with USE_CACHE)
+	"""
+	if not metaData.get('USE_CACHE', True):
+		return False
+	try:
+		entryPath= os.path.join(get_cache_path(metaData), get_cache_key(exp, metaData))
+		if not os.path.isdir(entryPath):
+			return False
+		exp.load_columns(entryPath, 'r')
+		#Update the entry time to keep track of the least recently used entries
+		os.utime(entryPath)
+		return True
+	except Exception as e:
+		print(' ERROR while loading exp %s from cache --> %s'%(exp.expDate, e))
+		return False
+
+
+def save_cached_exp(exp, metaData):
+	""" Save the preprocessed columns of exp in the cache and evict old entries if the cache is too big
+	"""
+	if not metaData.get('USE_CACHE', True):
+		return
+	cachePath= get_cache_path(metaData)
+	try:
+		entryPath= os.path.join(cachePath, get_cache_key(exp, metaData))
+		tmpPath= entryPath+'.tmp%s'%os.getpid()
+		exp.save_columns(tmpPath)
+		#Rename once all the columns are written, so a half written entry is never used
+		if os.path.isdir(entryPath):
+			shutil.rmtree(tmpPath)
+		else:
+			os.rename(tmpPath, entryPath)
+	except Exception as e:
+		print(' ERROR while saving exp %s in cache --> %s'%(exp.expDate, e))
+		return
+	evict_cache(cachePath, metaData.get('CACHE_MAX_SIZE_MB', CACHE_MAX_SIZE_MB)*1024*1024)
+
+
+def get_entry_size(entryPath):
+	return sum(os.path.getsize(os.path.join(entryPath, f)) for f in os.listdir(entryPath))
+
+
+def evict_cache(cachePath, maxBytes):
+	""" Remove the least recently used entries until the cache size is below maxBytes
+	"""
+	entries= [os.path.join(cachePath, e) for e in os.listdir(cachePath) if ENTRY_NAME.match(e)]
+	entries= [e for e in entries if os.path.isdir(e)]
+	entries= sorted(entries, key=os.path.getmtime)
+	sizes= [get_entry_size(e) for e in entries]
+	totalSize= sum(sizes)
+	for entryPath, size in zip(entries, sizes):
+		#Always keep the most recent entry
+		if totalSize <= maxBytes or entryPath == entries[-1]:
+			break
+		try:
+			shutil.rmtree(entryPath)
+			totalSize-= size
+			print(' Cache entry %s removed'%os.path.basename(entryPath))
+		except Exception as e:
+			print(' ERROR while removing cache entry %s --> %s'%(entryPath, e))
+
+
+def clear_cache(metaData):
+	""" Remove all the entries of the cache
+	"""
+	cachePath= get_cache_path(metaData)
+	if os.path.isdir(cachePath):
+		shutil.rmtree(cachePath)
+		print(' Cache %s cleared'%cachePath)
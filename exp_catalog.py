@@ -0,0 +1,136 @@
+"""
+File containing the catalog of the experiments in IN_PATH: one small table (json file) with the settings of every
+experiment (.yaml file) and the size and number of rows of its h5 file. It is refreshed only for the files that changed,
+so the scripts can select the experiments of a group without opening every settings and h5 file
+"""
+import os
+import glob
+import json
+import h5py
+from exp_loader import load_settings
+
+
+# Version of the catalog file. Change it when the entries change to rebuild the catalog
+CATALOG_VERSION= 1
+
+
+def get_catalog_file(metaData):
+	""" File where the catalog is stored (CATALOG_FILE or OUT_PATH/exp_catalog.json if not defined). It is kept out of
+	CACHE_PATH, where every entry is a cache entry that can be evicted
+	"""
+	return metaData.get('CATALOG_FILE', metaData['OUT_PATH']+'exp_catalog.json')
+
+
+def get_file_stat(fileName):
+	""" (size, mtime) of a file or (None, None) if it doesn't exist
+	"""
+	try:
+		fileStat= os.stat(fileName)
+		return fileStat.st_size, fileStat.st_mtime_ns
+	except OSError:
+		return None, None
+
+
+def get_h5_rows(h5Name, datasetName):
+	""" Number of rows of the Flydra dataset (only the h5 metadata is read)
+	"""
+	try:
+		with h5py.File(h5Name, 'r') as hf:
+			return int(hf[datasetName].shape[0])
+	except Exception:
+		return None
+
+
+def create_entry(fname, metaData):
+	""" Catalog entry with the settings of the experiment in fname and its h5 file information
+	"""
+	settings= load_settings(fname)
+	entry= {'settingsFile': fname, 'settingsMtime': get_file_stat(fname)[1]}
+	for field in ('expDate', 'fileName', 'type', 'gender', 'clrBASE', 'clrTEST', 'ts_1_StartExp', 'ts_2_CO2', 'ts_3_PostCO2', 'ts_4_EndExp'):
+		entry[field]= getattr(settings, field)
+	entry['lux']= getattr(settings, 'lux', None)
+	for field in ('posOdor', 'posClrBASE', 'posClrTEST'):
+		entry[field]= [float(p) for p in getattr(settings, field)]
+	#Y axis side of the TEST cue, as used by GRP_BY
+	entry['testSide']= 'Nve' if entry['posClrTEST'][1] < 0 else 'Pve'
+	h5Name= metaData['IN_PATH']+entry['fileName']
+	entry['h5Size'], entry['h5Mtime']= get_file_stat(h5Name)
+	entry['h5Rows']= get_h5_rows(h5Name, metaData['DATASET']) if entry['h5Size'] is not None else None
+	return entry
+
+
+def is_entry_updated(entry, fname, metaData):
+	""" True if the settings and h5 files didn't change since the entry was created
+	"""
+	if entry.get('settingsMtime') != get_file_stat(fname)[1]:
+		return False
+	return (entry['h5Size'], entry['h5Mtime']) == get_file_stat(metaData['IN_PATH']+entry['fileName'])
+
+
+def load_catalog(metaData):
+	""" Load the catalog of IN_PATH, updating only the entries of the files added or changed since the last run
+	Return the list of entries (one dict per experiment) sorted by settings file
+	"""
+	catalogFile= get_catalog_file(metaData)
+	catalog= {}
+	try:
+		with open(catalogFile, 'r') as f:
+			stored= json.load(f)
+		if stored.get('version') == CATALOG_VERSION and stored.get('IN_PATH') == metaData['IN_PATH']:
+			catalog= stored['entries']
+	except (OSError, ValueError):
+		pass
+
+	changed= False
+	entries= {}
+	for fname in sorted(glob.glob(metaData['IN_PATH']+'/*.yaml')):
+		entry= catalog.get(fname)
+		if entry is None or not is_entry_updated(entry, fname, metaData):
+			try:
+				entry= create_entry(fname, metaData)
+			except Exception as e:
+				print(' ERROR while adding file %s to the catalog --> %s'%(fname, e))
+				continue
+			changed= True
+		entries[fname]= entry
+	changed= changed or (len(entries) != len(catalog))
+
+	if changed:
+		try:
+			os.makedirs(os.path.dirname(catalogFile) or '.', exist_ok=True)
+			with open(catalogFile, 'w') as f:
+				json.dump({'version': CATALOG_VERSION, 'IN_PATH': metaData['IN_PATH'], 'entries': entries}, f)
+			print(' Catalog %s updated (%s experiments)'%(catalogFile, len(entries)))
+		except Exception as e:
+			print(' ERROR while saving catalog %s --> %s'%(catalogFile, e))
+	return list(entries.values())
+
+
+def match_value(value, condition):
+	""" condition can be a value (equal), a list/tuple/set of values (any of them) or a function returning True/False
+	"""
+	if callable(condition):
+		return condition(value)
+	if isinstance(condition, (list, tuple, set)):
+		return value in condition
+	return value == condition
+
+
+def query_catalog(entries, **conditions):
+	""" Entries matching all the conditions, for example: query_catalog(entries, clrTEST='black', type=['wt'], lux=lambda l: l >= 50)
+	"""
+	return [e for e in entries if all(match_value(e.get(field), cond) for field, cond in conditions.items())]
+
+
+def select_exp_files(metaData):
+	""" Settings files of the experiments to process: the experiments in the catalog matching EXP_FILTER (all if it is not
+	defined) that have their h5 file in IN_PATH
+	"""
+	entries= query_catalog(load_catalog(metaData), **(metaData.get('EXP_FILTER') or {}))
+	filesList= []
+	for entry in entries:
+		if entry['h5Size'] is None:
+			print(' ERROR h5 file %s for settings %s not found'%(entry['fileName'], entry['settingsFile']))
+			continue
+		filesList.append(entry['settingsFile'])
+	return filesList
@@ -0,0 +1,80 @@
+"""
+File containing the functions shared by the scripts to load the experiments (settings from the .yaml file and data from the Flydra h5 file)
+"""
+import types
+import yaml
+from Exp_Info import Exp_Info, COORD_DTYPE
+from h5_loader import load_h5_columns, TS_CHUNK_SIZE, TS_MAX_DELAY
+from exp_cache import load_cached_exp, save_cached_exp
+from exp_store import load_stored_exp
+
+
+class SettingsLoader(yaml.SafeLoader):
+	""" Safe yaml loader for the exp settings files: the !!python/object:__main__.Exp_Info tag is read as a plain object with the file values
+	"""
+	pass
+
+
+def construct_settings(loader, suffix, node):
+	return types.SimpleNamespace(**loader.construct_mapping(node, deep=True))
+
+SettingsLoader.add_multi_constructor('tag:yaml.org,2002:python/object:', construct_settings)
+
+
+def load_settings(fname):
+	""" Read an exp settings (.yaml) file
+	"""
+	with open(fname, 'r') as f:
+		return yaml.load(f, Loader=SettingsLoader)
+
+
+def load_expConfig_only(fname, metaData):
+	""" Load the configuration settings of an experiment and its data from FLydra
+	"""
+	try:
+		dataMap= Exp_Info(load_settings(fname), metaData.get('COORD_DTYPE', COORD_DTYPE))
+		print(' Configuration settings for experiment on %s loaded sucessfuly'%dataMap.expDate)
+		return dataMap
+	except Exception as e:
+		print(' ERROR while loading experiment configuration settings for file: %s'%fname)
+		print(e)
+
+
+def load_exp_data(exp, metaData):
+	""" Load the data from FLydra for a given experiment
+	"""
+	try:
+		#If the exp is in the consolidated store (consolidate_store.py), its columns are slices of the store (no copy)
+		if load_stored_exp(exp, metaData):
+			print(' Experiment %s data loaded from store'%exp.fileName)
+			return
+		#If the exp was already preprocessed with the same h5 file and settings, load it from the cache
+		if load_cached_exp(exp, metaData):
+			print(' Experiment %s data loaded from cache'%exp.fileName)
+			return
+		#Read only the columns used and the rows between the startExp and endExp
+		dataset= load_h5_columns(metaData['IN_PATH']+exp.fileName, metaData['DATASET'], exp.ts_1_StartExp, exp.ts_4_EndExp, metaData.get('H5_CHUNK_SIZE', TS_CHUNK_SIZE),
+									metaData.get('H5_MAX_DELAY', TS_MAX_DELAY))
+		#Add the obj_ID, frame, x, y, z and ts to exp
+		exp.set_h5_information(dataset['obj_id'], dataset['frame'], dataset['timestamp'], dataset['x'], dataset['y'], dataset['z'])
+		#Clean the data outside the startExp and endExp and the points outside volume
+		exp.clean_data(metaData)
+		#set the odor stimulus used in each par of the experiment
+		exp.set_odor_stim()
+		save_cached_exp(exp, metaData)
+		print(' Experiment %s data loaded'%exp.fileName)
+	except:
+		print(' ERROR while loading data for file: %s'%exp.fileName)
+
+
+def mirror_exp_for_group(exp, grpBy):
+	""" Mirror the Y positions (and the cues and odor Y position) if the TEST Cue is not in the Y axis side used to group (GRP_BY= 'Pve' or 'Nve').
+	Return True if the exp was mirrored
+	"""
+	if (('Pve' in grpBy) and (exp.posClrTEST[1] < 0)) or (('Nve' in grpBy) and (exp.posClrTEST[1] >= 0)):
+		exp.mirror_y()
+		exp.posClrTEST[1]= -exp.posClrTEST[1]
+		exp.posClrBASE[1]= -exp.posClrBASE[1]
+		exp.posOdor[1]= -exp.posOdor[1]
+		return True
+	return False
@@ -0,0 +1,183 @@
+"""
+File containing the resampling statistics of a group of experiments: bootstrap confidence intervals and permutation tests
+of the CO2 vs AIR activity ratio (resampling experiments or trajectories), the occupancy of a cue region and the difference
+heatmaps. The resamples are drawn as matrices (resamples x experiments or trajectories) and the statistics of a whole batch
+are computed with matrix products. Each batch has its own seed, spawned from STATS_SEED, so the results are reproducible
+and don't depend on the number of processes used (STATS_N_WORKERS)
+"""
+import os
+import multiprocessing
+import numpy as np
+
+
+# Default number of resamples of the bootstrap and of the permutation tests
+N_RESAMPLES= 10000
+# Default seed of the resamples
+STATS_SEED= 0
+# Max number of resamples per batch, and max number of values (resamples x units or bins) computed at once by a batch
+STATS_BATCH_SIZE= 1000
+STATS_BATCH_CELLS= 20000000
+# Default confidence level of the intervals
+CI_LEVEL= 0.95
+
+
+def get_batches(nResamples, cellsPerResample, seed):
+	""" (seed, number of resamples) of each batch. The batches only depend on the data size, never on the processes used
+	"""
+	batchSize= int(max(1, min(STATS_BATCH_SIZE, STATS_BATCH_CELLS // max(cellsPerResample, 1))))
+	sizes= [min(batchSize, nResamples - start) for start in range(0, nResamples, batchSize)]
+	return list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+
+def get_n_workers(metaData):
+	""" Number of processes of the resampling (STATS_N_WORKERS, 0 == all the cpus, 1 == no parallel mode)
+	"""
+	nWorkers= metaData.get('STATS_N_WORKERS', 1)
+	if nWorkers <= 0:
+		nWorkers= os.cpu_count()
+	return nWorkers
+
+
+def run_batches(batchTask, args, nResamples, cellsPerResample, metaData):
+	""" Run batchTask(seedSeq, size, *args) for each batch of resamples (in STATS_N_WORKERS processes) and return
+	the results in batch order. batchTask must be a module level function (it is sent to the workers)
+	"""
+	batches= get_batches(nResamples, cellsPerResample, metaData.get('STATS_SEED', STATS_SEED))
+	nWorkers= min(get_n_workers(metaData), len(batches))
+	if nWorkers <= 1:
+		return [batchTask(seedSeq, size, *args) for seedSeq, size in batches]
+	with multiprocessing.Pool(nWorkers) as pool:
+		return pool.starmap(batchTask, [(seedSeq, size)+tuple(args) for seedSeq, size in batches])
+
+
+def bootstrap_weights(rng, size, n):
+	""" Times each of the n units is drawn in each of the size resamples (size x n): the resampled sums are weights @ values
+	"""
+	return rng.multinomial(n, np.full(n, 1.0/n), size=size)
+
+
+def resample_sums(rng, size, values):
+	""" Sum of each of the size bootstrap resamples of values (drawn as a matrix of indexes, faster than the weights for many units)
+	"""
+	return values[rng.integers(0, len(values), size=(size, len(values)), dtype=np.int32)].sum(axis=1)
+
+
+def get_ci(values, level):
+	""" Percentile interval of the resampled values
+	"""
+	alpha= 100*(1 - level)/2
+	return [float(v) for v in np.nanpercentile(values, [alpha, 100 - alpha])]
+
+
+def get_p_value(nExtreme, nResamples):
+	""" Permutation p-value (the observed value counts as one of the resamples, so it is never 0)
+	"""
+	return (1 + nExtreme) / (nResamples + 1)
+
+
+def log_ratio(num, den):
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return np.abs(np.log(num / den))
+
+
+# == Batches (module level functions, so they can be run in the workers) ==
+
+def ratio_boot_batch(seedSeq, size, num, den, paired):
+	""" Ratio of sums sum(num)/sum(den) of size bootstrap resamples. paired: num and den are values of the same units
+	(experiments), resampled together. Otherwise (trajectories of each odor stim) they are resampled independently
+	"""
+	rng= np.random.default_rng(seedSeq)
+	if paired:
+		weights= bootstrap_weights(rng, size, len(num))
+		return (weights @ num) / (weights @ den)
+	return resample_sums(rng, size, num) / resample_sums(rng, size, den)
+
+
+def ratio_perm_batch(seedSeq, size, num, den, paired, observed):
+	""" Number of the size permutations with a ratio of sums at least as far from 1 as observed (log scale). paired: the
+	num and den values of each unit are swapped at random. Otherwise the labels of the pooled units are shuffled
+	"""
+	rng= np.random.default_rng(seedSeq)
+	if paired:
+		swap= rng.integers(0, 2, size=(size, len(num)))
+		permNum= num.sum() + swap @ (den - num)
+		permDen= den.sum() + swap @ (num - den)
+	else:
+		pooled= np.concatenate((num, den))
+		#The num units of each permutation are the len(num) with the smallest random keys
+		chosen= np.argpartition(rng.random((size, len(pooled)), dtype=np.float32), len(num)-1, axis=1)[:, :len(num)]
+		permNum= pooled[chosen].sum(axis=1)
+		permDen= pooled.sum() - permNum
+	return int(np.count_nonzero(log_ratio(permNum, permDen) >= log_ratio(observed, 1.0) - 1e-12))
+
+
+def mean_boot_batch(seedSeq, size, values):
+	""" Sum and sum of squares (over the size resamples) of the mean of the rows of values (experiments x bins) of each
+	bootstrap resample. Only the moments are returned, so the bins of a heatmap never need size x bins memory in total
+	"""
+	means= (bootstrap_weights(np.random.default_rng(seedSeq), size, len(values)) @ values) / len(values)
+	return means.sum(axis=0), (means**2).sum(axis=0)
+
+
+def mean_resample_batch(seedSeq, size, values):
+	""" Mean of the values (one per experiment) of each of the size bootstrap resamples
+	"""
+	return (bootstrap_weights(np.random.default_rng(seedSeq), size, len(values)) @ values) / len(values)
+
+
+def sign_flip_batch(seedSeq, size, values, observed):
+	""" Number of the size sign flips (paired permutations: the two odor stim of each experiment are swapped at random) with
+	a mean of the rows of values at least as extreme as observed, per column
+	"""
+	signs= np.random.default_rng(seedSeq).integers(0, 2, size=(size, len(values)))*2 - 1
+	means= (signs @ values) / len(values)
+	return np.count_nonzero(np.abs(means) >= np.abs(observed) - 1e-12, axis=0)
+
+
+# == Statistics ==
+
+def ratio_stats(num, den, metaData, paired=True):
+	""" Ratio of sums sum(num)/sum(den) (CO2 vs AIR flight time) with its bootstrap interval and permutation p-value.
+	paired: num and den are values per experiment, otherwise values per trajectory of each odor stim
+	"""
+	num= np.asarray(num, float)
+	den= np.asarray(den, float)
+	nResamples= metaData.get('N_RESAMPLES', N_RESAMPLES)
+	observed= num.sum() / den.sum() if den.sum() > 0 else np.nan
+	nUnits= len(num) + (0 if paired else len(den))
+	if not np.isfinite(observed) or not len(num):
+		return {'value': float(observed), 'ci': [np.nan, np.nan], 'pValue': np.nan, 'nUnits': nUnits}
+	boot= np.concatenate(run_batches(ratio_boot_batch, (num, den, paired), nResamples, 2*nUnits, metaData))
+	nExtreme= sum(run_batches(ratio_perm_batch, (num, den, paired, observed), nResamples, 2*nUnits, metaData))
+	return {'value': float(observed), 'ci': get_ci(boot, metaData.get('CI_LEVEL', CI_LEVEL)), 'pValue': float(get_p_value(nExtreme, nResamples)),
+			'nUnits': nUnits}
+
+
+def paired_difference_stats(valuesA, valuesB, metaData):
+	""" Mean over the experiments of valuesB - valuesA (one value per experiment, as the occupancy of a cue region in
+	two odor stim) with its bootstrap interval and sign flip permutation p-value
+	"""
+	diff= np.asarray(valuesB, float) - np.asarray(valuesA, float)
+	nResamples= metaData.get('N_RESAMPLES', N_RESAMPLES)
+	observed= diff.mean()
+	boot= np.concatenate(run_batches(mean_resample_batch, (diff,), nResamples, len(diff), metaData))
+	nExtreme= sum(run_batches(sign_flip_batch, (diff[:, None], np.array([observed])), nResamples, len(diff), metaData))[0]
+	return {'value': float(observed), 'ci': get_ci(boot, metaData.get('CI_LEVEL', CI_LEVEL)), 'pValue': float(get_p_value(nExtreme, nResamples)),
+			'nUnits': len(diff)}
+
+
+def difference_heatmap_stats(gridsA, gridsB, metaData):
+	""" Difference heatmap: mean over the experiments of gridsB - gridsA (normalized occupancy grids, experiments x bins...)
+	with the bootstrap standard error and the sign flip permutation p-value of each bin. Return (difference, se, pValues)
+	with the shape of one grid
+	"""
+	gridsA= np.asarray(gridsA, float)
+	shape= gridsA.shape[1:]
+	diff= (np.asarray(gridsB, float) - gridsA).reshape(len(gridsA), -1)
+	nResamples= metaData.get('N_RESAMPLES', N_RESAMPLES)
+	observed= diff.mean(axis=0)
+	moments= run_batches(mean_boot_batch, (diff,), nResamples, diff.size, metaData)
+	meanBoot= sum(m[0] for m in moments) / nResamples
+	se= np.sqrt(np.maximum(sum(m[1] for m in moments) / nResamples - meanBoot**2, 0))
+	nExtreme= sum(run_batches(sign_flip_batch, (diff, observed), nResamples, diff.size, metaData))
+	return observed.reshape(shape), se.reshape(shape), get_p_value(nExtreme, nResamples).reshape(shape)
@@ -0,0 +1,136 @@
+"""
+File containing the consolidated store of the experiments: the preprocessed columns of every experiment of the catalog
+concatenated in one .npy file per column, an offsets table (first row of each experiment) and a metadata table (yaml)
+with the settings and cache key of each experiment. The columns are memory-mapped once per process and each experiment
+is loaded as slices of them (no copy), so the group scripts don't read or preprocess the h5 files again.
+The store is written by consolidate_store.py
+"""
+import os
+import shutil
+import yaml
+import numpy as np
+from Exp_Info import DATA_COLUMNS
+from exp_cache import get_cache_key
+
+
+# Version of the store. Change it when the store layout changes to ignore the old stores
+STORE_VERSION= 1
+# Metadata table and offsets table of the store
+STORE_TABLE= 'store.yaml'
+OFFSETS_FILE= 'offsets.npy'
+# Stores already opened in this process {store path: ExpStore}
+OPEN_STORES= {}
+
+
+def get_store_path(metaData):
+	""" Folder of the store (STORE_PATH or OUT_PATH/exp_store/ if not defined)
+	"""
+	return metaData.get('STORE_PATH', metaData['OUT_PATH']+'exp_store/')
+
+
+class ExpStore:
+	""" Store opened for reading: columns (memory maps of the whole store), offsets and the metadata table of the experiments
+	"""
+	def __init__(self, storePath):
+		with open(os.path.join(storePath, STORE_TABLE), 'r') as f:
+			table= yaml.safe_load(f)
+		if table.get('version') != STORE_VERSION:
+			raise ValueError('store version %s is not %s'%(table.get('version'), STORE_VERSION))
+		self.mtime= os.path.getmtime(os.path.join(storePath, STORE_TABLE))
+		self.exps= table['exps']				# Metadata of each experiment (settings header, cache key and settings file)
+		self.offsets= np.load(os.path.join(storePath, OFFSETS_FILE))
+		self.columns= {col: np.load(os.path.join(storePath, col+'.npy'), mmap_mode='r') for col in DATA_COLUMNS}
+		self.slots= {entry['key']: i for i, entry in enumerate(self.exps)}
+
+	def get_columns(self, slot):
+		""" Columns of the experiment in slot (slices of the memory maps, no copy)
+		"""
+		rows= slice(int(self.offsets[slot]), int(self.offsets[slot+1]))
+		return {col: values[rows] for col, values in self.columns.items()}
+
+
+def open_store(metaData):
+	""" Store of get_store_path (opened once per process, and again if it was written after). None if there is no store
+	"""
+	storePath= get_store_path(metaData)
+	tableFile= os.path.join(storePath, STORE_TABLE)
+	if not os.path.isfile(tableFile):
+		return None
+	store= OPEN_STORES.get(storePath)
+	if store is None or store.mtime != os.path.getmtime(tableFile):
+		try:
+			store= ExpStore(storePath)
+		except Exception as e:
+			print(' ERROR while opening the experiments store %s --> %s'%(storePath, e))
+			return None
+		OPEN_STORES[storePath]= store
+	return store
+
+
+def load_stored_exp(exp, metaData):
+	""" Set the columns of exp as slices of the store if it was stored with the same h5 file and settings (same cache key).
+	Return False if the store is disabled (USE_STORE) or exp is not in the store
+	"""
+	if not metaData.get('USE_STORE', True):
+		return False
+	store= open_store(metaData)
+	if store is None:
+		return False
+	try:
+		slot= store.slots.get(get_cache_key(exp, metaData))
+	except OSError:
+		return False
+	if slot is None:
+		return False
+	exp.set_columns(store.get_columns(slot))
+	return True
+
+
+def write_npy_from_raw(rawName, npyName, dtype, nRows):
+	""" Write the .npy file with the rows of rawName (raw bytes of dtype) and remove rawName
+	"""
+	with open(npyName, 'wb') as out:
+		np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (nRows,)})
+		with open(rawName, 'rb') as raw:
+			shutil.copyfileobj(raw, out, 16*1024*1024)
+	os.remove(rawName)
+
+
+def write_store(exps, metaData):
+	""" Write the store with the experiments given by exps (iterable of (settings file, exp) with the preprocessed data, not
+	mirrored). The columns are appended one experiment at a time, so the experiments are never all in memory.
+	The new store replaces the old one once it is complete. Return the number of experiments stored
+	"""
+	storePath= os.path.normpath(get_store_path(metaData))
+	tmpPath= storePath+'.tmp%s'%os.getpid()
+	shutil.rmtree(tmpPath, ignore_errors=True)
+	os.makedirs(tmpPath)
+	rawFiles= {col: open(os.path.join(tmpPath, col+'.raw'), 'wb') for col in DATA_COLUMNS}
+	dtypes= {}
+	entries= []
+	offsets= [0]
+	try:
+		for fname, exp in exps:
+			nRows= len(exp.TS_List)
+			for col, dtype in DATA_COLUMNS.items():
+				#The dtype of each column is the one of the first experiment (unless it is fixed in DATA_COLUMNS)
+				dtypes.setdefault(col, np.dtype(dtype or np.asarray(getattr(exp, col)).dtype))
+				rawFiles[col].write(np.ascontiguousarray(getattr(exp, col), dtype=dtypes[col]).tobytes())
+			header= exp.get_header()
+			header.pop('columns')
+			entries.append({'key': get_cache_key(exp, metaData), 'settingsFile': fname, 'start': offsets[-1], 'header': header})
+			offsets.append(offsets[-1] + nRows)
+			print(' Experiment %s stored (%s rows)'%(exp.expDate, nRows))
+	finally:
+		for f in rawFiles.values():
+			f.close()
+	for col in DATA_COLUMNS:
+		write_npy_from_raw(os.path.join(tmpPath, col+'.raw'), os.path.join(tmpPath, col+'.npy'), dtypes.get(col, DATA_COLUMNS[col] or np.float32), offsets[-1])
+	np.save(os.path.join(tmpPath, OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+	#The metadata table is written last, so a store with table always has all its columns
+	with open(os.path.join(tmpPath, STORE_TABLE), 'w') as f:
+		yaml.safe_dump({'version': STORE_VERSION, 'IN_PATH': metaData['IN_PATH'], 'nRows': offsets[-1],
+						'columns': {col: str(dtype) for col, dtype in dtypes.items()}, 'exps': entries}, f, default_flow_style=None, sort_keys=False)
+	shutil.rmtree(storePath, ignore_errors=True)
+	os.rename(tmpPath, storePath)
+	return len(entries)
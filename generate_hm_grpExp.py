@@ -4,23 +4,20 @@ It will check which of the experiments had the TEST color cue located in the sam
  group the data (X,Y,Z) positions and odor stim used in each entry to plot all the data together in a heatmap for a given odor
 """
 import sys
-import glob
 import yaml
-from Exp_Info import Exp_Info
-import numpy as np
-import h5py
-import matplotlib.pyplot as plt 
-import time
+from exp_loader import load_expConfig_only, load_exp_data, mirror_exp_for_group
+from parallel_pipeline import run_exp_pipeline
+from io_pipeline import run_exp_prefetch
+from exp_cache import clear_cache
+from exp_catalog import select_exp_files
+from stream_exp import stream_exp
+from heatmaps import get_stim_name, get_odor_options, sum_heatmaps, sum_mean_heatmaps, sum_heatmap_series, HM_SERIES_WINDOW
+from kinematics import KIN_RANGES
+from hm_render import plot_heatmap, save_heatmap, get_heatmap_info, render_group_heatmap, set_batch_backend, save_heatmap_series_data, render_heatmap_series
 import pathlib
 
 
 
-def find_files_list(path, ext):
-	""" Find all exp configuration files (.yaml files) in folder. They are needed to load their corresponding h5 files later
-	"""
-	return glob.glob(path+'/*'+ext)
-
-
 def load_metaData():
 	""" Load constant values related to the experiment setup and workspaces
 	"""
@@ -37,99 +34,70 @@ def load_metaData():
 		sys.exit(1)
 
 
-def load_expConfig_only(fname, metaData):
-	""" Load the configuration settings of an experiment and its data from FLydra
+def generate_kinematics_heatmap_for_group(hmResult, name, option, ct, cb, metaData, figName):
+	""" Save the group heatmap of the mean kinematic value name (see kinematics.KINEMATICS)
 	"""
-	try: 
-		with open(fname, 'r') as f:
-			#dataMap= Exp_Info.Exp_Info(yaml.load(f))
-			dataMap= Exp_Info(yaml.load(f, Loader=yaml.FullLoader))
-			print(' Configuration settings for experiment on %s loaded sucessfuly'%dataMap.expDate)
-		return dataMap
-	except: 
-		print(' ERROR while loading experiment configuration settings for file: %s'%fname)
+	stim= get_stim_name(option)
+	vmin, vmax= metaData.get('KIN_RANGES', {}).get(name, KIN_RANGES[name])
+	fig= plot_heatmap(hmResult, ct, cb, stim+' '+name, vmax, useFigManager=False, vmin=vmin)
+	save_heatmap(fig, figName+'_'+stim+'_'+name+'.png', metaData)
 
 
-def load_exp_data(exp, metaData):
-	""" Load the data from FLydra for a given experiment
+def generate_heatmap_series_for_group(series, option, ct, cb, metaData, figName, expDates=()):
+	""" Save the group heatmap series (.npz) and its animation if HM_SERIES_VIDEO is set
 	"""
-	try:
-		hf=h5py.File(metaData['IN_PATH']+exp.fileName, 'r')
-		#print('file %s loaded'%fname )
-		dataset= hf.get(metaData['DATASET'])
-		dataset= np.array(dataset)
-		#Add the obj_ID, frame, x, y, z and ts to exp
-		exp.set_h5_information(dataset['obj_id'], dataset['frame'], dataset['timestamp'], dataset['x'], dataset['y'], dataset['z'])
-		#Clean the data outside the startExp and endExp
-		exp.apply_start_end_ts()
-		#Remove points outside volume
-		exp.erase_pos_outside_wt(metaData)
-		#set the odor stimulus used in each par of the experiment
-		exp.set_odor_stim()
-		print(' Experiment %s data loaded'%exp.fileName)
-	except:
-		print(' ERROR while loading data for file: %s'%exp.fileName)
-
-
-
-def generate_heatmap_for_group(xVal, yVal, zVal, ct, cb, metaData, figName):
-	# create heatmap
-	if (metaData['ODOR'] == 1): stim= 'AIR'
-	elif (metaData['ODOR'] == 2): stim='CO2'
-	else: stim= 'PostCO2'
-
-	nbins= (600,200)
-	heatmapXY, xedges, yedges= np.histogram2d(xVal, yVal, bins=nbins)
-	extentXY= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-	heatmapXZ,xedges, yedges = np.histogram2d(xVal, zVal, bins=nbins)
-	extentXZ= [xedges[0], xedges[-1], yedges[-1], yedges[0]]
-	
-	# The height of each bar is the relative number of observations, 
-	# (Number of observations in bin / Total number of observations). The sum of the bar heights is 1.
-	topValNorm=  metaData['NORM'] #0.00008	#0.0001 #
-	normHeatmXY= np.empty(nbins, float)
-	normHeatmXZ= np.empty(nbins, float)
-	countsSumXY= np.sum(heatmapXY)
-	countsSumXZ= np.sum(heatmapXZ)
-	for i in range(nbins[0]):
-		for j in range(nbins[1]):
-#				print('i: %s - j:%s'%(i,j))
-			normHeatmXY[i][j] = float(heatmapXY[i][j]) / countsSumXY 
-			normHeatmXZ[i][j] = float(heatmapXZ[i][j]) / countsSumXZ 
-	normHeatmXY= np.transpose(normHeatmXY)
-	normHeatmXZ= np.transpose(normHeatmXZ)
-	
-	#plot heatmap
-	fig, hm= plt.subplots(nrows=2,ncols=1)
-	hm[0].set_title('heatmap %s vs %s x-y axis with stim= %s'%(ct, cb, stim))
-	hm[0].set_xlabel('X axis')
-	hm[0].set_ylabel('Y axis')
-	val= hm[0].imshow(normHeatmXY, vmin=0, vmax=topValNorm, extent= extentXY, cmap='jet')
-	hm[0].invert_yaxis()
-	#hm[0].set_xlim([-LIM_X, LIM_X])
-	#hm[0].set_ylim([-LIM_Y, LIM_Y])
-	fig.colorbar(val, ax=hm[0])
-
-	hm[1].set_title('heatmap %s vs %s x-z axis with stim= %s'%(ct, cb, stim))
-	hm[1].set_xlabel('X axis')
-	hm[1].set_ylabel('Z axis')
-	val2= hm[1].imshow(normHeatmXZ, vmin=0, vmax=topValNorm,  extent= extentXZ, cmap='jet')
-	hm[1].invert_yaxis()
-	hm[1].set_ylim([0,0.6])		
-	fig.colorbar(val2, ax=hm[1])
-
-	#Save figure
-	#heatmaps file naming format: 'hm_date_bc_tc_{1-3}_od
-	try:
-		figName= figName+'_'+stim+'_'+str(topValNorm)+'.png'
-		outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER'] #old output folder for heatmaps= python_heatmaps/'
-		fig.savefig(outputPath+figName, dpi=600)
-		print('  -Heatmap: %s saved in path: %s'%(figName,outputPath))
-	except:
-		print('  -ERROR! while saving img: %s in path: %s'%(figName,outputPath))
-
-	#CLose figure
-	plt.close(fig)
+	stim= get_stim_name(option)
+	topValNorm= metaData['NORM']
+	fileName= figName+'_'+stim+'_series.npz'
+	info= get_heatmap_info(option, ct, cb, topValNorm, group=metaData['HM_GRP_NAME'], grpBy=metaData['GRP_BY'], expDates=list(expDates),
+						windowSize=metaData.get('HM_SERIES_WINDOW', HM_SERIES_WINDOW))
+	save_heatmap_series_data(series, fileName, metaData, info)
+	if metaData.get('HM_SERIES_VIDEO'):
+		render_heatmap_series(series, ct, cb, stim, topValNorm, fileName, metaData, metaData.get('HM_SERIES_CUMULATIVE', False))
+
+
+def read_exp(fname, metaData):
+	""" Load an experiment and mirror it to the GRP_BY side (in streaming mode its heatmaps are also accumulated while reading)
+	"""
+	exp= load_expConfig_only(fname, metaData)
+	if metaData.get('STREAM_MODE', False):
+		#The heatmaps of the 3 odor stim are accumulated reading the h5 file by chunks (the data is never fully loaded)
+		mirror_exp_for_group(exp, metaData['GRP_BY'])
+		stream_exp(exp, metaData)
+	else:
+		# Load the experiment and mirror it if the TEST Cue is not in the Y axis side used to group (GRP_BY)
+		load_exp_data(exp, metaData)
+		mirror_exp_for_group(exp, metaData['GRP_BY'])
+	return exp
+
+
+def compute_exp(exp, metaData, writer=None):
+	""" Generate the heatmaps of exp for the odor selected (or all of them). The figures are saved by writer if it is given.
+	Return the exp settings and its heatmaps (without its data) to group them later
+	"""
+	#ODOR 0 == all the odor stim: the heatmaps for the 3 of them are computed in one pass
+	if metaData['ODOR'] == 0 and not metaData.get('STREAM_MODE', False):
+		exp.compute_all_heatmaps(metaData)
+	for option in get_odor_options(metaData):	#option 2 == only CO2
+		exp.generate_heatmap(option, metaData, writer)
+		#Mean speed, heading... heatmaps and time series (the streaming mode doesn't keep the points to compute them)
+		if not metaData.get('STREAM_MODE', False):
+			for name in metaData.get('KINEMATICS_HM') or []:
+				exp.generate_kinematics_heatmap(name, option, metaData)
+			#Heatmaps per time window of the odor stim
+			if metaData.get('HM_SERIES', False):
+				exp.generate_heatmap_series(option, metaData)
+	#Only the settings are sent back to the main process
+	exp.set_h5_information([], [], [], [], [], [])
+	exp.stim_List=[]
+	exp.stimRanges={}
+	return exp
+
+
+def process_exp(fname, metaData):
+	""" Load an experiment, mirror it to the GRP_BY side and generate its heatmaps for the odor selected (or all of them)
+	"""
+	return compute_exp(read_exp(fname, metaData), metaData)
 
 
 # == MAIN ==
@@ -138,39 +106,24 @@ if __name__== '__main__':
 	expList=[]
 	#Load CONSTANTS related to the experiment
 	expMetaData= load_metaData()
-	#Find all the .yaml files (experiment cfg file) in folder
-	filesList= find_files_list(expMetaData['IN_PATH'], '.yaml')
+	set_batch_backend(expMetaData)
+	if expMetaData.get('CLEAR_CACHE', False):
+		clear_cache(expMetaData)
+	#Find the .yaml files (experiment cfg file) in folder matching EXP_FILTER (using the catalog of experiments)
+	filesList= select_exp_files(expMetaData)
 	
-	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files
-	tmpX=[]
-	tmpY= []
-	tmpZ=[]
-	tmpStim=[]
+	# Load data from .yaml (experiment cfg file) and .h5 (exp raw data) files (in N_WORKERS processes)
+	if expMetaData.get('PIPELINE_MODE', False):
+		#The next experiments are read and the figures saved in background threads while the current one is processed
+		results= run_exp_prefetch(filesList, expMetaData, read_exp, compute_exp)
+	else:
+		results= run_exp_pipeline(filesList, expMetaData, process_exp)
+
+	expHeatmaps={option: [] for option in get_odor_options(expMetaData)}
 	ctrlBase=''
 	ctrlTest=''
-	for i, fname in enumerate(filesList):
-		#t1=time.time()
-		expList.append(load_expConfig_only(fname, expMetaData))
-		if ('Pve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-					expList[i].posClrTEST[1]= str(float(expList[i].posClrTEST[1])*(-1))
-					expList[i].posClrBASE[1]= str(float(expList[i].posClrBASE[1])*(-1))
-
-
-		elif ('Nve' in expMetaData['GRP_BY']):
-			# If the TEST Cue is in the POSITIVE Y axis, load the experiment and group it to the other exp with TEST Cue in similar position
-			load_exp_data(expList[i], expMetaData)
-
-			if ('-' not in expList[i].posClrTEST[1]):
-					expList[i].Y_List = expList[i].Y_List*(-1)
-					expList[i].posClrTEST[1]= str(float(expList[i].posClrTEST[1])*(-1))
-					expList[i].posClrBASE[1]= str(float(expList[i].posClrBASE[1])*(-1))
-
-
+	for i, exp in enumerate(results):
+		expList.append(exp)
 		#Check that the test and base color cues are equals in all the files that we are grouping
 		if i>0:
 			if (ctrlBase != expList[i].clrBASE) or (ctrlTest != expList[i].clrTEST):
@@ -182,21 +135,25 @@ if __name__== '__main__':
 			ctrlBase= expList[i].clrBASE
 			ctrlTest= expList[i].clrTEST
 
-		option= expMetaData['ODOR']	#option 2 == only CO2
-		odorIndex= np.where(expList[i].stim_List == option)
-
 		print('i: %s - %s'%(i,expList[i].posClrTEST))
-		tmpX= np.hstack((tmpX, expList[i].X_List[odorIndex]))
-		tmpY= np.hstack((tmpY, expList[i].Y_List[odorIndex]))
-		tmpZ= np.hstack((tmpZ, expList[i].Z_List[odorIndex]))
-		tmpStim= np.hstack((tmpStim, expList[i].stim_List[odorIndex]))
-
-		expList[i].generate_heatmap(option, expMetaData)
+		for option in expHeatmaps:
+			expHeatmaps[option].append(expList[i].heatmaps[option])
 
 	#Set img name
 	imgTitle= expMetaData['HM_GRP_NAME']
 	
 	#imgTitle= 'hm_grouped_posNve_black_vs_white'
 	#generate_heatmap_for_group(tmpX, tmpY, tmpZ, tmpStim, 2, 'black', 'white', expMetaData, imgTitle)
-	generate_heatmap_for_group(tmpX, tmpY, tmpZ, 'black', 'white', expMetaData, imgTitle)
+	#The group heatmap is the sum of the single exp heatmaps (all of them in the same fixed grid)
+	for option in expHeatmaps:
+		render_group_heatmap(sum_heatmaps(expHeatmaps[option]), option, 'black', 'white', expMetaData, imgTitle, [exp.expDate for exp in expList])
+		#The mean kinematics heatmaps of the group add the sums and number of values of each exp
+		for name in expMetaData.get('KINEMATICS_HM') or []:
+			kinHeatmaps= [exp.heatmaps[(option, name)] for exp in expList if (option, name) in exp.heatmaps]
+			if kinHeatmaps:
+				generate_kinematics_heatmap_for_group(sum_mean_heatmaps(kinHeatmaps), name, option, 'black', 'white', expMetaData, imgTitle)
+		#The group series adds the windows with the same time from the start of the odor stim
+		seriesList= [exp.heatmaps[(option, 'series')] for exp in expList if (option, 'series') in exp.heatmaps]
+		if seriesList:
+			generate_heatmap_series_for_group(sum_heatmap_series(seriesList), option, 'black', 'white', expMetaData, imgTitle, [exp.expDate for exp in expList])
 	print('current status')
@@ -0,0 +1,89 @@
+"""
+File containing the functions to read the data from the Flydra h5 files.
+Only the columns used in the analysis are read and only for the rows recorded during the experiment
+"""
+import numpy as np
+import h5py
+
+
+# Columns of the Flydra dataset (kalman_estimates) used in the analysis
+H5_COLUMNS= ('obj_id', 'frame', 'timestamp', 'x', 'y', 'z')
+# Number of rows read at once while searching the timestamps
+TS_CHUNK_SIZE= 65536
+# Max time (s) between the timestamp of a row and the time it was written (length of the longest trajectory)
+TS_MAX_DELAY= 300
+# Number of rows read at once in streaming mode
+STREAM_CHUNK_SIZE= 1000000
+
+
+def search_ts_row(tsField, nRows, ts, side='left', chunkSize=TS_CHUNK_SIZE):
+	""" Binary search of the row where ts should be inserted in the timestamp column (as np.searchsorted).
+	The search reads single rows until the remaining interval fits in one chunk, which is read and searched at once
+	"""
+	lo= 0
+	hi= nRows
+	while hi - lo > chunkSize:
+		mid= (lo + hi)//2
+		val= tsField[mid]
+		if (val < ts) or (side == 'right' and val == ts):
+			lo= mid + 1
+		else:
+			hi= mid
+	if hi == lo:
+		return lo
+	return lo + int(np.searchsorted(tsField[lo:hi], ts, side=side))
+
+
+def has_exp_rows(ts, tsStart, tsEnd):
+	""" True if any of the timestamps ts is between tsStart and tsEnd
+	"""
+	return bool(np.any((ts >= tsStart) & (ts <= tsEnd)))
+
+
+def find_exp_rows(dataset, tsStart, tsEnd, chunkSize=TS_CHUNK_SIZE, maxDelay=TS_MAX_DELAY):
+	""" Find the range of rows [rowStart, rowEnd) of dataset recorded between tsStart and tsEnd.
+	Flydra writes the estimates when a trajectory is finished, so the timestamps are only approximately sorted: a row is
+	written at most maxDelay seconds after its timestamp. The range is searched between tsStart-maxDelay and tsEnd+maxDelay
+	and extended by chunks on each side until a whole chunk has no timestamp between tsStart and tsEnd. The exact trim
+	is done later with the timestamps read
+	"""
+	nRows= dataset.shape[0]
+	tsField= dataset.fields('timestamp')
+	rowStart= search_ts_row(tsField, nRows, tsStart - maxDelay, 'left', chunkSize)
+	rowEnd= search_ts_row(tsField, nRows, tsEnd + maxDelay, 'right', chunkSize)
+	while rowStart > 0:
+		chunkStart= max(0, rowStart - chunkSize)
+		inRange= has_exp_rows(tsField[chunkStart:rowStart], tsStart, tsEnd)
+		rowStart= chunkStart
+		if not inRange:
+			break
+	while rowEnd < nRows:
+		chunkEnd= min(nRows, rowEnd + chunkSize)
+		inRange= has_exp_rows(tsField[rowEnd:chunkEnd], tsStart, tsEnd)
+		rowEnd= chunkEnd
+		if not inRange:
+			break
+	return rowStart, rowEnd
+
+
+def load_h5_columns(fileName, datasetName, tsStart, tsEnd, chunkSize=TS_CHUNK_SIZE, maxDelay=TS_MAX_DELAY):
+	""" Read the H5_COLUMNS of the rows recorded between tsStart and tsEnd. Return a dict {column name: np.array}
+	"""
+	with h5py.File(fileName, 'r') as hf:
+		dataset= hf[datasetName]
+		rowStart, rowEnd= find_exp_rows(dataset, tsStart, tsEnd, chunkSize, maxDelay)
+		data= dataset.fields(list(H5_COLUMNS))[rowStart:rowEnd]
+	return {col: np.ascontiguousarray(data[col]) for col in H5_COLUMNS}
+
+
+def iter_h5_chunks(fileName, datasetName, tsStart, tsEnd, chunkSize=STREAM_CHUNK_SIZE, tsChunkSize=TS_CHUNK_SIZE, maxDelay=TS_MAX_DELAY):
+	""" Read the H5_COLUMNS of the rows recorded between tsStart and tsEnd by chunks of chunkSize rows.
+	Yield a dict {column name: np.array} per chunk (the timestamps must still be trimmed exactly)
+	"""
+	with h5py.File(fileName, 'r') as hf:
+		dataset= hf[datasetName]
+		rowStart, rowEnd= find_exp_rows(dataset, tsStart, tsEnd, tsChunkSize, maxDelay)
+		fields= dataset.fields(list(H5_COLUMNS))
+		for start in range(rowStart, rowEnd, chunkSize):
+			data= fields[start:min(start+chunkSize, rowEnd)]
+			yield {col: data[col] for col in H5_COLUMNS}
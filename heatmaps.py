@@ -0,0 +1,421 @@
+"""
+File containing the functions to compute the heatmaps (XY and XZ occupancy) of the experiments.
+Only the numeric part is done here, the figures are created in hm_render.py
+"""
+import json
+import numpy as np
+
+
+# Number of bins used for the X and for the Y/Z axis of the heatmaps
+NBINS= (600,200)
+# Odor stimulus names (1=='AIR', 2=='CO2' or 3=='PostCO2')
+STIM_NAMES= {1:'AIR', 2:'CO2', 3:'PostCO2'}
+# Default length (s) of the time windows of the heatmap series
+HM_SERIES_WINDOW= 60
+# Kind of the arrays saved in the .npz files of OUT_FOLDER (only the heatmaps can be rendered again by rerender_heatmaps.py)
+HM_KIND= 'heatmap'
+HM_SERIES_KIND= 'series'
+HM_DIFF_KIND= 'difference'
+
+
+def get_odor_options(metaData):
+	""" Odor stimulus to process: ODOR in ExpMetaData.yaml (1, 2 or 3) or all of them if ODOR is 0
+	"""
+	if metaData['ODOR'] == 0:
+		return list(STIM_NAMES)
+	return [metaData['ODOR']]
+
+
+def get_stim_name(option):
+	""" Return the name of the odor stimulus used for option (1=='AIR', 2=='CO2' or 3=='PostCO2')
+	"""
+	return STIM_NAMES.get(option, 'PostCO2')
+
+
+def normalize_counts(counts):
+	""" The height of each bar is the relative number of observations,
+	(Number of observations in bin / Total number of observations). The sum of the bar heights is 1.
+	The output is transposed to be plotted with imshow (Y/Z in rows, X in columns)
+	"""
+	countsSum= counts.sum()
+	if countsSum == 0:
+		return np.zeros(counts.shape[::-1], float)
+	return np.transpose(counts / float(countsSum))
+
+
+class HeatmapResult:
+	""" Plain container with the XY and XZ heatmaps of a set of positions
+	"""
+	def __init__(self, countsXY, countsXZ, extentXY, extentXZ, countsYZ=None, extentYZ=None):
+		self.countsXY= countsXY		# Raw counts per bin for the X-Y plane (shape= NBINS)
+		self.countsXZ= countsXZ		# Raw counts per bin for the X-Z plane (shape= NBINS)
+		self.extentXY= extentXY		# [xmin, xmax, ymax, ymin] as used by imshow
+		self.extentXZ= extentXZ		# [xmin, xmax, zmax, zmin] as used by imshow
+		self.countsYZ= countsYZ		# Raw counts per bin for the Y-Z plane (None if not computed)
+		self.extentYZ= extentYZ		# [ymin, ymax, zmax, zmin] as used by imshow
+
+	@property
+	def normXY(self):
+		return normalize_counts(self.countsXY)
+
+	@property
+	def normXZ(self):
+		return normalize_counts(self.countsXZ)
+
+	@property
+	def normYZ(self):
+		return normalize_counts(self.countsYZ)
+
+
+def get_grid_edges(metaData, nbins=NBINS):
+	""" Fixed bin edges defined by the wind tunnel limits (X in [-LIM_X, LIM_X], Y in [-LIM_Y, LIM_Y] and Z in [0, LIM_Z]).
+	All the experiments and groups are binned in this grid, so their counts can be added
+	"""
+	xEdges= np.linspace(-metaData['LIM_X'], metaData['LIM_X'], nbins[0]+1)
+	yEdges= np.linspace(-metaData['LIM_Y'], metaData['LIM_Y'], nbins[1]+1)
+	zEdges= np.linspace(0, metaData['LIM_Z'], nbins[1]+1)
+	return xEdges, yEdges, zEdges
+
+
+def get_bin_index(vals, edges):
+	""" Bin of each value in the uniform grid defined by edges (-1 if the value is outside the grid)
+	"""
+	nbins= len(edges)-1
+	idx= np.floor((vals - edges[0]) * (nbins / (edges[-1] - edges[0])))
+	idx[vals == edges[-1]]= nbins-1
+	idx[~((idx >= 0) & (idx < nbins))]= -1
+	return idx.astype(np.intp)
+
+
+def count_bins(idx1, idx2, shape):
+	""" 2D histogram of the bin indexes idx1, idx2 (the points with index -1 are not counted)
+	"""
+	valid= (idx1 >= 0) & (idx2 >= 0)
+	flatIdx= idx1[valid]*shape[1] + idx2[valid]
+	return np.bincount(flatIdx, minlength=shape[0]*shape[1]).reshape(shape).astype(np.uint32)
+
+
+def compute_heatmap(xVal, yVal, zVal, metaData, nbins=NBINS):
+	""" Compute the XY and XZ occupancy heatmaps for the given positions in the fixed WT grid
+	"""
+	xEdges, yEdges, zEdges= get_grid_edges(metaData, nbins)
+	xIdx= get_bin_index(xVal, xEdges)
+	heatmapXY= count_bins(xIdx, get_bin_index(yVal, yEdges), nbins)
+	heatmapXZ= count_bins(xIdx, get_bin_index(zVal, zEdges), nbins)
+	extentXY= [xEdges[0], xEdges[-1], yEdges[-1], yEdges[0]]
+	extentXZ= [xEdges[0], xEdges[-1], zEdges[-1], zEdges[0]]
+	return HeatmapResult(heatmapXY, heatmapXZ, extentXY, extentXZ)
+
+
+def sum_bins(idx1, idx2, values, shape):
+	""" 2D histogram of the bin indexes idx1, idx2 weighted by values: (sum of the values, number of values) per bin.
+	The points with index -1 or with a NaN value are not counted
+	"""
+	valid= (idx1 >= 0) & (idx2 >= 0) & np.isfinite(values)
+	flatIdx= idx1[valid]*shape[1] + idx2[valid]
+	sums= np.bincount(flatIdx, weights=values[valid], minlength=shape[0]*shape[1]).reshape(shape)
+	return sums, np.bincount(flatIdx, minlength=shape[0]*shape[1]).reshape(shape)
+
+
+def mean_values(sums, nValues):
+	""" Mean value per bin (NaN in the bins without values), transposed to be plotted with imshow as normalize_counts
+	"""
+	mean= np.full(sums.shape, np.nan)
+	np.divide(sums, nValues, out=mean, where=nValues > 0)
+	return np.transpose(mean)
+
+
+class MeanHeatmapResult:
+	""" Plain container with the XY and XZ heatmaps of the mean of a value (speed, heading...) per bin. The sums and number
+	of values are kept, so the heatmaps of several experiments can be added
+	"""
+	countsYZ= None		# Same planes as the HeatmapResult plotted by hm_render.plot_heatmap
+
+	def __init__(self, sumXY, nXY, sumXZ, nXZ, extentXY, extentXZ):
+		self.sumXY= sumXY			# Sum of the values per bin for the X-Y plane (shape= NBINS)
+		self.nXY= nXY				# Number of values per bin for the X-Y plane
+		self.sumXZ= sumXZ			# Sum of the values per bin for the X-Z plane
+		self.nXZ= nXZ				# Number of values per bin for the X-Z plane
+		self.extentXY= extentXY
+		self.extentXZ= extentXZ
+		self.extentYZ= None
+
+	@property
+	def normXY(self):
+		return mean_values(self.sumXY, self.nXY)
+
+	@property
+	def normXZ(self):
+		return mean_values(self.sumXZ, self.nXZ)
+
+
+def compute_mean_heatmap(xVal, yVal, zVal, values, metaData, nbins=NBINS):
+	""" Compute the XY and XZ heatmaps of the mean of values (one per position) in the fixed WT grid
+	"""
+	xEdges, yEdges, zEdges= get_grid_edges(metaData, nbins)
+	xIdx= get_bin_index(xVal, xEdges)
+	values= np.asarray(values, float)
+	sumXY, nXY= sum_bins(xIdx, get_bin_index(yVal, yEdges), values, nbins)
+	sumXZ, nXZ= sum_bins(xIdx, get_bin_index(zVal, zEdges), values, nbins)
+	return MeanHeatmapResult(sumXY, nXY, sumXZ, nXZ, [xEdges[0], xEdges[-1], yEdges[-1], yEdges[0]], [xEdges[0], xEdges[-1], zEdges[-1], zEdges[0]])
+
+
+def sum_mean_heatmaps(hmList):
+	""" Group mean value heatmap: the sums and number of values of heatmaps computed in the same grid are added
+	"""
+	return MeanHeatmapResult(sum(hm.sumXY for hm in hmList), sum(hm.nXY for hm in hmList), sum(hm.sumXZ for hm in hmList),
+							sum(hm.nXZ for hm in hmList), hmList[0].extentXY, hmList[0].extentXZ)
+
+
+def count_group_bins(groupIdx, nGroups, idx1, idx2, shape):
+	""" 2D histogram of the bin indexes idx1, idx2 for each group of points (odor stim, time window...) in one bincount.
+	Output shape= (nGroups,)+shape
+	"""
+	valid= (groupIdx >= 0) & (groupIdx < nGroups) & (idx1 >= 0) & (idx2 >= 0)
+	flatIdx= (groupIdx[valid]*shape[0] + idx1[valid])*shape[1] + idx2[valid]
+	return np.bincount(flatIdx, minlength=nGroups*shape[0]*shape[1]).reshape((nGroups,)+shape).astype(np.uint32)
+
+
+def count_stim_bins(stimIdx, idx1, idx2, shape):
+	""" 2D histogram of the bin indexes idx1, idx2 for each odor stim (output shape= (nStim,)+shape)
+	"""
+	return count_group_bins(stimIdx, len(STIM_NAMES), idx1, idx2, shape)
+
+
+class HeatmapAccumulator:
+	""" XY, XZ and YZ heatmaps of the 3 odor stim in the fixed WT grid, built adding the points by chunks.
+	The bin of each point is found once and the 3 planes are counted for all the stim at once
+	(a full stim x X x Y x Z voxel grid would need 72M bins)
+	"""
+	def __init__(self, metaData, nbins=NBINS):
+		self.nbins= nbins
+		self.xEdges, self.yEdges, self.zEdges= get_grid_edges(metaData, nbins)
+		nStim= len(STIM_NAMES)
+		self.countsXY= np.zeros((nStim,)+nbins, np.uint64)
+		self.countsXZ= np.zeros((nStim,)+nbins, np.uint64)
+		self.countsYZ= np.zeros((nStim, nbins[1], nbins[1]), np.uint64)
+
+	def add(self, xVal, yVal, zVal, stimVal):
+		""" Add the points (x,y,z) with odor stim stimVal to the heatmaps
+		"""
+		xIdx= get_bin_index(xVal, self.xEdges)
+		yIdx= get_bin_index(yVal, self.yEdges)
+		zIdx= get_bin_index(zVal, self.zEdges)
+		stimIdx= np.asarray(stimVal, dtype=np.intp) - 1
+		self.countsXY+= count_stim_bins(stimIdx, xIdx, yIdx, self.nbins)
+		self.countsXZ+= count_stim_bins(stimIdx, xIdx, zIdx, self.nbins)
+		self.countsYZ+= count_stim_bins(stimIdx, yIdx, zIdx, (self.nbins[1], self.nbins[1]))
+
+	def get_heatmaps(self):
+		""" Dict {option: HeatmapResult} with the heatmaps of each odor stim
+		"""
+		extentXY= [self.xEdges[0], self.xEdges[-1], self.yEdges[-1], self.yEdges[0]]
+		extentXZ= [self.xEdges[0], self.xEdges[-1], self.zEdges[-1], self.zEdges[0]]
+		extentYZ= [self.yEdges[0], self.yEdges[-1], self.zEdges[-1], self.zEdges[0]]
+		return {option: HeatmapResult(self.countsXY[option-1], self.countsXZ[option-1], extentXY, extentXZ, self.countsYZ[option-1], extentYZ) for option in STIM_NAMES}
+
+
+def compute_all_heatmaps(xVal, yVal, zVal, stimVal, metaData, nbins=NBINS):
+	""" Compute the XY, XZ and YZ heatmaps of the 3 odor stim in one pass. Return a dict {option: HeatmapResult}
+	"""
+	hmAcc= HeatmapAccumulator(metaData, nbins)
+	hmAcc.add(xVal, yVal, zVal, stimVal)
+	return hmAcc.get_heatmaps()
+
+
+def sum_heatmaps(hmList):
+	""" Group heatmap: sum of the counts of heatmaps computed in the same grid (float counts if some heatmap was shifted by a fraction of bin)
+	"""
+	dtype= np.result_type(np.uint64, *[hm.countsXY.dtype for hm in hmList])
+	countsXY= np.zeros(hmList[0].countsXY.shape, dtype)
+	countsXZ= np.zeros(hmList[0].countsXZ.shape, dtype)
+	countsYZ= None
+	if all(hm.countsYZ is not None for hm in hmList):
+		countsYZ= np.zeros(hmList[0].countsYZ.shape, dtype)
+	for hm in hmList:
+		countsXY+= hm.countsXY
+		countsXZ+= hm.countsXZ
+		if countsYZ is not None:
+			countsYZ+= hm.countsYZ
+	return HeatmapResult(countsXY, countsXZ, hmList[0].extentXY, hmList[0].extentXZ, countsYZ, hmList[0].extentYZ)
+
+
+def get_region_fraction(counts, metaData, center, radius):
+	""" Fraction of the XY counts in the bins whose center is within radius of center ([x, y] in the heatmap coordinates)
+	"""
+	xEdges, yEdges, _= get_grid_edges(metaData, counts.shape)
+	xCenters= 0.5*(xEdges[1:] + xEdges[:-1])
+	yCenters= 0.5*(yEdges[1:] + yEdges[:-1])
+	inRegion= (xCenters[:, None] - center[0])**2 + (yCenters[None, :] - center[1])**2 <= radius**2
+	total= counts.sum()
+	return float(counts[inRegion].sum() / total) if total > 0 else 0.0
+
+
+def get_window_edges(tsStart, tsEnd, windowSize):
+	""" Timestamps of the edges of the consecutive windows of windowSize seconds from tsStart to tsEnd (the last one can be shorter)
+	"""
+	if tsEnd <= tsStart:
+		return np.array([tsStart, tsStart], dtype=float)
+	return np.append(np.arange(tsStart, tsEnd, windowSize, dtype=float), float(tsEnd))
+
+
+class HeatmapSeries:
+	""" Plain container with the XY and XZ heatmaps of consecutive time windows (stacks of counts, one per window).
+	windowEdges are the seconds from the start of the odor stim, so the series of several experiments can be added
+	"""
+	def __init__(self, countsXY, countsXZ, windowEdges, extentXY, extentXZ):
+		self.countsXY= countsXY			# Raw counts per window and bin for the X-Y plane (shape= (nWindows,)+NBINS)
+		self.countsXZ= countsXZ			# Raw counts per window and bin for the X-Z plane
+		self.windowEdges= windowEdges	# Edges (s from the start of the odor stim) of the windows
+		self.extentXY= extentXY
+		self.extentXZ= extentXZ
+
+	def __len__(self):
+		return len(self.countsXY)
+
+	def get_window(self, i):
+		""" HeatmapResult of the window i (views of the stacks, no copy)
+		"""
+		return HeatmapResult(self.countsXY[i], self.countsXZ[i], self.extentXY, self.extentXZ)
+
+	def get_cumulative(self):
+		""" Series where each window has the counts from the start of the odor stim to its end (running sums of the windows)
+		"""
+		return HeatmapSeries(np.cumsum(self.countsXY, axis=0, dtype=np.uint64), np.cumsum(self.countsXZ, axis=0, dtype=np.uint64),
+							self.windowEdges, self.extentXY, self.extentXZ)
+
+
+def compute_heatmap_series(tsVal, xVal, yVal, zVal, windowEdges, metaData, nbins=NBINS):
+	""" Heatmaps of the time windows defined by windowEdges (timestamps) in one pass over the points. The points must be
+	sorted by timestamp (as the rows of an exp): the rows of each window are found with searchsorted on the edges and
+	the bins of all the windows are counted at once (the points are never scanned once per window)
+	"""
+	nWindows= len(windowEdges)-1
+	#The last edge is included, as the end of the experiment in Exp_Info.get_ts_mask
+	bounds= np.append(np.searchsorted(tsVal, windowEdges[:-1], side='left'), np.searchsorted(tsVal, windowEdges[-1], side='right'))
+	rows= slice(bounds[0], bounds[-1])
+	windowIdx= np.repeat(np.arange(nWindows, dtype=np.intp), np.diff(bounds))
+	xEdges, yEdges, zEdges= get_grid_edges(metaData, nbins)
+	xIdx= get_bin_index(xVal[rows], xEdges)
+	countsXY= count_group_bins(windowIdx, nWindows, xIdx, get_bin_index(yVal[rows], yEdges), nbins)
+	countsXZ= count_group_bins(windowIdx, nWindows, xIdx, get_bin_index(zVal[rows], zEdges), nbins)
+	extentXY= [xEdges[0], xEdges[-1], yEdges[-1], yEdges[0]]
+	extentXZ= [xEdges[0], xEdges[-1], zEdges[-1], zEdges[0]]
+	return HeatmapSeries(countsXY, countsXZ, np.asarray(windowEdges, float) - windowEdges[0], extentXY, extentXZ)
+
+
+def sum_heatmap_series(seriesList):
+	""" Group series: sum of the counts of the windows with the same time from the start of the odor stim
+	(the windows missing in the shorter series count as empty)
+	"""
+	longest= max(seriesList, key=len)
+	countsXY= np.zeros(longest.countsXY.shape, np.uint64)
+	countsXZ= np.zeros(longest.countsXZ.shape, np.uint64)
+	for series in seriesList:
+		countsXY[:len(series)]+= series.countsXY
+		countsXZ[:len(series)]+= series.countsXZ
+	return HeatmapSeries(countsXY, countsXZ, longest.windowEdges, longest.extentXY, longest.extentXZ)
+
+
+def shift_counts(counts, shiftX, shiftY):
+	""" Move the counts shiftX bins in the first axis and shiftY bins in the second one (the counts moved outside the grid are lost)
+	"""
+	shifted= np.zeros_like(counts)
+	nx, ny= counts.shape
+	if abs(shiftX) >= nx or abs(shiftY) >= ny:
+		return shifted
+	shifted[max(shiftX,0):nx+min(shiftX,0), max(shiftY,0):ny+min(shiftY,0)]= counts[max(-shiftX,0):nx+min(-shiftX,0), max(-shiftY,0):ny+min(-shiftY,0)]
+	return shifted
+
+
+def shift_counts_subbin(counts, shiftX, shiftY):
+	""" Move the counts a fraction of bins: the counts of each bin are spread (bilinear weights) over the 4 bins around its
+	new position. Whole bin shifts give the same counts as shift_counts (as float)
+	"""
+	baseX= int(np.floor(shiftX))
+	baseY= int(np.floor(shiftY))
+	fracX= shiftX - baseX
+	fracY= shiftY - baseY
+	shifted= np.zeros(counts.shape, float)
+	for dx, wx in ((0, 1-fracX), (1, fracX)):
+		for dy, wy in ((0, 1-fracY), (1, fracY)):
+			if wx*wy > 0:
+				shifted+= wx*wy*shift_counts(counts, baseX+dx, baseY+dy)
+	return shifted
+
+
+def shift_heatmap(hm, deltaX, deltaY, subBin=False):
+	""" Align a heatmap moving its positions deltaX, deltaY. They are rounded to whole bins unless subBin is True (bilinear
+	spread of the counts, see shift_counts_subbin). Z is not moved
+	"""
+	binX= (hm.extentXY[1] - hm.extentXY[0]) / hm.countsXY.shape[0]
+	binY= (hm.extentXY[2] - hm.extentXY[3]) / hm.countsXY.shape[1]
+	if subBin:
+		shiftX= deltaX / binX
+		shiftY= deltaY / binY
+		shift= shift_counts_subbin
+	else:
+		shiftX= int(round(deltaX / binX))
+		shiftY= int(round(deltaY / binY))
+		shift= shift_counts
+	countsYZ= None if hm.countsYZ is None else shift(hm.countsYZ, shiftY, 0)
+	return HeatmapResult(shift(hm.countsXY, shiftX, shiftY), shift(hm.countsXZ, shiftX, 0), hm.extentXY, hm.extentXZ, countsYZ, hm.extentYZ)
+
+
+def downsample_counts(counts, factor):
+	""" Add the counts of each block of factor x factor bins (low resolution version of a heatmap). The last bins are dropped
+	if the grid size is not a multiple of factor
+	"""
+	nx, ny= counts.shape[0]//factor, counts.shape[1]//factor
+	return counts[:nx*factor, :ny*factor].reshape(nx, factor, ny, factor).sum(axis=(1, 3))
+
+
+def save_heatmap_arrays(hmResult, fileName, info):
+	""" Save the counts, normalized grids and extents of hmResult and its info (dict with the stim, experiment or group...)
+	in a .npz file. The info is stored as json, so the file can be loaded without pickle
+	"""
+	arrays= {'countsXY': hmResult.countsXY, 'countsXZ': hmResult.countsXZ, 'normXY': hmResult.normXY.astype(np.float32),
+			'normXZ': hmResult.normXZ.astype(np.float32), 'extentXY': hmResult.extentXY, 'extentXZ': hmResult.extentXZ}
+	if hmResult.countsYZ is not None:
+		arrays.update(countsYZ= hmResult.countsYZ, normYZ= hmResult.normYZ.astype(np.float32), extentYZ= hmResult.extentYZ)
+	np.savez_compressed(fileName, kind=np.array(HM_KIND), info=np.array(json.dumps(info)), **arrays)
+
+
+def load_heatmap_arrays(fileName):
+	""" Load a heatmap saved with save_heatmap_arrays. Return the HeatmapResult and its info dict
+	"""
+	with np.load(fileName) as data:
+		hasYZ= 'countsYZ' in data
+		hmResult= HeatmapResult(data['countsXY'], data['countsXZ'], list(data['extentXY']), list(data['extentXZ']),
+								data['countsYZ'] if hasYZ else None, list(data['extentYZ']) if hasYZ else None)
+		info= json.loads(str(data['info']))
+	return hmResult, info
+
+
+def get_saved_kind(fileName):
+	""" Kind of the arrays saved in a .npz file (HM_KIND, HM_SERIES_KIND...). The files saved without kind are heatmaps
+	if they have 2d XY counts, None otherwise
+	"""
+	with np.load(fileName) as data:
+		if 'kind' in data:
+			return str(data['kind'])
+		if 'countsXY' in data and data['countsXY'].ndim == 2:
+			return HM_KIND
+	return None
+
+
+def save_heatmap_series(series, fileName, info):
+	""" Save the counts of each window, the window edges and extents of series and its info in a .npz file
+	(the cumulative series is not saved: it is the cumsum of the windows)
+	"""
+	np.savez_compressed(fileName, kind=np.array(HM_SERIES_KIND), info=np.array(json.dumps(info)), countsXY=series.countsXY, countsXZ=series.countsXZ,
+						windowEdges=series.windowEdges, extentXY=series.extentXY, extentXZ=series.extentXZ)
+
+
+def load_heatmap_series(fileName):
+	""" Load a series saved with save_heatmap_series. Return the HeatmapSeries and its info dict
+	"""
+	with np.load(fileName) as data:
+		series= HeatmapSeries(data['countsXY'], data['countsXZ'], data['windowEdges'], list(data['extentXY']), list(data['extentXZ']))
+		info= json.loads(str(data['info']))
+	return series, info
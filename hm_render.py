@@ -0,0 +1,250 @@
+"""
+File containing the functions to plot and save the heatmaps computed in heatmaps.py
+"""
+import os
+import threading
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib import animation
+from matplotlib.figure import Figure
+from heatmaps import get_stim_name, save_heatmap_arrays, save_heatmap_series
+
+
+# Output dpi and format of the figures for each RENDER_TIER (FIG_DPI and FIG_FORMAT in ExpMetaData.yaml override them)
+RENDER_TIERS= {'preview': {'dpi': 100, 'format': 'png'}, 'publication': {'dpi': 600, 'format': 'png'}}
+DEFAULT_TIER= 'publication'
+# Planes of the heatmap figure: axis names used in the title and HeatmapResult attribute with the normalized counts
+HM_PLANES= (('x-y', 'normXY'), ('x-z', 'normXZ'), ('y-z', 'normYZ'))
+# Default colormap and Z axis limits of the heatmaps
+HM_CMAP= 'jet'
+HM_Z_LIM= (0,0.6)
+# Writers of the heatmap series animations (HM_SERIES_VIDEO) and default frames per second
+SERIES_WRITERS= {'gif': 'pillow', 'mp4': 'ffmpeg'}
+HM_SERIES_FPS= 4
+# Figure templates of each thread (see get_heatmap_figure)
+FIG_TEMPLATES= threading.local()
+
+
+def set_axis_lim(ax, lim):
+	""" Set the Y axis limits of ax keeping its direction (inverted or not)
+	"""
+	lo, hi= sorted(lim)
+	bottom, top= ax.get_ylim()
+	ax.set_ylim((hi, lo) if bottom > top else (lo, hi))
+
+
+def plot_heatmap(hmResult, ct, cb, stim, topValNorm, useFigManager=True, cmap=HM_CMAP, xLim=None, yLim=None, zLim=HM_Z_LIM, vmin=0):
+	""" Create the figure with the XY (top) and XZ (bottom) heatmaps of hmResult (and YZ if it was computed).
+	useFigManager=False creates a figure not managed by pyplot: it can't be shown but it can be drawn and saved from any thread.
+	xLim and yLim limit the X and Y axis shown (None= all the WT). The colors go from vmin to topValNorm
+	"""
+	nrows= 2 if hmResult.countsYZ is None else 3
+	if useFigManager:
+		fig, hm= plt.subplots(nrows=nrows,ncols=1)
+	else:
+		fig= Figure()
+		hm= fig.subplots(nrows=nrows,ncols=1)
+	hm[0].set_title('heatmap %s vs %s x-y axis with stim= %s'%(ct, cb, stim))
+	hm[0].set_xlabel('X axis')
+	hm[0].set_ylabel('Y axis')
+	val= hm[0].imshow(hmResult.normXY, vmin=vmin, vmax=topValNorm, extent= hmResult.extentXY, cmap=cmap)
+	hm[0].invert_yaxis()
+	if xLim is not None:
+		hm[0].set_xlim(xLim)
+	if yLim is not None:
+		set_axis_lim(hm[0], yLim)
+	fig.colorbar(val, ax=hm[0])
+
+	hm[1].set_title('heatmap %s vs %s x-z axis with stim= %s'%(ct, cb, stim))
+	hm[1].set_xlabel('X axis')
+	hm[1].set_ylabel('Z axis')
+	val2= hm[1].imshow(hmResult.normXZ, vmin=vmin, vmax=topValNorm,  extent= hmResult.extentXZ, cmap=cmap)
+	hm[1].invert_yaxis()
+	hm[1].set_ylim(list(zLim))
+	if xLim is not None:
+		hm[1].set_xlim(xLim)
+	fig.colorbar(val2, ax=hm[1])
+
+	if hmResult.countsYZ is not None:
+		hm[2].set_title('heatmap %s vs %s y-z axis with stim= %s'%(ct, cb, stim))
+		hm[2].set_xlabel('Y axis')
+		hm[2].set_ylabel('Z axis')
+		val3= hm[2].imshow(hmResult.normYZ, vmin=vmin, vmax=topValNorm,  extent= hmResult.extentYZ, cmap=cmap)
+		hm[2].invert_yaxis()
+		hm[2].set_ylim(list(zLim))
+		if yLim is not None:
+			hm[2].set_xlim(yLim)
+		fig.colorbar(val3, ax=hm[2])
+	return fig
+
+
+def plot_difference_heatmap(diff, pValues, extent, title, alpha=0.05):
+	""" Figure (not managed by pyplot) with the XY difference heatmap (top) and the same heatmap only in the bins with a
+	p-value below alpha (bottom). The colors are symmetric around 0
+	"""
+	fig= Figure()
+	hm= fig.subplots(nrows=2,ncols=1)
+	vmax= float(np.nanmax(np.abs(diff))) or 1.0
+	for ax, values, name in zip(hm, (diff, np.where(pValues < alpha, diff, np.nan)), ('', ' (p < %s)'%alpha)):
+		ax.set_title(title+name)
+		ax.set_xlabel('X axis')
+		ax.set_ylabel('Y axis')
+		val= ax.imshow(values, vmin=-vmax, vmax=vmax, extent=extent, cmap='coolwarm')
+		ax.invert_yaxis()
+		fig.colorbar(val, ax=ax)
+	return fig
+
+
+def get_render_settings(metaData):
+	""" (dpi, format) used to save the figures: the RENDER_TIER values unless FIG_DPI or FIG_FORMAT are defined
+	"""
+	tier= RENDER_TIERS.get(metaData.get('RENDER_TIER', DEFAULT_TIER), RENDER_TIERS[DEFAULT_TIER])
+	return metaData.get('FIG_DPI', tier['dpi']), metaData.get('FIG_FORMAT', tier['format'])
+
+
+def set_batch_backend(metaData):
+	""" In BATCH_MODE the non interactive backend (Agg) is used, so no figure is shown or waits for the user
+	"""
+	if metaData.get('BATCH_MODE', False):
+		matplotlib.use('Agg')
+		print(' Batch mode: the figures are saved but not shown')
+
+
+def save_heatmap(fig, figName, metaData, dpi=None):
+	""" Save the heatmap figure in OUT_PATH+OUT_FOLDER with the dpi and format of get_render_settings (the figName extension
+	is replaced by the format). Return True if the image was saved
+	"""
+	outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
+	runDpi, fmt= get_render_settings(metaData)
+	figName= os.path.splitext(figName)[0]+'.'+fmt
+	try:
+		fig.savefig(outputPath+figName, dpi=dpi or runDpi, format=fmt)
+		print('  -Heatmap: %s saved in path: %s'%(figName,outputPath))
+		return True
+	except Exception as e:
+		print('  -ERROR! while saving img: %s in path: %s --> %s'%(figName,outputPath, e))
+		return False
+
+
+def get_heatmap_info(option, ct, cb, topValNorm, **identity):
+	""" Info saved with the heatmap arrays: odor stim, cues, NORM used and the identity of the experiment or group
+	"""
+	info= {'option': option, 'stim': get_stim_name(option), 'ct': ct, 'cb': cb, 'topValNorm': topValNorm}
+	info.update(identity)
+	return info
+
+
+def save_heatmap_data(hmResult, figName, metaData, info):
+	""" Save the heatmap arrays (see heatmaps.save_heatmap_arrays) next to its figure (same name, .npz) unless SAVE_HM_ARRAYS is False,
+	so the figure can be rendered again with rerender_heatmaps.py. Return True if the arrays were saved
+	"""
+	if not metaData.get('SAVE_HM_ARRAYS', True):
+		return False
+	outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
+	dataName= os.path.splitext(figName)[0]+'.npz'
+	try:
+		save_heatmap_arrays(hmResult, outputPath+dataName, info)
+		return True
+	except Exception as e:
+		print('  -ERROR! while saving heatmap data: %s in path: %s --> %s'%(dataName,outputPath, e))
+		return False
+
+
+class HeatmapFigure:
+	""" Figure template with the layout of plot_heatmap (axes, images and colorbars) built once. Each new heatmap only
+	updates the images data, the titles and the color limits. The figure is not managed by pyplot
+	"""
+	def __init__(self, hmResult, ct, cb, stim, topValNorm):
+		self.fig= plot_heatmap(hmResult, ct, cb, stim, topValNorm, useFigManager=False)
+		self.nPlanes= 2 if hmResult.countsYZ is None else 3
+		self.axes= self.fig.axes[:self.nPlanes]
+		self.images= [ax.images[0] for ax in self.axes]
+
+	def update(self, hmResult, ct, cb, stim, topValNorm):
+		for ax, img, (plane, normName) in zip(self.axes, self.images, HM_PLANES):
+			ax.set_title('heatmap %s vs %s %s axis with stim= %s'%(ct, cb, plane, stim))
+			img.set_data(getattr(hmResult, normName))
+			img.set_clim(0, topValNorm)
+
+
+def get_template_key(hmResult):
+	""" Heatmaps with the same planes and extents can use the same figure template
+	"""
+	extentYZ= None if hmResult.countsYZ is None else tuple(hmResult.extentYZ)
+	return tuple(hmResult.extentXY), tuple(hmResult.extentXZ), extentYZ
+
+
+def get_heatmap_figure(hmResult, ct, cb, stim, topValNorm):
+	""" Figure of hmResult using the template of the current thread (it is created the first time), so the templates can
+	be used by several threads rendering at the same time
+	"""
+	templates= FIG_TEMPLATES.__dict__.setdefault('templates', {})
+	key= get_template_key(hmResult)
+	if key not in templates:
+		templates[key]= HeatmapFigure(hmResult, ct, cb, stim, topValNorm)
+	else:
+		templates[key].update(hmResult, ct, cb, stim, topValNorm)
+	return templates[key].fig
+
+
+def render_heatmap(hmResult, ct, cb, stim, topValNorm, figName, metaData, info=None):
+	""" Plot (with a figure template) and save a heatmap without pyplot, and its arrays if info is given. Return True if the image was saved
+	"""
+	if info is not None:
+		save_heatmap_data(hmResult, figName, metaData, info)
+	return save_heatmap(get_heatmap_figure(hmResult, ct, cb, stim, topValNorm), figName, metaData)
+
+
+def save_heatmap_series_data(series, fileName, metaData, info):
+	""" Save the heatmap series arrays (see heatmaps.save_heatmap_series) in OUT_PATH+OUT_FOLDER. Return True if they were saved
+	"""
+	outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
+	dataName= os.path.splitext(fileName)[0]+'.npz'
+	try:
+		save_heatmap_series(series, outputPath+dataName, info)
+		print('  -Heatmap series: %s (%s windows) saved in path: %s'%(dataName, len(series), outputPath))
+		return True
+	except Exception as e:
+		print('  -ERROR! while saving heatmap series: %s in path: %s --> %s'%(dataName,outputPath, e))
+		return False
+
+
+def render_heatmap_series(series, ct, cb, stim, topValNorm, fileName, metaData, cumulative=False):
+	""" Save the animation of the heatmap series (HM_SERIES_VIDEO: 'gif' or 'mp4', HM_SERIES_FPS frames per second) in OUT_PATH+OUT_FOLDER.
+	All the frames use one figure template (only the images data and titles change). Return True if the animation was saved
+	"""
+	outputPath= metaData['OUT_PATH']+metaData['OUT_FOLDER']
+	fmt= metaData.get('HM_SERIES_VIDEO', 'gif')
+	writerName= SERIES_WRITERS.get(fmt)
+	if writerName is None or not animation.writers.is_available(writerName):
+		print('  -ERROR! heatmap series format %s not available, the animation is saved as gif'%fmt)
+		fmt, writerName= 'gif', SERIES_WRITERS['gif']
+	videoName= os.path.splitext(fileName)[0]+('_cumulative' if cumulative else '')+'.'+fmt
+	if cumulative:
+		series= series.get_cumulative()
+	dpi, _= get_render_settings(metaData)
+	try:
+		template= HeatmapFigure(series.get_window(0), ct, cb, stim, topValNorm)
+		writer= animation.writers[writerName](fps=metaData.get('HM_SERIES_FPS', HM_SERIES_FPS))
+		with writer.saving(template.fig, outputPath+videoName, dpi):
+			for i in range(len(series)):
+				#The cumulative windows go from the start of the odor stim
+				start= 0 if cumulative else series.windowEdges[i]
+				template.update(series.get_window(i), ct, cb, '%s %d-%d s'%(stim, start, series.windowEdges[i+1]), topValNorm)
+				writer.grab_frame()
+		print('  -Heatmap series: %s saved in path: %s'%(videoName,outputPath))
+		return True
+	except Exception as e:
+		print('  -ERROR! while saving heatmap series: %s in path: %s --> %s'%(videoName,outputPath, e))
+		return False
+
+
+def render_group_heatmap(hmResult, option, ct, cb, metaData, figName, expDates=()):
+	""" Plot (with a figure template) and save the heatmap of a group of experiments (figName_stim_NORM) and its arrays
+	with the dates of the experiments grouped. Return True if the image was saved
+	"""
+	stim= get_stim_name(option)
+	topValNorm= metaData['NORM']
+	info= get_heatmap_info(option, ct, cb, topValNorm, group=metaData['HM_GRP_NAME'], grpBy=metaData['GRP_BY'], expDates=list(expDates))
+	return render_heatmap(hmResult, ct, cb, stim, topValNorm, figName+'_'+stim+'_'+str(topValNorm)+'.png', metaData, info)
@@ -0,0 +1,103 @@
+"""
+File containing the pipelined execution mode of the scripts: a reader thread loads the next PREFETCH_SIZE experiments
+(h5 or cache reads) while the main thread does the NumPy work of the current one, and a pool of N_WRITERS threads renders
+and saves its figures in the background. The queues are bounded, so only a few experiments/figures are kept in memory
+"""
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from hm_render import render_heatmap
+
+
+# Default number of experiments read in advance and threads saving figures
+PREFETCH_SIZE= 2
+N_WRITERS= 2
+
+
+class FigureWriter:
+	""" Pool of threads rendering and saving the heatmap figures. submit blocks when maxPending figures are waiting (backpressure)
+	"""
+	def __init__(self, nWriters=N_WRITERS, maxPending=None):
+		self.pool= ThreadPoolExecutor(max_workers=max(nWriters, 1), thread_name_prefix='fig_writer')
+		self.pending= threading.BoundedSemaphore(maxPending or 2*max(nWriters, 1))
+		self.futures= []
+
+	def submit(self, task, *args):
+		""" Run task(*args) in a writer thread
+		"""
+		self.pending.acquire()
+		try:
+			future= self.pool.submit(task, *args)
+		except Exception:
+			self.pending.release()
+			raise
+		future.add_done_callback(lambda f: self.pending.release())
+		self.futures.append(future)
+		return future
+
+	def submit_heatmap(self, hmResult, ct, cb, stim, topValNorm, figName, metaData, info=None):
+		""" Plot and save the heatmap figure hmResult (and its arrays if info is given) in a writer thread
+		"""
+		return self.submit(render_heatmap, hmResult, ct, cb, stim, topValNorm, figName, metaData, info)
+
+	def close(self):
+		""" Wait for all the figures. Return the number of figures saved
+		"""
+		self.pool.shutdown(wait=True)
+		return sum(1 for f in self.futures if f.exception() is None and f.result())
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def iter_prefetched(filesList, metaData, readTask, nPrefetch=PREFETCH_SIZE):
+	""" Yield readTask(fname, metaData) for each file of filesList (in order). The results are computed by a reader thread
+	up to nPrefetch files in advance. An exception raised by readTask is raised again here
+	"""
+	results= queue.Queue(maxsize=max(nPrefetch, 1))
+	stop= threading.Event()
+
+	def reader():
+		for fname in filesList:
+			try:
+				item= (True, readTask(fname, metaData))
+			except Exception as e:
+				item= (False, e)
+			#Wait for a free slot, unless the consumer stopped
+			while not stop.is_set():
+				try:
+					results.put(item, timeout=0.1)
+					break
+				except queue.Full:
+					continue
+			if stop.is_set() or not item[0]:
+				return
+
+	thread= threading.Thread(target=reader, name='exp_reader', daemon=True)
+	thread.start()
+	try:
+		for _ in filesList:
+			ok, value= results.get()
+			if not ok:
+				raise value
+			yield value
+	finally:
+		stop.set()
+		thread.join()
+
+
+def run_exp_prefetch(filesList, metaData, readTask, computeTask):
+	""" Run computeTask(readTask(fname, metaData), metaData, writer) for each file of filesList overlapping the reads of the next
+	files and the figures saving with the computation. Return the list of results in filesList order
+	"""
+	nPrefetch= metaData.get('PREFETCH_SIZE', PREFETCH_SIZE)
+	nWriters= metaData.get('N_WRITERS', N_WRITERS)
+	print(' Running %s experiments in pipeline mode (%s prefetched, %s writers)'%(len(filesList), nPrefetch, nWriters))
+	results= []
+	with FigureWriter(nWriters) as writer:
+		for data in iter_prefetched(filesList, metaData, readTask, nPrefetch):
+			results.append(computeTask(data, metaData, writer))
+	return results
@@ -0,0 +1,64 @@
+"""
+File containing the kinematics of the trajectories: ground speed, vertical speed, heading and turning rate of each point,
+computed with finite differences inside each trajectory (obj_id) over the whole arrays at once
+"""
+import numpy as np
+
+
+# Kinematic values computed for each point (units: m/s, m/s, m/s, degrees and degrees/s)
+KINEMATICS= ('speed', 'groundSpeed', 'vz', 'heading', 'turnRate')
+# Direction of the wind along the X axis: the odor source is upwind, in the negative X side of the WT
+UPWIND_DIR= -1
+# Color limits of the kinematics heatmaps
+KIN_RANGES= {'speed': (0, 1.0), 'groundSpeed': (0, 1.0), 'vz': (-0.5, 0.5), 'heading': (-180, 180), 'turnRate': (-500, 500)}
+
+
+def wrap_angle(angle):
+	""" Angle (degrees) in [-180, 180)
+	"""
+	return (angle + 180.0) % 360.0 - 180.0
+
+
+def get_time_steps(dTs, dFr):
+	""" Time between consecutive points: the timestamps difference, or the frames difference times the median frame period
+	where the timestamps are repeated (or go back)
+	"""
+	dt= dTs.astype(float)
+	bad= ~(dt > 0)
+	if bad.any():
+		good= ~bad & (dFr > 0)
+		framePeriod= np.median(dt[good] / dFr[good]) if good.any() else np.nan
+		dt[bad]= np.where(dFr[bad] > 0, dFr[bad]*framePeriod, np.nan)
+	return dt
+
+
+def compute_kinematics(trajIndex, idList, frList, tsList, xList, yList, zList, upwindDir=UPWIND_DIR):
+	""" Kinematics of each point (dict {name: array} in the order of the rows given). The velocity of a point is the backward
+	difference with the previous point of its trajectory (trajIndex order), so the differences never cross two trajectories:
+	the first point of each trajectory has no velocity/heading (NaN) and the first two have no turning rate.
+	The heading is the angle (degrees) of the horizontal velocity with the upwind direction (0= flying upwind)
+	"""
+	order= trajIndex.order
+	nRows= len(order)
+	kinematics= {name: np.full(nRows, np.nan) for name in KINEMATICS}
+	if nRows < 2:
+		return kinematics
+	ids= np.asarray(idList)[order]
+	#Step i goes from row i to row i+1 of the trajectory order (valid only inside one trajectory)
+	sameTraj= ids[1:] == ids[:-1]
+	dt= get_time_steps(np.diff(np.asarray(tsList)[order]), np.diff(np.asarray(frList)[order].astype(np.int64)))
+	sameTraj&= np.isfinite(dt)
+	dt[~sameTraj]= np.nan
+	vx= np.diff(np.asarray(xList, float)[order]) / dt
+	vy= np.diff(np.asarray(yList, float)[order]) / dt
+	vz= np.diff(np.asarray(zList, float)[order]) / dt
+	groundSpeed= np.hypot(vx, vy)
+	heading= np.degrees(np.arctan2(vy, upwindDir*vx))
+	#Turning rate: heading change between two consecutive steps of the same trajectory
+	turnRate= np.full(len(heading), np.nan)
+	turnRate[1:]= wrap_angle(np.diff(heading)) / dt[1:]
+	values= {'speed': np.sqrt(groundSpeed**2 + vz**2), 'groundSpeed': groundSpeed, 'vz': vz, 'heading': heading, 'turnRate': turnRate}
+	#The value of each step goes to the last point of the step, back in the rows order
+	for name in KINEMATICS:
+		kinematics[name][order[1:]]= values[name]
+	return kinematics
@@ -0,0 +1,34 @@
+"""
+File containing the functions to run the per-experiment work of the scripts (load, preprocess, compute heatmaps/activity)
+in a pool of processes. The results are returned to the parent process in the same order as the input files
+"""
+import os
+import multiprocessing
+import matplotlib
+
+
+def get_n_workers(metaData):
+	""" Number of processes to use (N_WORKERS in ExpMetaData.yaml, 0 == all the cpus, 1 == no parallel mode)
+	"""
+	nWorkers= metaData.get('N_WORKERS', 1)
+	if nWorkers <= 0:
+		nWorkers= os.cpu_count()
+	return nWorkers
+
+
+def init_worker():
+	""" The workers never show figures, they only save them
+	"""
+	matplotlib.use('Agg')
+
+
+def run_exp_pipeline(filesList, metaData, expTask):
+	""" Run expTask(fname, metaData) for each file of filesList and return the list of results in filesList order.
+	expTask must be a module level function (it is sent to the workers) and it should return compact data (no full Exp_Info arrays)
+	"""
+	nWorkers= min(get_n_workers(metaData), max(len(filesList), 1))
+	if nWorkers <= 1:
+		return [expTask(fname, metaData) for fname in filesList]
+	print(' Running %s experiments in %s processes'%(len(filesList), nWorkers))
+	with multiprocessing.Pool(nWorkers, initializer=init_worker) as pool:
+		return pool.starmap(expTask, [(fname, metaData) for fname in filesList], chunksize=1)
@@ -0,0 +1,62 @@
+"""
+This script renders again the heatmaps saved by the other scripts (.npz file next to each figure) without loading or
+processing the experiments, so the NORM, colormap and axis limits of a figure can be tuned in seconds.
+Usage: python rerender_heatmaps.py [heatmap .npz files]  (by default all the .npz files in OUT_PATH+OUT_FOLDER; the
+arrays that are not heatmaps, as the series or the difference heatmaps, are skipped)
+The new figures are saved in OUT_PATH+OUT_FOLDER with the same name plus the NORM used
+"""
+import os
+import sys
+import glob
+import yaml
+import matplotlib
+from heatmaps import load_heatmap_arrays, get_saved_kind, HM_KIND
+from hm_render import plot_heatmap, save_heatmap, HM_CMAP, HM_Z_LIM
+import pathlib
+
+
+
+def load_metaData():
+	""" Load constant values related to the experiment setup and workspaces
+	"""
+	try:
+		print(pathlib.Path().absolute())
+		metaFile= 'ExpMetaData.yaml'
+		with open(metaFile, 'r') as f:
+			metaData= yaml.load(f, Loader=yaml.FullLoader)
+		print(' Experiments metadata loaded sucessfuly')
+		return metaData
+	except Exception as e:
+		print(' ERROR while loading experiment metaData from: %s'%metaFile)
+		print(e)
+		sys.exit(1)
+
+
+def rerender_heatmap(dataFile, metaData):
+	""" Plot the heatmap saved in dataFile with NORM, HM_CMAP and HM_X_LIM/HM_Y_LIM/HM_Z_LIM and save it. Return True if it was saved
+	"""
+	kind= get_saved_kind(dataFile)
+	if kind != HM_KIND:
+		print(' %s skipped: it is not a heatmap (%s)'%(dataFile, kind))
+		return False
+	hmResult, info= load_heatmap_arrays(dataFile)
+	topValNorm= metaData['NORM']
+	fig= plot_heatmap(hmResult, info['ct'], info['cb'], info['stim'], topValNorm, useFigManager=False, cmap=metaData.get('HM_CMAP', HM_CMAP),
+					xLim=metaData.get('HM_X_LIM'), yLim=metaData.get('HM_Y_LIM'), zLim=metaData.get('HM_Z_LIM', HM_Z_LIM))
+	figName= os.path.splitext(os.path.basename(dataFile))[0]+'_'+str(topValNorm)+'.png'
+	return save_heatmap(fig, figName, metaData)
+
+
+# == MAIN ==
+if __name__== '__main__':
+	matplotlib.use('Agg')
+	#Load CONSTANTS related to the experiment
+	expMetaData= load_metaData()
+	dataFiles= sys.argv[1:] or sorted(glob.glob(expMetaData['OUT_PATH']+expMetaData['OUT_FOLDER']+'*.npz'))
+	nSaved= 0
+	for dataFile in dataFiles:
+		try:
+			nSaved+= rerender_heatmap(dataFile, expMetaData)
+		except Exception as e:
+			print(' ERROR while rendering heatmap data from: %s --> %s'%(dataFile, e))
+	print(' %s heatmaps of %s .npz files rendered again with NORM= %s'%(nSaved, len(dataFiles), expMetaData['NORM']))
@@ -0,0 +1,163 @@
+"""
+File containing the spatial index of the points of an experiment (uniform grid of cubic cells, CSR as the TrajectoryIndex)
+and the cue proximity queries: number of points, dwell time and trajectories within a radius (or a box) of each cue,
+for every odor stim. The index is built once and saved with the preprocessed exp in the cache
+"""
+import os
+import numpy as np
+from heatmaps import STIM_NAMES
+import exp_cache
+
+
+# Side (m) of the cells of the index
+CELL_SIZE= 0.02
+# File of the index in the cache entry of the exp
+INDEX_FILE= 'spatial_index.npz'
+# Version of the index file. Change it when the index changes to rebuild the cached ones
+INDEX_VERSION= 1
+# Cues of the experiment that can be queried (exp attribute with the settings position)
+CUES= {'odor': 'posOdor', 'test': 'posClrTEST', 'base': 'posClrBASE'}
+
+
+class SpatialIndex:
+	""" Points of an experiment bucketed in cubic cells: order has the rows sorted by cell and the rows of the cell
+	cellKeys[i] are order[offsets[i]:offsets[i+1]]. The positions are the ones not mirrored (Y_List*ySign), so the index
+	is valid for the exp mirrored or not
+	"""
+	def __init__(self, order, cellKeys, offsets, origin, cellSize, shape):
+		self.order= order			# Rows sorted by cell
+		self.cellKeys= cellKeys		# Key of each cell with points (sorted)
+		self.offsets= offsets		# Rows of each cell in the sorted rows
+		self.origin= origin			# Position of the corner of the first cell
+		self.cellSize= cellSize		# Side of the cells
+		self.shape= shape			# Number of cells per axis
+
+	def get_cells(self, pos):
+		""" Cell (ix, iy, iz) of each position (array of shape (3, n)), clipped to the grid
+		"""
+		cells= np.floor((pos - self.origin[:, None]) / self.cellSize).astype(np.int64)
+		return np.clip(cells, 0, self.shape[:, None]-1)
+
+	def get_keys(self, cells):
+		return (cells[0]*self.shape[1] + cells[1])*self.shape[2] + cells[2]
+
+	def query_box_rows(self, lo, hi):
+		""" Rows of the points in the cells overlapping the box [lo, hi] (candidates, the exact test is done by the caller)
+		"""
+		c0, c1= self.get_cells(np.column_stack((lo, hi)).astype(float)).T
+		grid= np.meshgrid(*[np.arange(a, b+1) for a, b in zip(c0, c1)], indexing='ij')
+		keys= self.get_keys(np.array([g.ravel() for g in grid]))
+		slot= np.searchsorted(self.cellKeys, keys)
+		found= slot < len(self.cellKeys)
+		found[found]= self.cellKeys[slot[found]] == keys[found]
+		slot= slot[found]
+		starts= self.offsets[slot]
+		lengths= self.offsets[slot+1] - starts
+		#Concatenate the ranges of rows of the cells found without a loop
+		idx= np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+		return self.order[idx]
+
+	def get_arrays(self):
+		return {'order': self.order, 'cellKeys': self.cellKeys, 'offsets': self.offsets, 'origin': self.origin,
+				'cellSize': np.array(self.cellSize), 'shape': self.shape, 'version': np.array(INDEX_VERSION)}
+
+
+def build_spatial_index(xList, yList, zList, cellSize=CELL_SIZE):
+	""" Bucket the positions in cubic cells of side cellSize covering all of them
+	"""
+	pos= np.array([xList, yList, zList], dtype=float)
+	if pos.shape[1] == 0:
+		origin= np.zeros(3)
+		shape= np.ones(3, np.int64)
+	else:
+		origin= pos.min(axis=1)
+		shape= np.floor((pos.max(axis=1) - origin) / cellSize).astype(np.int64) + 1
+	index= SpatialIndex(None, None, None, origin, cellSize, shape)
+	keys= index.get_keys(index.get_cells(pos))
+	index.order= np.argsort(keys, kind='stable').astype(np.uint32)
+	keys= keys[index.order]
+	newCell= np.ones(len(keys), bool)
+	newCell[1:]= keys[1:] != keys[:-1]
+	starts= np.flatnonzero(newCell)
+	index.cellKeys= keys[starts]
+	index.offsets= np.append(starts, len(keys))
+	return index
+
+
+def load_index_file(fileName, cellSize):
+	""" Index saved with np.savez (None if it doesn't exist or it was built with another version or cellSize)
+	"""
+	try:
+		with np.load(fileName) as data:
+			if int(data['version']) != INDEX_VERSION or float(data['cellSize']) != cellSize:
+				return None
+			return SpatialIndex(data['order'], data['cellKeys'], data['offsets'], data['origin'], cellSize, data['shape'])
+	except (OSError, KeyError, ValueError):
+		return None
+
+
+def get_exp_spatial_index(exp, metaData):
+	""" Spatial index of exp (SPATIAL_CELL_SIZE cells). It is loaded from the cache entry of the exp if it was saved before,
+	otherwise it is built and saved in the entry
+	"""
+	cellSize= metaData.get('SPATIAL_CELL_SIZE', CELL_SIZE)
+	if exp.spatialIndex is not None and exp.spatialIndex.cellSize == cellSize:
+		return exp.spatialIndex
+	entryPath= exp_cache.get_entry_path(exp, metaData)
+	index= load_index_file(os.path.join(entryPath, INDEX_FILE), cellSize) if entryPath else None
+	if index is None:
+		index= build_spatial_index(exp.X_List, np.asarray(exp.Y_List)*exp.ySign, exp.Z_List, cellSize)
+		if entryPath:
+			try:
+				np.savez(os.path.join(entryPath, INDEX_FILE), **index.get_arrays())
+			except Exception as e:
+				print(' ERROR while saving spatial index of exp %s --> %s'%(exp.expDate, e))
+	exp.spatialIndex= index
+	return index
+
+
+def get_cue_position(exp, cue, metaData):
+	""" Position of the cue ('odor', 'test' or 'base') in the data coordinates (X from the WT center, mirrored as the data)
+	"""
+	pos= getattr(exp, CUES[cue])
+	return np.array([pos[0] - metaData['LIM_X'], pos[1], pos[2]], dtype=float)
+
+
+def get_point_durations(exp):
+	""" Time (s) represented by each point: time to the next point of its trajectory (0 for the last point)
+	"""
+	trajIndex= exp.get_traj_index()
+	ts= trajIndex.get_column('TS_List', exp.TS_List)
+	ids= trajIndex.get_column('ID_List', exp.ID_List)
+	durations= np.zeros(len(ts))
+	sameTraj= ids[1:] == ids[:-1]
+	durations[trajIndex.order[:-1][sameTraj]]= np.diff(ts)[sameTraj]
+	return durations
+
+
+def query_cue_metrics(exp, metaData, radii, cues=tuple(CUES), shape='sphere'):
+	""" Points, dwell time (s) and trajectories within each radius of each cue for every odor stim (batched: one index query
+	per cue with the largest radius). shape 'box' uses a cube of half side radius instead of a sphere.
+	Return a list of dicts {cue, stim, radius, nPoints, dwellTime, nTrajs, trajIds}
+	"""
+	index= get_exp_spatial_index(exp, metaData)
+	radii= np.sort(np.asarray(radii, float))
+	durations= get_point_durations(exp)
+	stimList= np.asarray(exp.stim_List)
+	idList= np.asarray(exp.ID_List)
+	results= []
+	for cue in cues:
+		center= get_cue_position(exp, cue, metaData)
+		#The index keeps the positions not mirrored
+		center[1]*= exp.ySign
+		rows= index.query_box_rows(center - radii[-1], center + radii[-1])
+		delta= np.array([exp.X_List[rows], np.asarray(exp.Y_List[rows])*exp.ySign, exp.Z_List[rows]], dtype=float) - center[:, None]
+		dist= np.abs(delta).max(axis=0) if shape == 'box' else np.sqrt((delta**2).sum(axis=0))
+		for stim, stimName in STIM_NAMES.items():
+			inStim= stimList[rows] == stim
+			for radius in radii:
+				inside= rows[inStim & (dist <= radius)]
+				trajIds= np.unique(idList[inside])
+				results.append({'cue': cue, 'stim': stimName, 'radius': float(radius), 'nPoints': len(inside),
+								'dwellTime': float(durations[inside].sum()), 'nTrajs': len(trajIds), 'trajIds': trajIds})
+	return results
@@ -0,0 +1,38 @@
+"""
+File containing the streaming mode: the h5 file of an experiment is read by chunks and each chunk is trimmed, filtered,
+labelled with the odor stim and mirrored before being added to the heatmaps and trajectories accumulators.
+The full experiment is never kept in memory, so the memory used depends on the chunk size and not on the recording length
+"""
+import numpy as np
+from Exp_Info import get_wt_mask
+from h5_loader import iter_h5_chunks, STREAM_CHUNK_SIZE, TS_CHUNK_SIZE, TS_MAX_DELAY
+from heatmaps import HeatmapAccumulator
+from trajectories import TrajectoryAccumulator
+
+
+def stream_exp(exp, metaData):
+	""" Accumulate the heatmaps of the 3 odor stim (stored in exp.heatmaps) and the trajectories of exp reading its h5 file by chunks
+	(STREAM_CHUNK_SIZE rows). The Y positions are mirrored if the exp was mirrored before (exp.ySign). Return the trajectory table
+	"""
+	hmAcc= HeatmapAccumulator(metaData)
+	trajAcc= TrajectoryAccumulator()
+	nPoints= 0
+	chunks= iter_h5_chunks(metaData['IN_PATH']+exp.fileName, metaData['DATASET'], exp.ts_1_StartExp, exp.ts_4_EndExp,
+						metaData.get('STREAM_CHUNK_SIZE', STREAM_CHUNK_SIZE), metaData.get('H5_CHUNK_SIZE', TS_CHUNK_SIZE), metaData.get('H5_MAX_DELAY', TS_MAX_DELAY))
+	for chunk in chunks:
+		#Same dtype as the loaded experiments, so the points are binned the same way
+		xList, yList, zList= (chunk[col].astype(exp.coordDtype, copy=False) for col in ('x', 'y', 'z'))
+		#Keep only the points recorded during the experiment and inside the WT
+		keep= get_wt_mask(xList, yList, zList, metaData)[0]
+		keep&= exp.get_ts_mask(chunk['timestamp'])
+		tsList= chunk['timestamp'][keep]
+		stimList= exp.label_stim(tsList)
+		yList= yList[keep]
+		if exp.ySign < 0:
+			np.negative(yList, out=yList)
+		hmAcc.add(xList[keep], yList, zList[keep], stimList)
+		trajAcc.add(chunk['obj_id'][keep], tsList, stimList)
+		nPoints+= len(tsList)
+	exp.heatmaps.update(hmAcc.get_heatmaps())
+	print(' Experiment %s streamed (%s points)'%(exp.fileName, nPoints))
+	return trajAcc.get_table()
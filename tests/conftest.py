@@ -0,0 +1,63 @@
+"""
+Shared fixtures of the tests: the wind tunnel settings and synthetic experiments (no h5 file is needed)
+"""
+import os
+import sys
+import types
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Exp_Info import Exp_Info
+from exp_loader import mirror_exp_for_group
+
+
+@pytest.fixture
+def metaData(tmp_path):
+	return {'IN_PATH': str(tmp_path)+'/', 'OUT_PATH': str(tmp_path)+'/out/', 'OUT_FOLDER': 'grp/', 'DATASET': 'kalman_estimates',
+			'LIM_X': 0.9144, 'LIM_Y': 0.3048, 'LIM_Z': 0.6096}
+
+
+def make_settings(expDate='20200701_081701', posClrTEST=('0.3', '-0.1', '0.0')):
+	return types.SimpleNamespace(expDate=expDate, fileName=expDate+'.mainbrain.h5', type='GwT2', gender='female', lux=1,
+								clrBASE='white', clrTEST='black', posOdor=['0.0', '0.05', '0.2'], posClrBASE=['0.3', '0.1', '0.0'],
+								posClrTEST=list(posClrTEST), ts_1_StartExp=1000.0, ts_2_CO2=1300.0, ts_3_PostCO2=1600.0, ts_4_EndExp=1900.0)
+
+
+def make_trajectories(rng, nTrajs=60, minPoints=2, maxPoints=80, tsStart=1000.0, tsEnd=1900.0):
+	""" Random walks of nTrajs trajectories (100 Hz) with the rows of all of them interleaved and sorted by timestamp,
+	as the rows of a Flydra file
+	"""
+	cols= {name: [] for name in ('id', 'fr', 'ts', 'x', 'y', 'z')}
+	for objId in rng.choice(np.arange(1, 10*nTrajs), nTrajs, replace=False):
+		n= int(rng.integers(minPoints, maxPoints))
+		frames= int(rng.uniform(0, (tsEnd - tsStart)*100 - 2*n)) + np.cumsum(rng.integers(1, 3, n))
+		cols['id'].append(np.full(n, objId))
+		cols['fr'].append(frames)
+		cols['ts'].append(tsStart + frames/100.0)
+		for axis, (lo, hi) in zip('xyz', ((-0.9, 0.9), (-0.3, 0.3), (0.0, 0.6))):
+			cols[axis].append(np.clip(rng.uniform(lo, hi) + np.cumsum(rng.normal(0, 0.005, n)), lo, hi))
+	cols= {name: np.concatenate(values) for name, values in cols.items()}
+	order= np.argsort(cols['ts'], kind='stable')
+	return {name: values[order] for name, values in cols.items()}
+
+
+@pytest.fixture
+def make_exp(metaData):
+	""" Function returning a synthetic experiment with its odor stim set (as after exp_loader.load_exp_data)
+	"""
+	def make(seed=0, mirrored=False, **settings):
+		rng= np.random.default_rng(seed)
+		exp= Exp_Info(make_settings(**settings), np.float64)
+		cols= make_trajectories(rng)
+		exp.set_h5_information(cols['id'], cols['fr'], cols['ts'], cols['x'], cols['y'], cols['z'])
+		exp.set_odor_stim()
+		#Empty h5 file (only its size and mtime are used, by the cache key)
+		if not os.path.exists(metaData['IN_PATH']+exp.fileName):
+			open(metaData['IN_PATH']+exp.fileName, 'wb').close()
+		if mirrored:
+			#The test cue is in the negative Y side
+			assert mirror_exp_for_group(exp, 'Pve')
+		return exp
+	return make
@@ -0,0 +1,32 @@
+import numpy as np
+from heatmaps import compute_heatmap
+from cue_detection import detect_cue, CUE_MIN_CONFIDENCE
+
+
+def detect(x, y, metaData):
+	return detect_cue(compute_heatmap(x, y, np.full(len(x), 0.3), metaData), [0.35, -0.1], metaData)
+
+
+def uniform_points(rng, n):
+	return rng.uniform(-0.9, 0.9, n), rng.uniform(-0.3, 0.3, n)
+
+
+def test_sparse_points_are_not_a_cue(metaData):
+	assert detect(np.array([0.35]), np.array([-0.1]), metaData)[1] == 0
+	x, y= uniform_points(np.random.default_rng(0), 3000)
+	assert detect(x, y, metaData)[1] < CUE_MIN_CONFIDENCE
+
+
+def test_uniform_points_are_not_a_cue(metaData):
+	for seed in range(10):
+		x, y= uniform_points(np.random.default_rng(seed), 30000)
+		assert detect(x, y, metaData)[1] < CUE_MIN_CONFIDENCE
+
+
+def test_cue_is_found(metaData):
+	rng= np.random.default_rng(1)
+	for nPoints, nCue in ((3000, 50), (200000, 2000)):
+		x, y= uniform_points(rng, nPoints)
+		pos, confidence= detect(np.r_[x, rng.normal(0.31, 0.01, nCue)], np.r_[y, rng.normal(-0.12, 0.01, nCue)], metaData)
+		assert confidence >= CUE_MIN_CONFIDENCE
+		assert np.allclose(pos, [0.31, -0.12], atol=0.01)
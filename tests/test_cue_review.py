@@ -0,0 +1,24 @@
+import numpy as np
+from heatmaps import downsample_counts
+from cue_review import load_cue_positions, set_cue_position, get_cue_position
+
+
+def test_cue_positions_are_loaded_in_the_next_run(make_exp, metaData):
+	metaData.update(HM_GRP_NAME='grp', OUT_PATH=metaData['IN_PATH'], OUT_FOLDER='')
+	exp, nominalExp= make_exp(), make_exp(expDate='20200702_081701')
+	cuePositions= load_cue_positions(metaData)
+	assert get_cue_position(cuePositions, exp, 2) == (False, None)
+	set_cue_position(cuePositions, exp, 2, [np.float64(0.31), -0.12], metaData)
+	set_cue_position(cuePositions, nominalExp, 2, None, metaData)
+	cuePositions= load_cue_positions(metaData)
+	assert get_cue_position(cuePositions, exp, 2) == (True, [0.31, -0.12])
+	assert get_cue_position(cuePositions, nominalExp, 2) == (True, None)
+	assert get_cue_position(cuePositions, exp, 1) == (False, None)
+
+
+def test_downsample_counts_adds_the_blocks():
+	counts= np.arange(7*5).reshape(7, 5)
+	low= downsample_counts(counts, 2)
+	assert low.shape == (3, 2)
+	assert low[1, 0] == counts[2:4, 0:2].sum()
+	assert low.sum() == counts[:6, :4].sum()
@@ -0,0 +1,48 @@
+import os
+import numpy as np
+from exp_cache import get_cache_key, get_cache_path, save_cached_exp, load_cached_exp, evict_cache
+from exp_catalog import get_catalog_file
+from Exp_Info import Exp_Info, DATA_COLUMNS
+from conftest import make_settings
+
+
+def test_cache_key_of_mirrored_exp_is_the_one_not_mirrored(make_exp, metaData):
+	assert get_cache_key(make_exp(0, mirrored=True), metaData) == get_cache_key(make_exp(0), metaData)
+
+
+def test_cache_key_changes_with_the_settings(make_exp, metaData):
+	key= get_cache_key(make_exp(0), metaData)
+	assert get_cache_key(make_exp(0, posClrTEST=('0.3', '-0.12', '0.0')), metaData) != key
+	assert get_cache_key(make_exp(0), dict(metaData, LIM_X=1.0)) != key
+	assert get_cache_key(make_exp(0), dict(metaData, H5_MAX_DELAY=600)) != key
+	exp= make_exp(0)
+	with open(metaData['IN_PATH']+exp.fileName, 'wb') as f:
+		f.write(b'changed')
+	assert get_cache_key(exp, metaData) != key
+
+
+def test_cached_exp_round_trip(make_exp, metaData):
+	exp= make_exp(1)
+	save_cached_exp(exp, metaData)
+	loaded= Exp_Info(make_settings(), np.float64)
+	assert load_cached_exp(loaded, metaData)
+	for col in DATA_COLUMNS:
+		assert np.array_equal(getattr(loaded, col), getattr(exp, col))
+	assert loaded.stimRanges == exp.stimRanges
+
+
+def test_eviction_only_removes_cache_entries(make_exp, metaData):
+	cachePath= get_cache_path(metaData)
+	catalogFile= get_catalog_file(metaData)
+	assert not catalogFile.startswith(cachePath)
+	os.makedirs(cachePath)
+	#Other files or folders in the cache path are never evicted (and don't break the eviction)
+	open(cachePath+'exp_catalog.json', 'w').close()
+	os.makedirs(cachePath+'notes')
+	for seed, expDate in ((0, '20200701_081701'), (1, '20200702_081701')):
+		save_cached_exp(make_exp(seed, expDate=expDate), metaData)
+	evict_cache(cachePath, 0)
+	names= set(os.listdir(cachePath))
+	assert {'exp_catalog.json', 'notes'} <= names
+	entries= names - {'exp_catalog.json', 'notes'}
+	assert len(entries) == 1 and entries.pop().startswith('20200702_081701_')
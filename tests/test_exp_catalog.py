@@ -0,0 +1,54 @@
+import glob
+import os
+import shutil
+import h5py
+import numpy as np
+import exp_catalog
+from exp_catalog import load_catalog, select_exp_files
+
+EXAMPLES_PATH= os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'singleExperiment_metaData_example')
+
+
+def write_h5(fileName, nRows):
+	with h5py.File(fileName, 'w') as hf:
+		hf.create_dataset('kalman_estimates', data=np.zeros(nRows, [('timestamp', 'f8')]))
+
+
+def copy_examples(metaData):
+	""" Settings files of the examples in IN_PATH, with the h5 files of all the experiments except the black one
+	"""
+	for fname in glob.glob(EXAMPLES_PATH+'/*_2020*_settings.yaml'):
+		shutil.copy(fname, metaData['IN_PATH'])
+	for expDate, nRows in (('20200701_081701', 10), ('20200620_075712', 20)):
+		write_h5(metaData['IN_PATH']+expDate+'.mainbrain.h5', nRows)
+
+
+def test_catalog_rereads_only_the_changed_files(metaData, monkeypatch):
+	copy_examples(metaData)
+	created= []
+	createEntry= exp_catalog.create_entry
+	monkeypatch.setattr(exp_catalog, 'create_entry', lambda fname, metaData: created.append(fname) or createEntry(fname, metaData))
+	entries= {e['expDate']: e for e in load_catalog(metaData)}
+	assert len(created) == 3
+	assert entries['20200701_081701']['h5Rows'] == 10
+	assert entries['20200714_115913']['h5Size'] is None
+
+	del created[:]
+	assert load_catalog(metaData) == list(entries.values())
+	assert created == []
+
+	write_h5(metaData['IN_PATH']+'20200701_081701.mainbrain.h5', 30)
+	os.remove(glob.glob(metaData['IN_PATH']+'gray4.0_*_settings.yaml')[0])
+	entries= {e['expDate']: e for e in load_catalog(metaData)}
+	assert [os.path.basename(f) for f in created] == ['GwT2_20200701_081701_settings.yaml']
+	assert sorted(entries) == ['20200701_081701', '20200714_115913']
+	assert entries['20200701_081701']['h5Rows'] == 30
+
+
+def test_exp_filter_selects_the_experiments_with_h5(metaData):
+	copy_examples(metaData)
+	names= lambda expFilter: [os.path.basename(f) for f in select_exp_files(dict(metaData, EXP_FILTER=expFilter))]
+	assert names({}) == ['GwT2_20200701_081701_settings.yaml', 'gray4.0_20200620_075712_settings.yaml']
+	assert names({'type': 'wt', 'clrTEST': ['gray4.0', 'black']}) == ['gray4.0_20200620_075712_settings.yaml']
+	#The black experiment matches, but its h5 file is missing
+	assert names({'clrTEST': 'black'}) == []
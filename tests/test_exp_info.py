@@ -0,0 +1,45 @@
+import numpy as np
+from Exp_Info import Exp_Info, DATA_COLUMNS, load_exp_file
+from conftest import make_settings
+
+
+def make_points(x, y, z, ts):
+	exp= Exp_Info(make_settings(), np.float64)
+	n= len(ts)
+	exp.set_h5_information(np.arange(n), np.arange(n), np.array(ts, float), np.array(x, float), np.array(y, float), np.array(z, float))
+	return exp
+
+
+def test_wt_mask_uses_the_z_limit(metaData):
+	exp= make_points([0.0]*4, [0.0]*4, [0.0, 0.6, 0.61, 0.9], [1100.0]*4)
+	keep, removed= exp.get_wt_mask(metaData)
+	assert keep.tolist() == [True, True, False, False]
+	assert removed == {'X': 0, 'Y': 0, 'Z': 2}
+
+
+def test_clean_data_counts_only_the_rows_of_the_experiment(metaData):
+	#The rows before the start and after the end of the experiment are outside the WT, but they are not counted
+	exp= make_points([0.0, 2.0, 0.0, 2.0, 0.0], [0.0, 0.0, 1.0, 0.0, 0.0], [0.3, 0.3, 0.3, 0.9, 0.3], [900.0, 1100.0, 1200.0, 2000.0, 1300.0])
+	removed= exp.clean_data(metaData)
+	assert removed == {'X': 1, 'Y': 1, 'Z': 0}
+	assert exp.TS_List.tolist() == [1300.0]
+
+
+def test_odor_stim_matches_the_time_windows(make_exp):
+	exp= make_exp(2)
+	ts= exp.TS_List
+	expected= np.select([ts < exp.ts_2_CO2, ts < exp.ts_3_PostCO2], [1, 2], 3)
+	assert np.array_equal(exp.stim_List, expected)
+	for option in (1, 2, 3):
+		assert np.array_equal(exp.TS_List[exp.get_stim_rows(option)], ts[expected == option])
+
+
+def test_exported_exp_round_trip(make_exp, tmp_path):
+	exp= make_exp(3, mirrored=True)
+	exp.create_yaml_file(str(tmp_path)+'/')
+	loaded= load_exp_file(str(tmp_path)+'/black_GwT2_20200701_081701_data.yaml')
+	for col in DATA_COLUMNS:
+		assert np.array_equal(getattr(loaded, col), getattr(exp, col))
+	assert loaded.ySign == exp.ySign
+	assert np.allclose(loaded.posClrTEST, exp.posClrTEST)
+	assert loaded.ts_2_CO2 == exp.ts_2_CO2
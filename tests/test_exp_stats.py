@@ -0,0 +1,89 @@
+import itertools
+import numpy as np
+from exp_stats import ratio_stats, paired_difference_stats, difference_heatmap_stats, get_batches
+
+
+def exact_sign_flip_p(diff):
+	""" p-value of the mean of diff over all the 2^n sign flips (the observed one included)
+	"""
+	signs= np.array(list(itertools.product((-1, 1), repeat=len(diff))))
+	means= signs @ diff / len(diff)
+	return np.mean(np.abs(means) >= abs(diff.mean()) - 1e-12)
+
+
+def exact_paired_swap_p(num, den):
+	""" p-value of the ratio of sums over all the 2^n swaps of num and den of each unit
+	"""
+	swaps= np.array(list(itertools.product((0, 1), repeat=len(num))))
+	permNum= num.sum() + swaps @ (den - num)
+	permDen= den.sum() + swaps @ (num - den)
+	observed= abs(np.log(num.sum() / den.sum()))
+	return np.mean(np.abs(np.log(permNum / permDen)) >= observed - 1e-12)
+
+
+def test_paired_difference_p_matches_exact_enumeration():
+	rng= np.random.default_rng(0)
+	a= rng.normal(0, 1, 10)
+	b= a + rng.normal(0.6, 1, 10)
+	stats= paired_difference_stats(a, b, {'N_RESAMPLES': 20000, 'STATS_SEED': 1})
+	assert np.isclose(stats['value'], (b - a).mean())
+	assert abs(stats['pValue'] - exact_sign_flip_p(b - a)) < 0.01
+	assert stats['ci'][0] < stats['value'] < stats['ci'][1]
+
+
+def test_paired_ratio_p_matches_exact_enumeration():
+	rng= np.random.default_rng(1)
+	air= rng.gamma(5, 100, 10)
+	co2= air*rng.normal(1.3, 0.3, 10)
+	stats= ratio_stats(co2, air, {'N_RESAMPLES': 20000, 'STATS_SEED': 2})
+	assert np.isclose(stats['value'], co2.sum() / air.sum())
+	assert abs(stats['pValue'] - exact_paired_swap_p(co2, air)) < 0.01
+	assert stats['ci'][0] < stats['value'] < stats['ci'][1]
+
+
+def test_bootstrap_ci_matches_loop():
+	rng= np.random.default_rng(2)
+	num= rng.exponential(2.4, 300)
+	den= rng.exponential(2.0, 400)
+	stats= ratio_stats(num, den, {'N_RESAMPLES': 4000, 'STATS_SEED': 3}, paired=False)
+	#Naive bootstrap: one resample of each stim per iteration
+	loop= [rng.choice(num, len(num)).sum() / rng.choice(den, len(den)).sum() for _ in range(4000)]
+	assert np.allclose(stats['ci'], np.percentile(loop, [2.5, 97.5]), rtol=0.02)
+	assert stats['nUnits'] == 700
+
+
+def test_unpaired_permutation_null():
+	rng= np.random.default_rng(3)
+	pValues= [ratio_stats(rng.exponential(2, 50), rng.exponential(2, 60), {'N_RESAMPLES': 200, 'STATS_SEED': s}, paired=False)['pValue']
+			for s in range(100)]
+	assert np.mean(np.array(pValues) < 0.05) < 0.15
+
+
+def test_difference_heatmap_matches_per_bin_stats():
+	rng= np.random.default_rng(4)
+	gridsA= rng.random((8, 3, 4))
+	gridsB= gridsA + rng.normal(0, 0.1, gridsA.shape)
+	gridsB[:, 1, 2]+= 0.3
+	metaData= {'N_RESAMPLES': 20000, 'STATS_SEED': 5}
+	diff, se, pValues= difference_heatmap_stats(gridsA, gridsB, metaData)
+	assert diff.shape == se.shape == pValues.shape == (3, 4)
+	for i, j in itertools.product(range(3), range(4)):
+		binDiff= gridsB[:, i, j] - gridsA[:, i, j]
+		assert np.isclose(diff[i, j], binDiff.mean())
+		assert abs(pValues[i, j] - exact_sign_flip_p(binDiff)) < 0.01
+		#Bootstrap standard error of the mean: std/sqrt(n) with the population std
+		assert np.isclose(se[i, j], binDiff.std() / np.sqrt(len(binDiff)), rtol=0.05)
+
+
+def test_results_do_not_depend_on_the_workers():
+	rng= np.random.default_rng(5)
+	num, den= rng.exponential(2.4, 200), rng.exponential(2.0, 200)
+	serial= ratio_stats(num, den, {'N_RESAMPLES': 3000, 'STATS_SEED': 6, 'STATS_N_WORKERS': 1}, paired=False)
+	parallel= ratio_stats(num, den, {'N_RESAMPLES': 3000, 'STATS_SEED': 6, 'STATS_N_WORKERS': 2}, paired=False)
+	assert serial == parallel
+
+
+def test_batches_cover_the_resamples():
+	batches= get_batches(2500, 10, 0)
+	assert sum(size for _, size in batches) == 2500
+	assert [size for _, size in get_batches(2500, 10, 0)] == [size for _, size in batches]
@@ -0,0 +1,26 @@
+import numpy as np
+from exp_store import write_store, load_stored_exp
+from Exp_Info import Exp_Info, DATA_COLUMNS
+from conftest import make_settings
+
+
+def test_stored_exps_are_loaded_as_slices_of_the_store(make_exp, metaData):
+	exps= [make_exp(seed, expDate=expDate) for seed, expDate in ((0, '20200701_081701'), (1, '20200702_081701'))]
+	assert write_store([(exp.expDate+'.yaml', exp) for exp in exps], metaData) == 2
+	for exp in exps:
+		stored= Exp_Info(make_settings(exp.expDate), np.float64)
+		assert load_stored_exp(stored, metaData)
+		for col in DATA_COLUMNS:
+			assert np.array_equal(getattr(stored, col), getattr(exp, col))
+		assert isinstance(stored.TS_List.base, np.memmap)
+
+
+def test_changed_exp_is_not_loaded_from_the_store(make_exp, metaData):
+	exp= make_exp()
+	write_store([('exp.yaml', exp)], metaData)
+	assert load_stored_exp(Exp_Info(make_settings(), np.float64), metaData)
+	assert not load_stored_exp(Exp_Info(make_settings(posClrTEST=('0.3', '0.1', '0.0')), np.float64), metaData)
+	assert not load_stored_exp(Exp_Info(make_settings(), np.float64), dict(metaData, USE_STORE=False))
+	with open(metaData['IN_PATH']+exp.fileName, 'ab') as f:
+		f.write(b'new rows')
+	assert not load_stored_exp(Exp_Info(make_settings(), np.float64), metaData)
@@ -0,0 +1,36 @@
+import h5py
+import numpy as np
+import pytest
+from h5_loader import load_h5_columns, iter_h5_chunks, H5_COLUMNS
+
+
+@pytest.fixture
+def h5File(tmp_path):
+	""" h5 file with the timestamps approximately sorted: some rows of [400, 500] are written 200 s later
+	"""
+	rng= np.random.default_rng(0)
+	ts= np.sort(rng.uniform(0, 1000, 200000))
+	ts[np.searchsorted(ts, 650):][:10]= 450.0
+	data= np.zeros(len(ts), [(col, 'f8') for col in H5_COLUMNS])
+	data['timestamp']= ts
+	data['obj_id']= np.arange(len(ts))
+	fileName= str(tmp_path/'exp.mainbrain.h5')
+	with h5py.File(fileName, 'w') as hf:
+		hf.create_dataset('kalman_estimates', data=data)
+	return fileName, ts
+
+
+@pytest.mark.parametrize('chunkSize', [1000, 65536])
+def test_all_the_rows_of_the_experiment_are_read(h5File, chunkSize):
+	fileName, ts= h5File
+	expected= np.flatnonzero((ts >= 400) & (ts <= 500))
+	data= load_h5_columns(fileName, 'kalman_estimates', 400, 500, chunkSize)
+	inExp= (data['timestamp'] >= 400) & (data['timestamp'] <= 500)
+	assert np.array_equal(np.sort(data['obj_id'][inExp]), expected)
+
+
+def test_stream_chunks_read_the_same_rows(h5File):
+	fileName, _= h5File
+	data= load_h5_columns(fileName, 'kalman_estimates', 400, 500, 1000)
+	chunks= list(iter_h5_chunks(fileName, 'kalman_estimates', 400, 500, 7000, 1000))
+	assert np.array_equal(np.concatenate([c['obj_id'] for c in chunks]), data['obj_id'])
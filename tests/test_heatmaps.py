@@ -0,0 +1,144 @@
+import numpy as np
+from heatmaps import compute_heatmap, compute_all_heatmaps, get_grid_edges, sum_heatmaps, shift_counts, save_heatmap_arrays, load_heatmap_arrays, NBINS
+from heatmaps import shift_counts_subbin, shift_heatmap
+from heatmaps import compute_heatmap_series, get_window_edges, sum_heatmap_series, save_heatmap_series, get_saved_kind, HM_KIND, HM_SERIES_KIND
+
+
+def histogram_counts(x, y, z, metaData):
+	xEdges, yEdges, zEdges= get_grid_edges(metaData)
+	return np.histogram2d(x, y, [xEdges, yEdges])[0], np.histogram2d(x, z, [xEdges, zEdges])[0]
+
+
+def test_heatmap_matches_histogram2d(make_exp, metaData):
+	exp= make_exp()
+	hmResult= compute_heatmap(exp.X_List, exp.Y_List, exp.Z_List, metaData)
+	countsXY, countsXZ= histogram_counts(exp.X_List, exp.Y_List, exp.Z_List, metaData)
+	assert hmResult.countsXY.shape == NBINS
+	assert np.array_equal(hmResult.countsXY, countsXY)
+	assert np.array_equal(hmResult.countsXZ, countsXZ)
+
+
+def test_points_outside_the_grid_are_not_counted(metaData):
+	x= np.array([0.0, 2.0, -2.0, 0.1])
+	y= np.array([0.0, 0.0, 0.0, 1.0])
+	z= np.array([0.3, 0.3, 0.3, 0.3])
+	hmResult= compute_heatmap(x, y, z, metaData)
+	assert hmResult.countsXY.sum() == 1
+	assert hmResult.countsXZ.sum() == 2
+
+
+def test_all_odors_heatmaps_match_the_heatmap_of_each_odor(make_exp, metaData):
+	exp= make_exp(1)
+	_, yEdges, zEdges= get_grid_edges(metaData)
+	allHeatmaps= compute_all_heatmaps(exp.X_List, exp.Y_List, exp.Z_List, exp.stim_List, metaData)
+	for option, hmResult in allHeatmaps.items():
+		i= exp.stim_List == option
+		single= compute_heatmap(exp.X_List[i], exp.Y_List[i], exp.Z_List[i], metaData)
+		assert np.array_equal(hmResult.countsXY, single.countsXY)
+		assert np.array_equal(hmResult.countsXZ, single.countsXZ)
+		assert np.array_equal(hmResult.countsYZ, np.histogram2d(exp.Y_List[i], exp.Z_List[i], [yEdges, zEdges])[0])
+
+
+def test_normalized_heatmap_is_transposed_and_sums_one(metaData):
+	hmResult= compute_heatmap(np.array([0.0, 0.1, 0.1]), np.array([0.0, 0.2, 0.2]), np.array([0.3, 0.3, 0.4]), metaData)
+	assert hmResult.normXY.shape == NBINS[::-1]
+	assert np.isclose(hmResult.normXY.sum(), 1)
+	assert np.allclose(hmResult.normXY, hmResult.countsXY.T / 3)
+
+
+def test_group_heatmap_is_the_heatmap_of_all_the_points(make_exp, metaData):
+	exps= [make_exp(seed) for seed in range(3)]
+	group= sum_heatmaps([compute_heatmap(e.X_List, e.Y_List, e.Z_List, metaData) for e in exps])
+	allPoints= compute_heatmap(*(np.concatenate([getattr(e, col) for e in exps]) for col in ('X_List', 'Y_List', 'Z_List')), metaData)
+	assert np.array_equal(group.countsXY, allPoints.countsXY)
+	assert np.array_equal(group.countsXZ, allPoints.countsXZ)
+
+
+def test_shift_counts_moves_whole_bins():
+	counts= np.arange(12.0).reshape(4, 3)
+	shifted= shift_counts(counts, 1, -1)
+	assert np.array_equal(shifted[1:, :2], counts[:3, 1:])
+	assert shifted[0].sum() == shifted[:, 2].sum() == 0
+	assert not shift_counts(counts, 4, 0).any()
+
+
+def test_whole_bin_subbin_shift_is_shift_counts(make_exp, metaData):
+	exp= make_exp(2)
+	counts= compute_heatmap(exp.X_List, exp.Y_List, exp.Z_List, metaData).countsXY
+	for shiftX, shiftY in ((0, 0), (3, -2), (-7, 5)):
+		assert np.array_equal(shift_counts_subbin(counts, shiftX, shiftY), shift_counts(counts, shiftX, shiftY))
+
+
+def test_subbin_shift_inside_the_grid_keeps_the_counts():
+	counts= np.zeros(NBINS)
+	counts[100:110, 50:60]= np.arange(100).reshape(10, 10)
+	shifted= shift_counts_subbin(counts, 2.3, -1.6)
+	assert np.isclose(shifted.sum(), counts.sum())
+
+
+def test_half_bin_shift_splits_the_counts(metaData):
+	x, y, z= np.array([0.0]), np.array([0.0]), np.array([0.3])
+	hmResult= compute_heatmap(x, y, z, metaData)
+	iX, iY= np.argwhere(hmResult.countsXY)[0]
+	binX= (hmResult.extentXY[1] - hmResult.extentXY[0]) / NBINS[0]
+	shifted= shift_heatmap(hmResult, binX/2, 0, subBin=True).countsXY
+	assert shifted[iX, iY] == shifted[iX+1, iY] == 0.5
+	assert shifted.sum() == 1
+
+
+def test_saved_heatmap_arrays_load_back(make_exp, metaData, tmp_path):
+	exp= make_exp()
+	hmResult= compute_heatmap(exp.X_List, exp.Y_List, exp.Z_List, metaData)
+	info= {'option': 2, 'stim': 'CO2', 'expDate': exp.expDate}
+	save_heatmap_arrays(hmResult, str(tmp_path/'hm.npz'), info)
+	loaded, loadedInfo= load_heatmap_arrays(str(tmp_path/'hm.npz'))
+	assert loadedInfo == info
+	assert np.array_equal(loaded.countsXY, hmResult.countsXY)
+	assert np.array_equal(loaded.countsXZ, hmResult.countsXZ)
+	assert np.allclose(loaded.extentXY, hmResult.extentXY)
+	assert np.allclose(loaded.normXY, hmResult.normXY)
+
+
+def test_series_windows_match_histogram2d(make_exp, metaData):
+	exp= make_exp(1)
+	rows= exp.get_stim_rows(2)
+	windowEdges= get_window_edges(exp.ts_2_CO2, exp.ts_3_PostCO2, 45)
+	series= compute_heatmap_series(exp.TS_List[rows], exp.X_List[rows], exp.Y_List[rows], exp.Z_List[rows], windowEdges, metaData)
+	assert len(series) == len(windowEdges) - 1
+	for i, (t0, t1) in enumerate(zip(windowEdges[:-1], windowEdges[1:])):
+		ts= exp.TS_List[rows]
+		inWindow= (ts >= t0) & ((ts < t1) if i < len(series)-1 else (ts <= t1))
+		countsXY, countsXZ= histogram_counts(exp.X_List[rows][inWindow], exp.Y_List[rows][inWindow], exp.Z_List[rows][inWindow], metaData)
+		assert np.array_equal(series.countsXY[i], countsXY)
+		assert np.array_equal(series.countsXZ[i], countsXZ)
+	stimHeatmap= compute_heatmap(exp.X_List[rows], exp.Y_List[rows], exp.Z_List[rows], metaData)
+	assert np.array_equal(series.countsXY.sum(axis=0), stimHeatmap.countsXY)
+	assert np.array_equal(series.get_cumulative().countsXY[-1], stimHeatmap.countsXY)
+
+
+def test_group_series_adds_windows_from_the_stim_start(make_exp, metaData):
+	seriesList= []
+	for seed, end in ((2, 1600.0), (3, 1500.0)):
+		exp= make_exp(seed)
+		rows= exp.get_stim_rows(2)
+		seriesList.append(compute_heatmap_series(exp.TS_List[rows], exp.X_List[rows], exp.Y_List[rows], exp.Z_List[rows],
+												get_window_edges(exp.ts_2_CO2, end, 60), metaData))
+	group= sum_heatmap_series(seriesList)
+	assert len(group) == 5
+	assert np.array_equal(group.countsXY[:4], seriesList[0].countsXY[:4] + seriesList[1].countsXY)
+	assert np.array_equal(group.countsXY[4], seriesList[0].countsXY[4])
+
+
+def test_saved_arrays_have_their_kind(make_exp, metaData, tmp_path):
+	exp= make_exp()
+	rows= exp.get_stim_rows(2)
+	hmResult= compute_heatmap(exp.X_List, exp.Y_List, exp.Z_List, metaData)
+	series= compute_heatmap_series(exp.TS_List[rows], exp.X_List[rows], exp.Y_List[rows], exp.Z_List[rows],
+								get_window_edges(exp.ts_2_CO2, exp.ts_3_PostCO2, 60), metaData)
+	save_heatmap_arrays(hmResult, str(tmp_path/'hm.npz'), {})
+	save_heatmap_series(series, str(tmp_path/'hm_series.npz'), {})
+	#Heatmap saved before the kind was added
+	np.savez_compressed(str(tmp_path/'old.npz'), countsXY=hmResult.countsXY)
+	assert get_saved_kind(str(tmp_path/'hm.npz')) == HM_KIND
+	assert get_saved_kind(str(tmp_path/'hm_series.npz')) == HM_SERIES_KIND
+	assert get_saved_kind(str(tmp_path/'old.npz')) == HM_KIND
@@ -0,0 +1,67 @@
+import threading
+import time
+import pytest
+from io_pipeline import FigureWriter, iter_prefetched
+
+
+def test_prefetched_results_are_in_order_and_bounded():
+	filesList= ['exp_%s.yaml'%i for i in range(20)]
+	read= []
+
+	def readTask(fname, metaData):
+		time.sleep(0.001*(len(read) % 3))
+		read.append(fname)
+		return fname
+
+	results= []
+	for value in iter_prefetched(filesList, {}, readTask, nPrefetch=3):
+		time.sleep(0.01)
+		#Read in advance: the files in the queue and the one waiting for a free slot
+		assert len(read) - (len(results) + 1) <= 3 + 1
+		results.append(value)
+	assert results == filesList
+
+
+def test_prefetch_raises_the_read_error():
+	read= []
+
+	def readTask(fname, metaData):
+		read.append(fname)
+		if fname == 'b':
+			raise ValueError(fname)
+		return fname
+
+	results= []
+	with pytest.raises(ValueError):
+		for value in iter_prefetched(['a', 'b', 'c', 'd'], {}, readTask, nPrefetch=2):
+			results.append(value)
+	assert results == ['a']
+	assert read == ['a', 'b']
+
+
+def test_figure_writer_blocks_when_max_pending():
+	gate= threading.Event()
+	lock= threading.Lock()
+	running= [0, 0]
+
+	def task():
+		with lock:
+			running[0]+= 1
+			running[1]= max(running)
+		gate.wait(5)
+		with lock:
+			running[0]-= 1
+		return True
+
+	writer= FigureWriter(nWriters=3, maxPending=2)
+	writer.submit(task)
+	writer.submit(task)
+	submitter= threading.Thread(target=writer.submit, args=(task,))
+	submitter.start()
+	submitter.join(0.2)
+	assert submitter.is_alive()
+	gate.set()
+	submitter.join(5)
+	assert not submitter.is_alive()
+	assert writer.close() == 3
+	assert running[1] <= 2
@@ -0,0 +1,58 @@
+import numpy as np
+from trajectories import TrajectoryIndex
+from kinematics import compute_kinematics, wrap_angle, KINEMATICS, UPWIND_DIR
+from conftest import make_trajectories
+
+
+def brute_force_kinematics(cols):
+	""" Kinematics with one loop per point of each trajectory
+	"""
+	values= {name: np.full(len(cols['id']), np.nan) for name in KINEMATICS}
+	for objId in np.unique(cols['id']):
+		rows= np.flatnonzero(cols['id'] == objId)
+		prevHeading= None
+		for prev, row in zip(rows[:-1], rows[1:]):
+			dt= cols['ts'][row] - cols['ts'][prev]
+			vx, vy, vz= [(cols[a][row] - cols[a][prev]) / dt for a in 'xyz']
+			heading= np.degrees(np.arctan2(vy, UPWIND_DIR*vx))
+			values['vz'][row]= vz
+			values['groundSpeed'][row]= np.sqrt(vx**2 + vy**2)
+			values['speed'][row]= np.sqrt(vx**2 + vy**2 + vz**2)
+			values['heading'][row]= heading
+			if prevHeading is not None:
+				values['turnRate'][row]= wrap_angle(heading - prevHeading) / dt
+			prevHeading= heading
+	return values
+
+
+def test_kinematics_match_loop():
+	cols= make_trajectories(np.random.default_rng(0), nTrajs=30)
+	kinematics= compute_kinematics(TrajectoryIndex(cols['id']), cols['id'], cols['fr'], cols['ts'], cols['x'], cols['y'], cols['z'])
+	expected= brute_force_kinematics(cols)
+	for name in KINEMATICS:
+		assert np.allclose(kinematics[name], expected[name], equal_nan=True), name
+
+
+def test_kinematics_first_points_have_no_value():
+	cols= make_trajectories(np.random.default_rng(1), nTrajs=20)
+	kinematics= compute_kinematics(TrajectoryIndex(cols['id']), cols['id'], cols['fr'], cols['ts'], cols['x'], cols['y'], cols['z'])
+	for objId in np.unique(cols['id']):
+		rows= np.flatnonzero(cols['id'] == objId)
+		assert np.isnan(kinematics['speed'][rows[0]])
+		assert np.isnan(kinematics['turnRate'][rows[:2]]).all()
+		assert np.isfinite(kinematics['speed'][rows[1:]]).all()
+
+
+def test_repeated_timestamps_use_frame_period():
+	ids= np.array([1, 1, 1, 1])
+	frames= np.array([10, 11, 12, 14])
+	ts= np.array([0.0, 0.01, 0.01, 0.03])
+	x= np.array([0.0, 0.01, 0.02, 0.04])
+	zeros= np.zeros(4)
+	kinematics= compute_kinematics(TrajectoryIndex(ids), ids, frames, ts, x, zeros, zeros)
+	assert np.allclose(kinematics['speed'][1:], 1.0)
+	assert np.allclose(kinematics['heading'][1:], 180.0)
+
+
+def test_wrap_angle():
+	assert np.allclose(wrap_angle(np.array([190.0, -190.0, 180.0, 0.0, 360.0])), [-170.0, 170.0, -180.0, 0.0, 0.0])
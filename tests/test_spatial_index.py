@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from spatial_index import build_spatial_index, load_index_file, query_cue_metrics, get_cue_position, get_point_durations, INDEX_FILE
+from conftest import make_trajectories
+
+
+def test_box_query_contains_every_point_of_the_box():
+	rng= np.random.default_rng(0)
+	pos= np.array([rng.uniform(-0.9, 0.9, 5000), rng.uniform(-0.3, 0.3, 5000), rng.uniform(0, 0.6, 5000)])
+	index= build_spatial_index(*pos, cellSize=0.03)
+	for _ in range(20):
+		center= np.array([rng.uniform(-1, 1), rng.uniform(-0.4, 0.4), rng.uniform(-0.1, 0.7)])
+		half= rng.uniform(0.001, 0.2)
+		rows= index.query_box_rows(center - half, center + half)
+		assert len(np.unique(rows)) == len(rows)
+		inBox= np.flatnonzero((np.abs(pos - center[:, None]) <= half).all(axis=0))
+		assert set(inBox) <= set(rows)
+
+
+def test_index_round_trip(tmp_path):
+	cols= make_trajectories(np.random.default_rng(1))
+	index= build_spatial_index(cols['x'], cols['y'], cols['z'], 0.02)
+	np.savez(tmp_path/INDEX_FILE, **index.get_arrays())
+	loaded= load_index_file(tmp_path/INDEX_FILE, 0.02)
+	for name, values in index.get_arrays().items():
+		assert np.array_equal(loaded.get_arrays()[name], values)
+	assert load_index_file(tmp_path/INDEX_FILE, 0.05) is None
+
+
+def brute_force_durations(exp):
+	durations= np.zeros(len(exp.TS_List))
+	for objId in np.unique(exp.ID_List):
+		rows= np.flatnonzero(exp.ID_List == objId)
+		durations[rows[:-1]]= np.diff(exp.TS_List[rows])
+	return durations
+
+
+def brute_force_metrics(exp, metaData, radii, shape):
+	""" Cue metrics testing the distance of every point to each cue
+	"""
+	durations= brute_force_durations(exp)
+	pos= np.array([exp.X_List, exp.Y_List, exp.Z_List], dtype=float)
+	results= []
+	for cue in ('odor', 'test', 'base'):
+		delta= pos - get_cue_position(exp, cue, metaData)[:, None]
+		dist= np.abs(delta).max(axis=0) if shape == 'box' else np.sqrt((delta**2).sum(axis=0))
+		for stim in (1, 2, 3):
+			for radius in radii:
+				inside= (dist <= radius) & (exp.stim_List == stim)
+				results.append((cue, stim, radius, int(inside.sum()), durations[inside].sum(), len(np.unique(exp.ID_List[inside]))))
+	return results
+
+
+@pytest.mark.parametrize('shape', ['sphere', 'box'])
+@pytest.mark.parametrize('mirrored', [False, True])
+def test_cue_metrics_match_brute_force(make_exp, metaData, shape, mirrored):
+	exp= make_exp(2, mirrored=mirrored)
+	radii= [0.05, 0.2, 0.4]
+	results= query_cue_metrics(exp, dict(metaData, SPATIAL_CELL_SIZE=0.03), radii, shape=shape)
+	expected= brute_force_metrics(exp, metaData, radii, shape)
+	assert len(results) == len(expected)
+	assert sum(r['nPoints'] for r in results) > 0
+	for r, (cue, stim, radius, nPoints, dwellTime, nTrajs) in zip(results, expected):
+		assert (r['cue'], r['radius'], r['nPoints'], r['nTrajs']) == (cue, radius, nPoints, nTrajs)
+		assert np.isclose(r['dwellTime'], dwellTime)
+
+
+def test_point_durations_match_loop(make_exp):
+	exp= make_exp(3)
+	assert np.allclose(get_point_durations(exp), brute_force_durations(exp))
@@ -0,0 +1,73 @@
+import numpy as np
+from trajectories import compute_trajectories, merge_trajectories, get_stim_totals, TrajectoryIndex
+from conftest import make_trajectories
+
+
+def brute_force_trajectories(idList, tsList, stimList):
+	""" {(stim, obj_id): (start, end, nPoints)} with one loop per trajectory
+	"""
+	table= {}
+	for stim in np.unique(stimList):
+		for objId in np.unique(idList[stimList == stim]):
+			ts= tsList[(idList == objId) & (stimList == stim)]
+			table[(stim, objId)]= (ts.min(), ts.max(), len(ts))
+	return table
+
+
+def as_dict(trajTable):
+	return {(s, i): (a, b, n) for s, i, a, b, n in zip(trajTable.stim, trajTable.objId, trajTable.start, trajTable.end, trajTable.nPoints)}
+
+
+def test_compute_trajectories_matches_loop(make_exp):
+	exp= make_exp()
+	trajTable= compute_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+	assert as_dict(trajTable) == brute_force_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+	assert np.allclose(trajTable.duration, trajTable.end - trajTable.start)
+
+
+def test_merge_chunks_matches_whole(make_exp):
+	exp= make_exp(1)
+	whole= compute_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+	bounds= [0, 100, 101, 950, len(exp.TS_List)]
+	tables= [compute_trajectories(exp.ID_List[a:b], exp.TS_List[a:b], exp.stim_List[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+	assert as_dict(merge_trajectories(tables)) == as_dict(whole)
+
+
+def test_stim_totals_match_loop(make_exp):
+	exp= make_exp(2)
+	trajTable= compute_trajectories(exp.ID_List, exp.TS_List, exp.stim_List)
+	counts, durations= get_stim_totals(trajTable, minFlightTime=0.2)
+	for stim in (1, 2, 3):
+		kept= [b - a for (s, _), (a, b, _) in brute_force_trajectories(exp.ID_List, exp.TS_List, exp.stim_List).items() if s == stim and b - a >= 0.2]
+		assert counts[stim-1] == len(kept)
+		assert np.isclose(durations[stim-1], sum(kept))
+
+
+def test_traj_index_rows_match_loop():
+	cols= make_trajectories(np.random.default_rng(3))
+	index= TrajectoryIndex(cols['id'])
+	assert list(index.ids) == sorted(np.unique(cols['id']))
+	for slot, objId in enumerate(index.ids):
+		rows= index.order[index.get_rows(slot)]
+		assert np.array_equal(rows, np.flatnonzero(cols['id'] == objId))
+		assert index.get_slot(objId) == slot
+	assert index.get_slot(-5) == -1
+
+
+def test_traj_index_compact_matches_rebuilt():
+	cols= make_trajectories(np.random.default_rng(4))
+	index= TrajectoryIndex(cols['id'])
+	keep= np.random.default_rng(5).random(len(cols['id'])) > 0.3
+	index.compact(keep, cols['id'][keep])
+	rebuilt= TrajectoryIndex(cols['id'][keep])
+	assert np.array_equal(index.ids, rebuilt.ids)
+	assert np.array_equal(index.order, rebuilt.order)
+	assert np.array_equal(index.offsets, rebuilt.offsets)
+
+
+def test_exp_trajectory_views(make_exp):
+	exp= make_exp(6)
+	for objId, traj in exp.iter_trajectories():
+		rows= exp.ID_List == objId
+		assert np.array_equal(traj['TS_List'], exp.TS_List[rows])
+		assert np.array_equal(traj['Y_List'], exp.Y_List[rows])
@@ -0,0 +1,143 @@
+"""
+File containing the functions to group the points of an experiment by trajectory (obj_id) and compute their stats
+(start, end, duration and number of points) with vectorized grouped reductions
+"""
+import numpy as np
+
+
+class TrajectoryTable:
+	""" Plain container with one entry per trajectory and odor stim (a trajectory crossing from one stim to
+	the next one is counted in both of them, as each stim is analysed on its own)
+	"""
+	def __init__(self, objId, stim, start, end, nPoints):
+		self.objId= objId			# obj_id of each trajectory
+		self.stim= stim				# Odor stim of each trajectory (1=='AIR', 2=='CO2' or 3=='PostCO2')
+		self.start= start			# First timestamp of each trajectory
+		self.end= end				# Last timestamp of each trajectory
+		self.duration= end - start	# Duration (s) of each trajectory
+		self.nPoints= nPoints		# Number of points of each trajectory
+
+	def __len__(self):
+		return len(self.objId)
+
+
+def compute_trajectories(idList, tsList, stimList):
+	""" Sort the points once by (stim, obj_id, timestamp) and reduce each group of points to one trajectory
+	"""
+	idList= np.asarray(idList)
+	tsList= np.asarray(tsList)
+	stimList= np.asarray(stimList)
+	if len(idList) == 0:
+		empty= np.empty(0)
+		return TrajectoryTable(np.empty(0, idList.dtype), np.empty(0, np.uint8), empty, empty, np.empty(0, np.intp))
+	order= np.lexsort((tsList, idList, stimList))
+	ids= idList[order]
+	stims= stimList[order]
+	ts= tsList[order]
+	#First row of each trajectory: the obj_id or the stim change
+	newTraj= np.empty(len(ids), bool)
+	newTraj[0]= True
+	newTraj[1:]= (ids[1:] != ids[:-1]) | (stims[1:] != stims[:-1])
+	starts= np.flatnonzero(newTraj)
+	ends= np.append(starts[1:], len(ids))
+	#The points are sorted by timestamp inside each trajectory
+	return TrajectoryTable(ids[starts], stims[starts], ts[starts], ts[ends-1], ends - starts)
+
+
+def merge_trajectories(tables):
+	""" Merge trajectory tables computed on different chunks of the same experiment: the entries with the same
+	(stim, obj_id) are one trajectory (first start, last end and the points of all of them)
+	"""
+	objId= np.concatenate([t.objId for t in tables])
+	stim= np.concatenate([t.stim for t in tables])
+	start= np.concatenate([t.start for t in tables])
+	end= np.concatenate([t.end for t in tables])
+	nPoints= np.concatenate([t.nPoints for t in tables])
+	if len(objId) == 0:
+		return tables[0]
+	order= np.lexsort((objId, stim))
+	objId, stim= objId[order], stim[order]
+	newTraj= np.ones(len(objId), bool)
+	newTraj[1:]= (objId[1:] != objId[:-1]) | (stim[1:] != stim[:-1])
+	starts= np.flatnonzero(newTraj)
+	return TrajectoryTable(objId[starts], stim[starts], np.minimum.reduceat(start[order], starts),
+						np.maximum.reduceat(end[order], starts), np.add.reduceat(nPoints[order], starts))
+
+
+class TrajectoryAccumulator:
+	""" Trajectory table of an experiment built adding its points by chunks. Only one entry per trajectory is kept
+	"""
+	def __init__(self):
+		self.table= None
+
+	def add(self, idList, tsList, stimList):
+		chunkTable= compute_trajectories(idList, tsList, stimList)
+		self.table= chunkTable if self.table is None else merge_trajectories([self.table, chunkTable])
+
+	def get_table(self):
+		if self.table is None:
+			return compute_trajectories([], [], [])
+		return self.table
+
+
+def get_stim_totals(trajTable, minFlightTime=0, nStim=3):
+	""" Number of trajectories and total flight time per odor stim (1..nStim) for the trajectories lasting at least minFlightTime
+	"""
+	keep= trajTable.duration >= minFlightTime
+	stims= trajTable.stim[keep].astype(np.intp)
+	trajsCounted= np.bincount(stims, minlength=nStim+1)[1:nStim+1]
+	trajsDuration= np.bincount(stims, weights=trajTable.duration[keep], minlength=nStim+1)[1:nStim+1]
+	return trajsCounted, trajsDuration
+
+
+class TrajectoryIndex:
+	""" CSR index of the rows of an experiment by obj_id: order has the rows sorted by obj_id (time order is kept
+	inside each trajectory) and the rows of the trajectory in slot i are order[offsets[i]:offsets[i+1]]
+	"""
+	def __init__(self, idList):
+		self.order= np.argsort(idList, kind='stable')
+		self.set_offsets(idList)
+
+	def set_offsets(self, idList):
+		""" Find the first row of each obj_id in the sorted rows
+		"""
+		ids= np.asarray(idList)[self.order]
+		newTraj= np.ones(len(ids), bool)
+		newTraj[1:]= ids[1:] != ids[:-1]
+		starts= np.flatnonzero(newTraj)
+		self.ids= ids[starts]						# obj_id of each slot (sorted)
+		self.offsets= np.append(starts, len(ids))	# Rows of each slot in the sorted rows
+		self.columns= {}							# Columns already permuted to obj_id order
+
+	def compact(self, keep, idList):
+		""" Keep the index in sync when the rows where keep is False are removed from the columns (idList is the compacted ID column)
+		"""
+		newRow= np.cumsum(keep) - 1
+		self.order= newRow[self.order[keep[self.order]]]
+		self.set_offsets(idList)
+
+	def drop_column(self, name):
+		""" Remove the permuted copy of a column (it changed, as Y_List when the exp is mirrored)
+		"""
+		self.columns.pop(name, None)
+
+	def get_column(self, name, column):
+		""" Column in obj_id order. It is permuted once and kept, so each trajectory is a view of it
+		"""
+		if name not in self.columns:
+			self.columns[name]= np.asarray(column)[self.order]
+		return self.columns[name]
+
+	def get_slot(self, objId):
+		""" Slot of the trajectory objId (-1 if it is not in the experiment)
+		"""
+		slot= int(np.searchsorted(self.ids, objId))
+		if slot < len(self.ids) and self.ids[slot] == objId:
+			return slot
+		return -1
+
+	def get_rows(self, slot):
+		return slice(self.offsets[slot], self.offsets[slot+1])
+
+	def __len__(self):
+		return len(self.ids)